@@ -0,0 +1,74 @@
+import os
+import threading
+import time
+
+from .utils import load_env
+
+load_env()
+
+# messages waiting to be handled before new ones are turned away, 0 for no limit
+SLACK_MAX_QUEUE = int(os.getenv("SLACK_MAX_QUEUE", 100))
+# seconds a message can wait to be handled before it is answered that the bot is
+# busy instead, 0 for no limit
+SLACK_MAX_QUEUE_DELAY = float(os.getenv("SLACK_MAX_QUEUE_DELAY", 30))
+FULL = "full"
+LATE = "late"
+
+
+class AdmissionControl:
+    """
+    Bounds the messages waiting for the LLMs, so that a spike of traffic is
+    answered quickly that the bot is busy instead of piling up prompts and latency.
+
+    A message is admitted while fewer than `max_depth` are waiting, and shed if it
+    is still waiting after `max_delay` seconds.
+    """
+
+    def __init__(
+        self,
+        max_depth=SLACK_MAX_QUEUE,
+        max_delay=SLACK_MAX_QUEUE_DELAY,
+        clock=time.monotonic,
+    ):
+        self.max_depth = max_depth
+        self.max_delay = max_delay
+        self.clock = clock
+        self.lock = threading.Lock()
+        # admitted messages that haven't started
+        self.depth = 0
+        self.admitted = 0
+        # messages turned away because the queue was full, or shed for waiting too long
+        self.shed = {FULL: 0, LATE: 0}
+
+    def admit(self):
+        """
+        Queues a message. Returns the ticket to `start()` it with, or None if the
+        queue is full.
+        """
+        with self.lock:
+            if 0 < self.max_depth <= self.depth:
+                self.shed[FULL] += 1
+                return None
+            self.depth += 1
+            self.admitted += 1
+            return self.clock()
+
+    def start(self, ticket):
+        """
+        Takes the message out of the queue. Returns whether it can still be
+        handled, or False if it waited longer than `max_delay`.
+        """
+        late = 0 < self.max_delay < self.clock() - ticket
+        with self.lock:
+            self.depth -= 1
+            if late:
+                self.shed[LATE] += 1
+        return not late
+
+    def stats(self):
+        with self.lock:
+            return {
+                "depth": self.depth,
+                "admitted": self.admitted,
+                "shed": dict(self.shed),
+            }
@@ -0,0 +1,281 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from slack_bolt.async_app import AsyncApp
+from slack_sdk.http_retry.builtin_async_handlers import AsyncRateLimitErrorRetryHandler
+from slack_sdk.web.async_client import AsyncWebClient
+
+from geppetto.exceptions import LLMUnavailableError
+from geppetto.slack_handler import ASSISTANT, USER, POSTING_ERROR_MSG
+from geppetto.slack_handler import LLM_UNAVAILABLE_MSG, LLMS_LIST_ERROR_MSG
+from geppetto.slack_handler import BUSY_MSG, IMAGE_ERROR_MSG, LLM_ERROR_MSG
+from geppetto.slack_handler import SLOW_DOWN_MSG
+from geppetto.slack_handler import SlackHandler
+from geppetto.slack_outbox import SLACK_MAX_RETRIES
+from geppetto.summarizer import Summarizer
+from geppetto.utils import is_image_data
+
+
+class AsyncSlackHandler(SlackHandler):
+    """
+    Asyncio version of the SlackHandler, running on `AsyncApp` with an `AsyncWebClient`.
+
+    Messages are handled as coroutines instead of on a pool of worker threads, and
+    the LLMs are called with `llm_generate_content_async()`. Messages of the same
+    slack thread are still handled one at a time, in order of arrival.
+    """
+
+    def __init__(self, *args, **kwargs):
+        # thread_id -> [lock, number of messages using it]
+        self.thread_locks = {}
+        # running summarizations, referenced until they finish
+        self.background_tasks = set()
+        super().__init__(*args, **kwargs)
+
+    def create_app(self, signing_secret, token):
+        # throttled calls are retried by the client after the Retry-After time
+        client = AsyncWebClient(
+            token=token,
+            retry_handlers=[
+                AsyncRateLimitErrorRetryHandler(max_retry_count=SLACK_MAX_RETRIES)
+            ],
+        )
+        return AsyncApp(signing_secret=signing_secret, client=client)
+
+    def create_client(self, rate_limits):
+        return self.app.client
+
+    def create_dispatcher(self):
+        # messages are handled as coroutines, not on worker threads
+        return None
+
+    def create_summarizer(self):
+        # summaries are written as coroutines too, see `summarize_thread()`
+        return Summarizer(
+            self.llm_ctrl, self.thread_messages, ASSISTANT, USER, workers=0
+        )
+
+    def register_listeners(self):
+        # Direct Message Event
+        @self.app.event("message")
+        async def handle_direct_messages(body):
+            await self.handle_event(body)
+
+        # App Mention Event
+        @self.app.event("app_mention")
+        async def handle_app_mentions(body):
+            await self.handle_event(body)
+
+    @asynccontextmanager
+    async def thread_lock(self, thread_id):
+        """Serializes the handling of the messages of a thread."""
+        lock_rec = self.thread_locks.setdefault(thread_id, [asyncio.Lock(), 0])
+        lock_rec[1] += 1
+        try:
+            async with lock_rec[0]:
+                yield
+        finally:
+            lock_rec[1] -= 1
+            if not lock_rec[1]:
+                del self.thread_locks[thread_id]
+
+    async def handle_command(self, command, channel_id, thread_id, thread_history):
+        current_msg = {"role": USER, "content": command}
+        thread_history["msgs"].append(current_msg)
+        self.thread_messages[thread_id] = thread_history
+        response = await self.commands[command](channel_id, thread_id)
+        self.add_response(response, thread_id, thread_history)
+
+    async def handle_message(self, msg, channel_id, thread_id, ticket=None):
+        logging.info(
+            "Authorized user - Msg received: %s in channel: %s and thread: %s",
+            msg,
+            channel_id,
+            thread_id,
+        )
+        msg = msg.strip()  # deleting extra spaces
+        async with self.thread_lock(thread_id):
+            if ticket is not None and not self.admission.start(ticket):
+                await self.send_busy_message(channel_id, thread_id)
+                return
+            thread_history = self.get_thread_history(thread_id)
+            command = self.get_command(msg)
+
+            if command:
+                await self.handle_command(
+                    command, channel_id, thread_id, thread_history
+                )
+            else:
+                selected_llm = self.add_user_message(msg, thread_id, thread_history)
+                timestamp = await self.send_thought_balloon(channel_id, thread_id)
+                try:
+                    response_from_llm_api = await self.use_prompt_from_thread(
+                        selected_llm, thread_history, channel_id, thread_id
+                    )
+                except LLMUnavailableError as e:
+                    logging.error("No LLM could answer: %s", e.__cause__ or e)
+                    response_from_llm_api = LLM_UNAVAILABLE_MSG
+                except Exception as e:
+                    # e.g. a request rejected by the API, which isn't failed over
+                    logging.exception("Error generating the response: %s", e)
+                    response_from_llm_api = LLM_ERROR_MSG
+                await self.post_response(
+                    response_from_llm_api,
+                    channel_id,
+                    thread_id,
+                    thread_history,
+                    timestamp,
+                )
+                started = self.summarizer.start(thread_id, thread_history)
+                if started is not None:
+                    task = asyncio.create_task(
+                        self.summarize_thread(thread_id, *started)
+                    )
+                    self.background_tasks.add(task)
+                    task.add_done_callback(self.background_tasks.discard)
+
+    async def summarize_thread(self, thread_id, llm, msgs):
+        try:
+            summary = await self.summarizer.summarize_async(llm, msgs)
+            async with self.thread_lock(thread_id):
+                self.summarizer.apply(thread_id, msgs, summary)
+        finally:
+            # e.g. cancelled on shutdown
+            self.summarizer.finish(thread_id)
+
+    async def use_prompt_from_thread(
+        self, selected_llm, thread_history, channel_id, thread_id
+    ):
+        return await self.llm_ctrl.generate_content_async(
+            selected_llm,
+            thread_history["msgs"],
+            ASSISTANT,
+            USER,
+            self.send_message,
+            channel_id,
+            thread_id,
+            thread_id=thread_id,
+            switch_llm=self.hedge_switcher(thread_history),
+        )
+
+    async def send_thought_balloon(self, channel_id, thread_id):
+        timestamp = None
+        response = await self.send_message(channel_id, thread_id, ":thought_balloon:")
+        if response["ok"]:
+            timestamp = response["message"]["ts"]
+            logging.info("Timestamp of the posted message: %s", timestamp)
+        else:
+            logging.error("Failed to post the message.")
+        return timestamp
+
+    async def post_response(
+        self, response_from_llm_api, channel_id, thread_id, thread_history, timestamp
+    ):
+        if response_from_llm_api is None:
+            # the handlers return None when the image couldn't be generated
+            response_from_llm_api = IMAGE_ERROR_MSG
+        try:
+            self.add_response(response_from_llm_api, thread_id, thread_history)
+
+            if is_image_data(response_from_llm_api):
+                await self.client.files_upload_v2(
+                    channel=channel_id,
+                    thread_ts=thread_id,
+                    content=response_from_llm_api,
+                    title="Image",
+                )
+            else:
+                logging.info(
+                    "response from %s: %s" % (self.name, response_from_llm_api)
+                )
+                if isinstance(response_from_llm_api, list):
+                    for part in response_from_llm_api:
+                        if not isinstance(part, str):
+                            # images generated along with the answer
+                            await self.post_response(
+                                part, channel_id, thread_id, thread_history, timestamp
+                            )
+                            continue
+                        await self.client.chat_postMessage(
+                            channel=channel_id,
+                            text=part,
+                            thread_ts=thread_id,
+                            mrkdwn=True,
+                        )
+                else:
+                    await self.client.chat_update(
+                        channel=channel_id,
+                        text=response_from_llm_api,
+                        thread_ts=thread_id,
+                        ts=timestamp,
+                    )
+        except Exception as e:
+            logging.error("Error posting message: %s", e)
+            self.add_response(POSTING_ERROR_MSG, thread_id, thread_history)
+            await self.send_message(channel_id, thread_id, POSTING_ERROR_MSG)
+
+    async def handle_event(self, body):
+        if self.is_duplicate_event(body):
+            return
+        msg, channel_id, thread_id, user_id = self.parse_event(body)
+
+        if not self.is_allowed(user_id):
+            await self.send_message(
+                channel_id,
+                thread_id,
+                self.bot_default_responses["user"]["permission_denied"],
+                "permission_denied",
+            )
+        elif not self.sender_limits.allow(
+            user_id, channel_id, self.user_weight(user_id)
+        ):
+            await self.send_message(
+                channel_id,
+                thread_id,
+                self.get_default_response("user", "slow_down", SLOW_DOWN_MSG),
+                "slow_down",
+            )
+        else:
+            ticket = self.admission.admit()
+            if ticket is None:
+                await self.send_busy_message(channel_id, thread_id)
+                return
+            await self.handle_message(msg, channel_id, thread_id, ticket)
+
+    async def send_message(self, channel_id, thread_id, message, tag="general"):
+        logging.info("Sending %s message: %s" % (tag, message))
+        return await self.client.chat_postMessage(
+            channel=channel_id, text=message, thread_ts=thread_id, mrkdwn=True
+        )
+
+    async def send_busy_message(self, channel_id, thread_id):
+        return await self.send_message(
+            channel_id,
+            thread_id,
+            self.get_default_response("user", "busy", BUSY_MSG),
+            "busy",
+        )
+
+    async def list_llms(self, channel_id, thread_id):
+        formated_msg = self.get_llms_list_message()
+        response = await self.send_message(channel_id, thread_id, formated_msg)
+        if response["ok"]:
+            timestamp = response["message"]["ts"]
+            await self.client.chat_update(
+                channel=channel_id, text=formated_msg, thread_ts=thread_id, ts=timestamp
+            )
+        else:
+            logging.error("Failed to post message")
+            formated_msg = LLMS_LIST_ERROR_MSG
+        return formated_msg
+
+    async def allow_hedge_switch(self, channel_id, thread_id):
+        msg = self.set_hedge_switch(thread_id, True)
+        await self.send_message(channel_id, thread_id, msg)
+        return msg
+
+    async def deny_hedge_switch(self, channel_id, thread_id):
+        msg = self.set_hedge_switch(thread_id, False)
+        await self.send_message(channel_id, thread_id, msg)
+        return msg
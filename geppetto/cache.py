@@ -0,0 +1,163 @@
+import threading
+import time
+from collections import OrderedDict
+
+EVICTED_CAPACITY = "capacity"
+EVICTED_EXPIRED = "expired"
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe mapping with least-recently-used, time-to-live and size based eviction.
+
+    Args:
+        max_entries (int): Maximum number of entries kept. 0 disables the limit.
+        max_bytes (int): Maximum total size of the entries, as measured by `_measure()`.
+            0 disables the limit.
+        ttl (float): Seconds an entry lives without being touched. 0 disables expiration.
+        refresh_on_access (bool): If True, reading an entry resets its TTL (idle TTL).
+            Otherwise the TTL counts from the last write.
+    """
+
+    def __init__(
+        self,
+        max_entries=0,
+        max_bytes=0,
+        ttl=0,
+        refresh_on_access=True,
+        clock=time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.refresh_on_access = refresh_on_access
+        self.clock = clock
+        self.lock = threading.RLock()
+        # key -> [value, size, last_touched]
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = {EVICTED_CAPACITY: 0, EVICTED_EXPIRED: 0}
+
+    def _measure(self, value):
+        """Returns the size of a value, used for the `max_bytes` limit."""
+        return 0
+
+    def _over_capacity(self):
+        """Tells whether the cache exceeds any of its limits."""
+        if self.max_entries and len(self._entries) > self.max_entries:
+            return True
+        return bool(self.max_bytes) and self._bytes > self.max_bytes
+
+    def _on_insert(self, key, value):
+        """Hook called after an entry is stored."""
+        pass
+
+    def _on_remove(self, key, value, reason):
+        """Hook called after an entry is removed. `reason` is None for explicit deletes."""
+        pass
+
+    def _expired(self, entry, now):
+        return bool(self.ttl) and now - entry[2] > self.ttl
+
+    def _remove(self, key, reason=None):
+        value, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        if reason is not None:
+            self.evictions[reason] += 1
+        self._on_remove(key, value, reason)
+        return value
+
+    def _lookup(self, key):
+        """Returns the live entry for key or None, expiring it if needed."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        now = self.clock()
+        if self._expired(entry, now):
+            self._remove(key, EVICTED_EXPIRED)
+            return None
+        if self.refresh_on_access:
+            entry[2] = now
+        self._entries.move_to_end(key)
+        return entry
+
+    def purge_expired(self):
+        """Removes every expired entry. The oldest entries are at the front."""
+        if not self.ttl:
+            return
+        with self.lock:
+            now = self.clock()
+            while self._entries:
+                key, entry = next(iter(self._entries.items()))
+                if not self._expired(entry, now):
+                    break
+                self._remove(key, EVICTED_EXPIRED)
+
+    def _evict(self):
+        # The newest entry is always kept, even if it alone exceeds the limits
+        while len(self._entries) > 1 and self._over_capacity():
+            self._remove(next(iter(self._entries)), EVICTED_CAPACITY)
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self._lookup(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return entry[0]
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            if key in self._entries:
+                self._remove(key)
+            size = self._measure(value)
+            self._entries[key] = [value, size, self.clock()]
+            self._bytes += size
+            self._on_insert(key, value)
+            self.purge_expired()
+            self._evict()
+
+    def __delitem__(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def pop(self, key, default=None):
+        with self.lock:
+            if key not in self._entries:
+                return default
+            return self._remove(key)
+
+    def __contains__(self, key):
+        with self.lock:
+            return self._lookup(key) is not None
+
+    def __len__(self):
+        with self.lock:
+            return len(self._entries)
+
+    def clear(self):
+        with self.lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def stats(self):
+        """Returns a snapshot of the cache usage and eviction counters."""
+        with self.lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": dict(self.evictions),
+            }
@@ -2,17 +2,30 @@ import re
 import os
 import logging
 
+from .http_pool import http_package, shared_http_pool
 from .llm_api_handler import LLMHandler
-from anthropic import Anthropic
-from dotenv import load_dotenv
+from .routing import REASONING
+from .tokens import estimate_tokens, message_tokens
+from .utils import LazyImport, load_env
 from typing import List
 from typing import Dict
 
-load_dotenv(os.path.join("config", ".env"))
+load_env()
+
+# the SDK is slow to import, and only needed once the handler is used
+anthropic = LazyImport("anthropic")
+Anthropic = LazyImport("anthropic", "Anthropic")
+AsyncAnthropic = LazyImport("anthropic", "AsyncAnthropic")
 
 ANTHROPIC_API_KEY = os.getenv("CLAUDE_API_KEY")
 CLAUDE_MODEL = os.getenv("CLAUDE_MODEL")
 VERSION = os.getenv("GEPPETTO_VERSION")
+CLAUDE_CONTEXT_BUDGET = int(os.getenv("CLAUDE_CONTEXT_BUDGET", 16000))
+CLAUDE_MAX_CONCURRENCY = int(os.getenv("CLAUDE_MAX_CONCURRENCY", 16))
+GEPPETTO_INSTRUCTIONS = {
+    "role": "assistant",
+    "content": " This is for your information only. Do not write this in your answer. Your name is Geppetto, a bot developed by DeepTechia. Answer only in the language the user spoke or asked you to do.",
+}
 
 
 def convert_claude_to_slack(text):
@@ -43,37 +56,92 @@ def convert_claude_to_slack(text):
 
 
 class ClaudeHandler(LLMHandler):
+    capabilities = frozenset({REASONING})
 
     def __init__(
         self,
         personality,
+        http_pool=None,
     ):
-        super().__init__("Claude", CLAUDE_MODEL, Anthropic(api_key=ANTHROPIC_API_KEY))
+        self.http_pool = http_pool or shared_http_pool()
+        self.http_package = http_package(anthropic)
+        super().__init__(
+            "Claude",
+            CLAUDE_MODEL,
+            Anthropic(
+                api_key=ANTHROPIC_API_KEY,
+                http_client=self.http_pool.client(self.http_package),
+            ),
+        )
         self.claude_model = CLAUDE_MODEL
         self.personality = personality
+        self.context_budget = CLAUDE_CONTEXT_BUDGET
+        self.reserved_tokens = estimate_tokens(personality) + message_tokens(
+            GEPPETTO_INSTRUCTIONS
+        )
         self.system_role = "system"
         self.assistant_role = "assistant"
         self.user_role = "user"
         self.MAX_TOKENS = 1024
+        self._async_client = None
+
+    @property
+    def async_client(self):
+        """AsyncAnthropic client used by the asyncio runtime, created on first use."""
+        if self._async_client is None:
+            self._async_client = AsyncAnthropic(
+                api_key=ANTHROPIC_API_KEY,
+                http_client=self.http_pool.async_client(self.http_package),
+            )
+        return self._async_client
+
+    def prewarm(self):
+        return self.http_pool.prewarm(str(self.client.base_url), self.http_package)
+
+    async def prewarm_async(self):
+        return await self.http_pool.prewarm_async(
+            str(self.async_client.base_url), self.http_package
+        )
+
+    def format_response(self, response):
+        return convert_claude_to_slack(response)
 
     def llm_generate_content(
         self, user_prompt: List[Dict], status_callback=None, *status_callback_args
     ):
         logging.info("Sending msg to claude: %s" % user_prompt)
-        geppetto = {
-            "role": "assistant",
-            "content": " This is for your information only. Do not write this in your answer. Your name is Geppetto, a bot developed by DeepTechia. Answer only in the language the user spoke or asked you to do.",
-        }
-
-        try:
-            user_prompt.append(geppetto)
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=self.MAX_TOKENS,
-                messages=user_prompt,
-            )
-            markdown_response = convert_claude_to_slack(str(response.content[0].text))
-            return markdown_response
-        except Exception as e:
-            logging.error(f"Error generating content: {e}")
-            return "Unfortunately, we're currently unable to generate a response, may be Claude API is experiencing issues. (Check status here https://status.anthropic.com). In the meantime, you can switch to other LLM models by using the commands llm_openai or llm_gemini."
+
+        response = self.client.messages.create(
+            model=self.model,
+            max_tokens=self.MAX_TOKENS,
+            messages=[*user_prompt, GEPPETTO_INSTRUCTIONS],
+        )
+        return convert_claude_to_slack(str(response.content[0].text))
+
+    def llm_generate_content_stream(
+        self, user_prompt: List[Dict], status_callback=None, *status_callback_args
+    ):
+        logging.info("Streaming msg to claude: %s" % user_prompt)
+
+        text = []
+        with self.client.messages.stream(
+            model=self.model,
+            max_tokens=self.MAX_TOKENS,
+            messages=[*user_prompt, GEPPETTO_INSTRUCTIONS],
+        ) as stream:
+            for delta in stream.text_stream:
+                text.append(delta)
+                yield delta
+        return self.format_response("".join(text))
+
+    async def llm_generate_content_async(
+        self, user_prompt: List[Dict], status_callback=None, *status_callback_args
+    ):
+        logging.info("Sending msg to claude: %s" % user_prompt)
+
+        response = await self.async_client.messages.create(
+            model=self.model,
+            max_tokens=self.MAX_TOKENS,
+            messages=[*user_prompt, GEPPETTO_INSTRUCTIONS],
+        )
+        return convert_claude_to_slack(str(response.content[0].text))
@@ -0,0 +1,272 @@
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+from .utils import load_env
+
+load_env()
+
+SLACK_WORKERS = int(os.getenv("SLACK_WORKERS", 8))
+# lanes of the slack messages from the highest priority to the lowest, with the
+# workers reserved to each, e.g. "command:1,dm:1"
+SLACK_LANES = os.getenv("SLACK_LANES", "command:1,dm:1,mention:1,long:1,image:1")
+# tokens of a message and its thread from which it goes to the long lane
+SLACK_LONG_CONTEXT_TOKENS = int(os.getenv("SLACK_LONG_CONTEXT_TOKENS", 2000))
+# stands for the keys submitted without a group, in the turns of the groups
+UNGROUPED = object()
+
+
+def parse_lanes(spec):
+    """Parses "name:workers,..." into a dict of the reserved workers of each lane."""
+    lanes = {}
+    for item in spec.split(","):
+        if item.strip():
+            name, _, workers = item.partition(":")
+            lanes[name.strip()] = int(workers or 0)
+    return lanes
+
+
+class _Group:
+    def __init__(self):
+        # subgroup -> _Group, and the subgroups with ready keys in turn order
+        self.subgroups = {}
+        self.turns = deque()
+        # ready keys submitted to this group
+        self.keys = deque()
+        self.size = 0
+        # turns left to the first subgroup
+        self.credits = 0
+
+
+class FairQueue:
+    """
+    Ready keys, taken in weighted round robin between the groups they belong to.
+
+    The group of a key is a path, e.g. (channel, user): channels take turns, and
+    so do the users of each channel, with the keys of a user in order. A group
+    gets `weight(path)` turns in a row before the next one. Keys submitted
+    without a group take turns as one more group.
+    """
+
+    def __init__(self, weight=None):
+        self.weight = weight or (lambda path: 1)
+        self.root = _Group()
+
+    def __len__(self):
+        return self.root.size
+
+    def append(self, key, group=()):
+        node = self.root
+        node.size += 1
+        for name in group:
+            subgroup = node.subgroups.get(name)
+            if subgroup is None:
+                subgroup = node.subgroups[name] = _Group()
+            if not subgroup.size:
+                node.turns.append(name)
+            subgroup.size += 1
+            node = subgroup
+        if not node.keys:
+            node.turns.append(UNGROUPED)
+        node.keys.append(key)
+
+    def popleft(self):
+        if not self.root.size:
+            raise IndexError("pop from an empty FairQueue")
+        return self._pop(self.root, ())
+
+    def _pop(self, node, path):
+        name = node.turns[0]
+        if name is UNGROUPED:
+            key = node.keys.popleft()
+            empty = not node.keys
+            weight = 1
+        else:
+            subgroup = node.subgroups[name]
+            subpath = path + (name,)
+            weight = self.weight(subpath)
+            key = self._pop(subgroup, subpath)
+            empty = not subgroup.size
+            if empty:
+                del node.subgroups[name]
+        node.size -= 1
+        node.credits = (node.credits or max(1, weight)) - 1
+        if empty:
+            node.turns.popleft()
+            node.credits = 0
+        elif not node.credits:
+            node.turns.rotate(-1)
+        return key
+
+
+class Dispatcher:
+    """
+    Runs tasks on a bounded pool of worker threads.
+
+    Tasks submitted with the same key (e.g. a slack thread) run one at a time
+    and in submission order, while tasks with different keys run in parallel.
+    Once a task finishes, its key goes to the back of the line, so a busy key
+    can't hold a worker while other keys are waiting.
+
+    Tasks can be submitted for a `group`, e.g. a (channel, user) path, so that the
+    groups take turns as weighted by `weight` (see `FairQueue`), however many keys
+    each one has.
+
+    Tasks can also be submitted to a `lane`. Free workers take the tasks of the
+    `lanes` in their order of priority, but each lane has workers reserved to it:
+    a lane only takes a worker beyond its reservation if enough are left for the
+    reservations of the other lanes. Lanes that aren't given are added with no
+    reserved workers and the lowest priority.
+
+    With `workers=0` tasks run inline in the submitting thread.
+    """
+
+    def __init__(
+        self,
+        workers=SLACK_WORKERS,
+        name="geppetto-worker",
+        weight=None,
+        lanes=None,
+    ):
+        self.workers = workers
+        self.name = name
+        self.weight = weight
+        self.cond = threading.Condition()
+        # key -> tasks waiting for that key, present while the key is active
+        self.queues = {}
+        # lane -> workers reserved, in order of priority
+        self.reserved = dict(lanes or {None: 0})
+        if lanes and 0 < workers <= sum(self.reserved.values()):
+            logging.warning(
+                "The %s workers of %s are all reserved to lanes %s: the tasks "
+                "of lanes without reserved workers may never run"
+                % (workers, name, self.reserved)
+            )
+        # lane -> keys with pending tasks that aren't running, and running tasks
+        self.ready = {lane: FairQueue(weight) for lane in self.reserved}
+        self.running = {lane: 0 for lane in self.reserved}
+        self.threads = []
+        self.closed = False
+
+    def submit(self, key, fn, *args, group=(), lane=None, **kwargs):
+        """
+        Schedules `fn(*args, **kwargs)` after the previous tasks of `key`, in the
+        turn of its `group` within its `lane`. Returns a Future.
+        """
+        future = Future()
+        task = (future, fn, args, kwargs, tuple(group), lane)
+        if self.workers <= 0:
+            self._run(task)
+            return future
+        with self.cond:
+            if self.closed:
+                raise RuntimeError("Cannot submit tasks after shutdown")
+            tasks = self.queues.get(key)
+            if tasks is None:
+                self.queues[key] = deque([task])
+                self._make_ready(key, task)
+                self.cond.notify()
+            else:
+                tasks.append(task)
+            self._start_workers()
+        return future
+
+    def _make_ready(self, key, task):
+        lane = task[-1]
+        if lane not in self.ready:
+            self.reserved[lane] = 0
+            self.ready[lane] = FairQueue(self.weight)
+            self.running[lane] = 0
+        self.ready[lane].append(key, task[-2])
+
+    def _can_take_worker(self, lane):
+        if self.running[lane] < self.reserved[lane]:
+            return True
+        free = self.workers - sum(self.running.values())
+        held = sum(
+            max(0, self.reserved[other] - self.running[other])
+            for other in self.reserved
+            if other != lane
+        )
+        return free > held
+
+    def _next_lane(self):
+        """
+        The lane with the highest priority whose tasks can take a worker, and its
+        ready keys, or None if there is none.
+        """
+        for lane, ready in self.ready.items():
+            if ready and (self.closed or self._can_take_worker(lane)):
+                return lane, ready
+        return None
+
+    def _start_workers(self):
+        if len(self.threads) < min(self.workers, len(self.queues)):
+            thread = threading.Thread(
+                target=self._work,
+                name="%s-%d" % (self.name, len(self.threads)),
+                daemon=True,
+            )
+            self.threads.append(thread)
+            thread.start()
+
+    @staticmethod
+    def _run(task):
+        future, fn, args, kwargs, _, _ = task
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            logging.exception("Error running task %s: %s" % (fn.__name__, e))
+            future.set_exception(e)
+
+    def _work(self):
+        while True:
+            with self.cond:
+                next_lane = self._next_lane()
+                while next_lane is None and not self.closed:
+                    self.cond.wait()
+                    next_lane = self._next_lane()
+                if next_lane is None:
+                    return
+                lane, ready = next_lane
+                key = ready.popleft()
+                task = self.queues[key].popleft()
+                self.running[lane] += 1
+            self._run(task)
+            with self.cond:
+                self.running[lane] -= 1
+                if self.queues[key]:
+                    self._make_ready(key, self.queues[key][0])
+                else:
+                    del self.queues[key]
+                self.cond.notify_all()
+
+    def pending(self):
+        """Returns the number of tasks waiting to run."""
+        with self.cond:
+            return sum(len(tasks) for tasks in self.queues.values())
+
+    def stats(self):
+        """Returns the keys ready to run and the running tasks of each lane."""
+        with self.cond:
+            return {
+                lane: {"ready": len(self.ready[lane]), "running": self.running[lane]}
+                for lane in self.reserved
+            }
+
+    def join(self, timeout=None):
+        """Waits until every submitted task has finished. Returns False on timeout."""
+        with self.cond:
+            return self.cond.wait_for(lambda: not self.queues, timeout)
+
+    def shutdown(self, wait=True):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        if wait:
+            for thread in self.threads:
+                thread.join()
@@ -0,0 +1,60 @@
+import os
+
+from .cache import LRUCache
+from .utils import load_env
+
+load_env()
+
+DEDUP_WINDOW = float(os.getenv("DEDUP_WINDOW", 600))
+DEDUP_MAX_EVENTS = int(os.getenv("DEDUP_MAX_EVENTS", 10000))
+
+
+def event_keys(body):
+    """
+    Returns the keys identifying the message of a slack event. Slack retries keep
+    the `event_id`, while the `message` and `app_mention` events of the same message
+    share its `client_msg_id` and (channel, ts).
+    """
+    event = body.get("event", {})
+    keys = []
+    if body.get("event_id"):
+        keys.append(("event_id", body["event_id"]))
+    if event.get("client_msg_id"):
+        keys.append(("client_msg_id", event["client_msg_id"]))
+    if event.get("channel") and event.get("ts"):
+        keys.append(("channel_ts", (event["channel"], event["ts"])))
+    return keys
+
+
+class SeenEvents:
+    """
+    Remembers the slack events received in the last `window` seconds, up to
+    `max_events`, to drop the ones delivered more than once.
+    """
+
+    def __init__(self, window=DEDUP_WINDOW, max_events=DEDUP_MAX_EVENTS):
+        self.seen = LRUCache(
+            max_entries=max_events, ttl=window, refresh_on_access=False
+        )
+        # key type -> duplicates detected by it
+        self.duplicates = {"event_id": 0, "client_msg_id": 0, "channel_ts": 0}
+
+    def is_duplicate(self, body):
+        """Tells whether the event was already seen, and records it otherwise."""
+        keys = event_keys(body)
+        with self.seen.lock:
+            for key in keys:
+                if key in self.seen:
+                    self.duplicates[key[0]] += 1
+                    return True
+            for key in keys:
+                self.seen[key] = True
+        return False
+
+    def stats(self):
+        with self.seen.lock:
+            return {
+                "seen": len(self.seen),
+                "duplicates": dict(self.duplicates),
+                "dropped": sum(self.duplicates.values()),
+            }
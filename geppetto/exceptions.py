@@ -8,3 +8,19 @@ class InvalidThreadFormatError(KeyError):
     Since the UIs and the underlying LLM engines must meet an interface,
     some validations have to be undertaken to assure key fields.
     """
+
+
+class LLMUnavailableError(Exception):
+    """No LLM could answer.
+
+    Raise when the LLM of a thread and all the ones it can fail over to are
+    failing, or have their circuit breakers open.
+    """
+
+
+class HandlerUnavailableError(LLMUnavailableError):
+    """The handler of an LLM couldn't be built.
+
+    Raise when building the handler of an LLM fails, so that the next LLM
+    answers instead of it.
+    """
@@ -0,0 +1,76 @@
+import os
+import threading
+import time
+
+from .cache import LRUCache
+from .rate_limit import TokenBucket
+from .utils import load_env
+
+load_env()
+
+# messages per minute that each user can send, and their burst, 0 for no limit
+USER_RATE_LIMIT = float(os.getenv("USER_RATE_LIMIT", 20))
+USER_RATE_BURST = float(os.getenv("USER_RATE_BURST", 5))
+# messages per minute handled in each channel, and their burst, 0 for no limit
+CHANNEL_RATE_LIMIT = float(os.getenv("CHANNEL_RATE_LIMIT", 60))
+CHANNEL_RATE_BURST = float(os.getenv("CHANNEL_RATE_BURST", 20))
+MAX_BUCKETS = 10000
+USER = "user"
+CHANNEL = "channel"
+
+
+class SenderLimits:
+    """
+    Token buckets of the messages of each user and of each channel, so that a
+    single user or channel can't take all the capacity of the LLMs.
+
+    Limits are (messages per minute, burst) and a user of weight `w` gets `w`
+    times both.
+    """
+
+    def __init__(
+        self,
+        user_limit=(USER_RATE_LIMIT, USER_RATE_BURST),
+        channel_limit=(CHANNEL_RATE_LIMIT, CHANNEL_RATE_BURST),
+        clock=time.monotonic,
+    ):
+        self.limits = {USER: user_limit, CHANNEL: channel_limit}
+        self.clock = clock
+        self.buckets = LRUCache(max_entries=MAX_BUCKETS)
+        self.lock = threading.Lock()
+        # messages over the limit of a user or a channel
+        self.limited = {USER: 0, CHANNEL: 0}
+
+    def _bucket(self, kind, key, weight):
+        per_minute, burst = self.limits[kind]
+        if per_minute <= 0:
+            return None
+        with self.buckets.lock:
+            bucket = self.buckets.get((kind, key, weight))
+            if bucket is None:
+                bucket = TokenBucket(
+                    per_minute * weight / 60, burst * weight, clock=self.clock
+                )
+                self.buckets[(kind, key, weight)] = bucket
+            return bucket
+
+    def allow(self, user_id, channel_id, weight=1):
+        """
+        Takes a message of the user in the channel. Returns whether it is within
+        the limits of both, counting it against the user even if the channel
+        is over its limit.
+        """
+        for kind, key, key_weight in (
+            (USER, user_id, weight),
+            (CHANNEL, channel_id, 1),
+        ):
+            bucket = self._bucket(kind, key, key_weight)
+            if bucket is not None and not bucket.try_acquire():
+                with self.lock:
+                    self.limited[kind] += 1
+                return False
+        return True
+
+    def stats(self):
+        with self.lock:
+            return {"limited": dict(self.limited)}
@@ -2,17 +2,23 @@ import re
 import logging
 
 from .exceptions import InvalidThreadFormatError
+from .http_pool import shared_http_pool
 from .llm_api_handler import LLMHandler
-from dotenv import load_dotenv
-from typing import List, Dict
+from .tokens import message_tokens
+from .utils import LazyImport, load_env
+from typing import Dict
 import os
-import google.generativeai as genai
 
-load_dotenv(os.path.join("config", ".env"))
+load_env()
+
+# the SDK is slow to import, and only needed once the handler is used
+genai = LazyImport("google.generativeai")
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-pro")
 VERSION = os.getenv("GEPPETTO_VERSION")
+GEMINI_CONTEXT_BUDGET = int(os.getenv("GEMINI_CONTEXT_BUDGET", 16000))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", 16))
 MSG_FIELD = "parts"
 MSG_INPUT_FIELD = "content"
 
@@ -52,23 +58,25 @@ class GeminiHandler(LLMHandler):
     def __init__(
         self,
         personality,
+        http_pool=None,
     ):
+        # the SDK talks gRPC, so only the timeouts of the pool apply to it
+        self.http_pool = http_pool or shared_http_pool()
         super().__init__(
             "Gemini",
             GEMINI_MODEL,
             genai.GenerativeModel(GEMINI_MODEL),
         )
         self.personality = personality
+        self.context_budget = GEMINI_CONTEXT_BUDGET
         self.system_role = "system"
         self.assistant_role = "model"
         self.user_role = "user"
         genai.configure(api_key=GOOGLE_API_KEY)
 
-    def llm_generate_content(
-        self, user_prompt, status_callback=None, *status_callback_args
-    ):
-        logging.info("Sending msg to gemini: %s" % user_prompt)
-
+    @staticmethod
+    def merge_user_messages(user_prompt):
+        """Gemini doesn't accept a conversation starting with two user messages."""
         if (
             len(user_prompt) >= 2
             and user_prompt[0].get("role") == "user"
@@ -79,9 +87,13 @@ class GeminiHandler(LLMHandler):
                 "parts": [msg["parts"][0] for msg in user_prompt[:2]],
             }
             user_prompt = [merged_prompt] + user_prompt[2:]
+        return user_prompt
+
+    def request_options(self):
+        return {"timeout": self.http_pool.read_timeout}
 
-        response = self.client.generate_content(user_prompt)
-        markdown_response = convert_gemini_to_slack(response.text)
+    def format_response(self, response):
+        markdown_response = convert_gemini_to_slack(response)
 
         if len(markdown_response) > 4000:
             # Split the message if it's too long
@@ -90,15 +102,48 @@ class GeminiHandler(LLMHandler):
         else:
             return markdown_response
 
-    def get_prompt_from_thread(
-        self, thread: List[Dict], assistant_tag: str, user_tag: str
+    def llm_generate_content(
+        self, user_prompt, status_callback=None, *status_callback_args
+    ):
+        logging.info("Sending msg to gemini: %s" % user_prompt)
+        response = self.client.generate_content(
+            self.merge_user_messages(user_prompt),
+            request_options=self.request_options(),
+        )
+        return self.format_response(response.text)
+
+    def llm_generate_content_stream(
+        self, user_prompt, status_callback=None, *status_callback_args
+    ):
+        logging.info("Streaming msg to gemini: %s" % user_prompt)
+        text = []
+        for chunk in self.client.generate_content(
+            self.merge_user_messages(user_prompt),
+            stream=True,
+            request_options=self.request_options(),
+        ):
+            text.append(chunk.text)
+            yield chunk.text
+        return self.format_response("".join(text))
+
+    async def llm_generate_content_async(
+        self, user_prompt, status_callback=None, *status_callback_args
     ):
-        prompt = super().get_prompt_from_thread(thread, assistant_tag, user_tag)
-        for msg in prompt:
-            if MSG_INPUT_FIELD in msg:
-                msg[MSG_FIELD] = [msg.pop(MSG_INPUT_FIELD)]
-            else:
-                raise InvalidThreadFormatError(
-                    "The input thread doesn't have the field %s" % MSG_INPUT_FIELD
-                )
-        return prompt
+        logging.info("Sending msg to gemini: %s" % user_prompt)
+        response = await self.client.generate_content_async(
+            self.merge_user_messages(user_prompt),
+            request_options=self.request_options(),
+        )
+        return self.format_response(response.text)
+
+    def translate_message(self, msg: Dict, assistant_tag: str, user_tag: str):
+        formatted_msg = super().translate_message(msg, assistant_tag, user_tag)
+        if MSG_INPUT_FIELD not in formatted_msg:
+            raise InvalidThreadFormatError(
+                "The input thread doesn't have the field %s" % MSG_INPUT_FIELD
+            )
+        formatted_msg[MSG_FIELD] = [formatted_msg.pop(MSG_INPUT_FIELD)]
+        return formatted_msg
+
+    def count_tokens(self, msg: Dict):
+        return message_tokens(msg, MSG_FIELD)
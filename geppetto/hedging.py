@@ -0,0 +1,174 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .utils import load_env
+
+load_env()
+
+# percentile of the recent latencies of an LLM after which the same prompt is also
+# sent to another LLM, 0 disables hedging
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", 0))
+# calls of an LLM needed to know its latencies before hedging them
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", 20))
+LLM_HEDGE_WORKERS = int(os.getenv("LLM_HEDGE_WORKERS", 32))
+# whether the LLM of a hedge that answers becomes the one of the thread, by default
+LLM_HEDGE_SWITCH_THREADS = (
+    os.getenv("LLM_HEDGE_SWITCH_THREADS", "false").lower() == "true"
+)
+
+
+def first_step(stream):
+    """
+    Runs a stream to its first delta. Returns the stream, the delta and False, or
+    the stream, its response and True if it ends without yielding anything.
+    """
+    try:
+        return stream, next(stream), False
+    except StopIteration as stop:
+        return stream, stop.value, True
+
+
+def resumed(stream, first, finished):
+    """The stream started by `first_step()`, from its first delta."""
+    if finished:
+        return first
+    yield first
+    return (yield from stream)
+
+
+class Hedger:
+    """
+    Hedged calls: when a call takes longer than expected, a second call is made to
+    an alternative, and the result of the first one to succeed is used. The other
+    one is cancelled, or its result is discarded if it's already running a
+    blocking call, on a pool of `workers` threads.
+
+    Calls are hedged after the `percentile` of their recent latencies, once at
+    least `min_samples` are known. A `percentile` of 0 disables hedging.
+    """
+
+    def __init__(
+        self,
+        percentile=LLM_HEDGE_PERCENTILE,
+        min_samples=LLM_HEDGE_MIN_SAMPLES,
+        workers=LLM_HEDGE_WORKERS,
+    ):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.workers = workers
+        self.executor = None
+        self.lock = threading.Lock()
+        # calls hedged, and hedges that answered first
+        self.counts = {"hedged": 0, "won": 0}
+
+    def delay(self, latencies, key):
+        """Seconds after which the calls of the key are hedged, None if they aren't."""
+        if self.percentile <= 0:
+            return None
+        return latencies.percentile(key, self.percentile, self.min_samples)
+
+    def _executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    self.workers, thread_name_prefix="geppetto-hedge"
+                )
+            return self.executor
+
+    def _count(self, event):
+        with self.lock:
+            self.counts[event] += 1
+
+    def _race(self, first, start_second, delay, discard=None):
+        """
+        Waits for the future `first`, starting the second one after `delay` seconds.
+        Returns the result of the first future to succeed and whether it's the
+        second, passing the result of the other one to `discard`, if it succeeds.
+        """
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result(), False
+        self._count("hedged")
+        second = start_second()
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                for other in pending:
+                    if not other.cancel() and discard is not None:
+                        other.add_done_callback(
+                            lambda f: f.exception() is None and discard(f.result())
+                        )
+                if future is second:
+                    self._count("won")
+                return future.result(), future is second
+        raise error
+
+    def run(self, primary, secondary, delay):
+        """
+        Returns the result of `primary()`, or of `secondary()` if it is started
+        after `delay` seconds and succeeds first, and whether it's the latter.
+        """
+        if delay is None or secondary is None:
+            return primary(), False
+        executor = self._executor()
+        return self._race(
+            executor.submit(primary), lambda: executor.submit(secondary), delay
+        )
+
+    def run_stream(self, primary, secondary, delay):
+        """
+        Streaming version of `run()`, where `primary` and `secondary` return
+        streams, and the first to yield a delta is used. Returns that stream from
+        its first delta, and whether it's the one of `secondary`.
+        """
+        if delay is None or secondary is None:
+            return primary(), False
+        executor = self._executor()
+        step, won = self._race(
+            executor.submit(first_step, primary()),
+            lambda: executor.submit(lambda: first_step(secondary())),
+            delay,
+            discard=lambda step: step[0].close(),
+        )
+        return resumed(*step), won
+
+    async def run_async(self, primary, secondary, delay):
+        """Asyncio version of `run()`, where the calls are coroutine functions."""
+        if delay is None or secondary is None:
+            return await primary(), False
+        first = asyncio.ensure_future(primary())
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return first.result(), False
+            self._count("hedged")
+            second = asyncio.ensure_future(secondary())
+            tasks.add(second)
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    if task is second:
+                        self._count("won")
+                    return task.result(), task is second
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts)
@@ -0,0 +1,241 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+from .utils import load_env
+
+load_env()
+
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", "")
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", 1.0))
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", 500))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS threads (
+    thread_id TEXT PRIMARY KEY,
+    llm TEXT NOT NULL,
+    hedge_switch INTEGER
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS messages (
+    thread_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (thread_id, seq)
+) WITHOUT ROWID;
+"""
+
+
+class HistoryBackend(ABC):
+    """Persistent storage for the conversation of the slack threads."""
+
+    @abstractmethod
+    def load(self, thread_id) -> Optional[Dict]:
+        """Returns the stored thread history or None if the thread is unknown."""
+        pass
+
+    @abstractmethod
+    def append(self, thread_id, llm, start, msgs: List[Dict], hedge_switch=None):
+        """
+        Stores `msgs` as the messages of the thread starting at position `start`.
+        `hedge_switch` is None unless set by a command of the thread.
+        """
+        pass
+
+    @abstractmethod
+    def replace(self, thread_id, llm, msgs: List[Dict], hedge_switch=None):
+        """Overwrites the whole thread."""
+        pass
+
+    def flush(self):
+        """Blocks until every pending write is stored."""
+        pass
+
+    def close(self):
+        pass
+
+
+class SQLiteHistoryBackend(HistoryBackend):
+    """
+    Stores the threads in a SQLite database in WAL mode.
+
+    Writes are queued and applied by a background thread, batching every
+    operation queued within `flush_interval` seconds (up to `batch_size`)
+    into a single transaction. Nothing is read at startup: threads are
+    loaded one at a time when requested.
+    """
+
+    def __init__(
+        self,
+        path,
+        flush_interval=HISTORY_FLUSH_INTERVAL,
+        batch_size=HISTORY_BATCH_SIZE,
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.read_lock = threading.Lock()
+        self.pending_lock = threading.Lock()
+        # thread_id -> number of queued writes not stored yet
+        self.pending = {}
+        self.ops = queue.Queue()
+
+        self.read_conn = self._connect()
+        self.read_conn.executescript(SCHEMA)
+        self._migrate()
+        self.closed = False
+        self.flusher = threading.Thread(
+            target=self._flush_loop, name="history-flusher", daemon=True
+        )
+        self.flusher.start()
+        atexit.register(self.close)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _migrate(self):
+        """Adds the columns missing in the databases of previous versions."""
+        columns = [
+            row[1] for row in self.read_conn.execute("PRAGMA table_info(threads)")
+        ]
+        if "hedge_switch" not in columns:
+            with self.read_conn:
+                self.read_conn.execute(
+                    "ALTER TABLE threads ADD COLUMN hedge_switch INTEGER"
+                )
+
+    def _enqueue(self, thread_id, op):
+        with self.pending_lock:
+            self.pending[thread_id] = self.pending.get(thread_id, 0) + 1
+        self.ops.put((thread_id, op))
+
+    def append(self, thread_id, llm, start, msgs, hedge_switch=None):
+        if msgs:
+            self._enqueue(thread_id, ("append", llm, hedge_switch, start, list(msgs)))
+
+    def replace(self, thread_id, llm, msgs, hedge_switch=None):
+        self._enqueue(thread_id, ("replace", llm, hedge_switch, 0, list(msgs)))
+
+    def load(self, thread_id):
+        with self.pending_lock:
+            has_pending = self.pending.get(thread_id, 0) > 0
+        if has_pending:
+            self.flush()
+        with self.read_lock:
+            row = self.read_conn.execute(
+                "SELECT llm, hedge_switch FROM threads WHERE thread_id = ?",
+                (thread_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            rows = self.read_conn.execute(
+                "SELECT data FROM messages WHERE thread_id = ? ORDER BY seq",
+                (thread_id,),
+            ).fetchall()
+        thread_history = {"llm": row[0], "msgs": [json.loads(data) for (data,) in rows]}
+        if row[1] is not None:
+            thread_history["hedge_switch"] = bool(row[1])
+        return thread_history
+
+    def flush(self):
+        if self.closed:
+            return
+        done = threading.Event()
+        self.ops.put((None, done))
+        done.wait()
+
+    def close(self):
+        if self.closed:
+            return
+        self.flush()
+        self.closed = True
+        self.ops.put((None, None))
+        self.flusher.join()
+        self.read_conn.close()
+
+    def _write(self, conn, batch):
+        with conn:
+            for thread_id, (kind, llm, hedge_switch, start, msgs) in batch:
+                conn.execute(
+                    "INSERT INTO threads (thread_id, llm, hedge_switch) "
+                    "VALUES (?, ?, ?) ON CONFLICT(thread_id) DO UPDATE SET "
+                    "llm = excluded.llm, hedge_switch = excluded.hedge_switch",
+                    (thread_id, llm, hedge_switch),
+                )
+                if kind == "replace":
+                    conn.execute(
+                        "DELETE FROM messages WHERE thread_id = ?", (thread_id,)
+                    )
+                else:
+                    conn.execute(
+                        "DELETE FROM messages WHERE thread_id = ? AND seq >= ?",
+                        (thread_id, start),
+                    )
+                conn.executemany(
+                    "INSERT INTO messages (thread_id, seq, data) VALUES (?, ?, ?)",
+                    [
+                        (thread_id, start + i, json.dumps(msg))
+                        for i, msg in enumerate(msgs)
+                    ],
+                )
+
+    def _next_batch(self):
+        """
+        Waits for the first queued operation and collects the ones queued
+        within `flush_interval` after it. Returns the batch, the flush waiters
+        and whether the flusher must keep running.
+        """
+        batch, waiters = [], []
+        thread_id, op = self.ops.get()
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            if op is None:
+                return batch, waiters, False
+            if isinstance(op, threading.Event):
+                waiters.append(op)
+                return batch, waiters, True
+            batch.append((thread_id, op))
+            timeout = deadline - time.monotonic()
+            if len(batch) >= self.batch_size or timeout <= 0:
+                return batch, waiters, True
+            try:
+                thread_id, op = self.ops.get(timeout=timeout)
+            except queue.Empty:
+                return batch, waiters, True
+
+    def _flush_loop(self):
+        conn = self._connect()
+        running = True
+        while running:
+            batch, waiters, running = self._next_batch()
+            try:
+                if batch:
+                    self._write(conn, batch)
+            except sqlite3.Error as e:
+                logging.error("Error storing thread history: %s" % e)
+            finally:
+                with self.pending_lock:
+                    for thread_id, _ in batch:
+                        self.pending[thread_id] -= 1
+                        if not self.pending[thread_id]:
+                            del self.pending[thread_id]
+            for waiter in waiters:
+                waiter.set()
+        conn.close()
+
+
+def history_backend_from_env():
+    """Builds the history backend configured by HISTORY_DB_PATH, if any."""
+    if not HISTORY_DB_PATH:
+        return None
+    logging.info("Storing thread history in %s" % HISTORY_DB_PATH)
+    return SQLiteHistoryBackend(HISTORY_DB_PATH)
@@ -0,0 +1,167 @@
+import asyncio
+import functools
+import importlib.util
+import logging
+import os
+import threading
+
+from .utils import load_env
+
+load_env()
+
+# connections of the shared pool, to all the hosts
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+# idle connections kept alive, and the seconds they are kept
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", 20))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 60))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+# seconds waiting for data, e.g. for an LLM to start answering
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 120))
+# HTTP/2 is used when the h2 package is installed
+HTTP2 = os.getenv("HTTP2", "true").lower() == "true"
+# open connections to the APIs of the LLMs on startup, before the first request
+HTTP_PREWARM = os.getenv("HTTP_PREWARM", "false").lower() == "true"
+# connections opened to each API, a single one is enough with HTTP/2
+HTTP_PREWARM_CONNECTIONS = int(os.getenv("HTTP_PREWARM_CONNECTIONS", 2))
+
+
+def http2_available():
+    return importlib.util.find_spec("h2") is not None
+
+
+def http_package(sdk):
+    """
+    The HTTP package the clients of an SDK module are built on: httpx, or a fork of
+    it for the SDKs that define their default client on one.
+    """
+    default_client = getattr(sdk, "DefaultHttpxClient", None)
+    for cls in getattr(default_client, "__mro__", ()):
+        package = cls.__module__.split(".")[0]
+        if package.startswith("httpx"):
+            return package
+    return "httpx"
+
+
+class HTTPPool:
+    """
+    HTTP clients shared by the handlers, keeping up to `max_connections`
+    connections to the APIs and the `max_keepalive` idle ones alive for
+    `keepalive_expiry` seconds, so the requests don't pay a TLS handshake each.
+
+    There is a client for threads and another one for asyncio, created on first use,
+    for each HTTP package the SDKs are built on: httpx and its forks.
+    """
+
+    def __init__(
+        self,
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        connect_timeout=HTTP_CONNECT_TIMEOUT,
+        read_timeout=HTTP_READ_TIMEOUT,
+        http2=HTTP2,
+    ):
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.http2 = http2 and http2_available()
+        if http2 and not self.http2:
+            logging.info("HTTP/2 disabled: the h2 package isn't installed")
+        self.lock = threading.Lock()
+        # (package, whether it's for asyncio) -> client
+        self.clients = {}
+
+    def _client_args(self, http):
+        return {
+            "limits": http.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            "timeout": http.Timeout(self.read_timeout, connect=self.connect_timeout),
+            "http2": self.http2,
+        }
+
+    def _get_client(self, package, is_async):
+        with self.lock:
+            client = self.clients.get((package, is_async))
+            if client is None:
+                # the HTTP packages are slow to import, and only needed here
+                http = importlib.import_module(package)
+                client_class = http.AsyncClient if is_async else http.Client
+                client = client_class(**self._client_args(http))
+                self.clients[(package, is_async)] = client
+            return client
+
+    def client(self, package="httpx"):
+        return self._get_client(package, False)
+
+    def async_client(self, package="httpx"):
+        return self._get_client(package, True)
+
+    def get(self, url, package="httpx"):
+        """Returns the content at the url, raising an error if it can't be got."""
+        response = self.client(package).get(url)
+        response.raise_for_status()
+        return response.content
+
+    async def get_async(self, url, package="httpx"):
+        response = await self.async_client(package).get(url)
+        response.raise_for_status()
+        return response.content
+
+    def _connections(self, connections):
+        return 1 if self.http2 else connections
+
+    def prewarm(self, url, package="httpx", connections=HTTP_PREWARM_CONNECTIONS):
+        """
+        Opens `connections` connections to the host of the url at once, left in
+        the pool for the next requests. Returns how many could be opened.
+        """
+        client = self.client(package)
+
+        def connect():
+            try:
+                client.head(url)
+                return True
+            except Exception as e:
+                logging.warning("Error connecting to %s: %s" % (url, e))
+                return False
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(connect()))
+            for _ in range(self._connections(connections))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sum(results)
+
+    async def prewarm_async(
+        self, url, package="httpx", connections=HTTP_PREWARM_CONNECTIONS
+    ):
+        """Asyncio version of `prewarm()`, filling the pool of the asyncio client."""
+        client = self.async_client(package)
+
+        async def connect():
+            try:
+                await client.head(url)
+                return True
+            except Exception as e:
+                logging.warning("Error connecting to %s: %s" % (url, e))
+                return False
+
+        results = await asyncio.gather(
+            *(connect() for _ in range(self._connections(connections)))
+        )
+        return sum(results)
+
+
+@functools.lru_cache(maxsize=None)
+def shared_http_pool():
+    """The pool used by the handlers that aren't given one."""
+    return HTTPPool()
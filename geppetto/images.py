@@ -0,0 +1,61 @@
+import asyncio
+import os
+from io import BytesIO
+
+from .utils import LazyImport, load_env
+
+load_env()
+
+# Pillow is slow to import, and only needed to transcode images
+Image = LazyImport("PIL.Image")
+
+# format of the images uploaded to Slack: png, jpeg or webp. By default, images are
+# uploaded as they are received, or as PNG if their format isn't known
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "").lower()
+# quality of the jpeg and webp images, from 1 to 100
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", 85))
+
+# first bytes of the formats that Slack shows
+SIGNATURES = {
+    "png": (b"\x89PNG\r\n\x1a\n",),
+    "jpeg": (b"\xff\xd8\xff",),
+    "gif": (b"GIF87a", b"GIF89a"),
+}
+
+
+def image_format(data):
+    """The format of the image, from its first bytes, or None if it isn't known."""
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    for name, signatures in SIGNATURES.items():
+        if data.startswith(signatures):
+            return name
+    return None
+
+
+def needs_transcoding(data, output_format=IMAGE_FORMAT):
+    current = image_format(data)
+    return current is None or bool(output_format and current != output_format)
+
+
+def transcode(data, output_format=IMAGE_FORMAT, quality=IMAGE_QUALITY):
+    """
+    Returns the image in the format, or as it is if it's already in it. Without a
+    format, images in a known format aren't decoded, and the rest become PNG.
+    """
+    if not needs_transcoding(data, output_format):
+        return data
+    output_format = output_format or "png"
+    img = Image.open(BytesIO(data))
+    if output_format == "jpeg" and img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    output = BytesIO()
+    img.save(output, format=output_format.upper(), quality=quality)
+    return output.getvalue()
+
+
+async def transcode_async(data, output_format=IMAGE_FORMAT, quality=IMAGE_QUALITY):
+    """Asyncio version of `transcode()`, decoding the images in a thread."""
+    if not needs_transcoding(data, output_format):
+        return data
+    return await asyncio.to_thread(transcode, data, output_format, quality)
@@ -1,46 +1,193 @@
+import asyncio
+import logging
+import os
 from abc import ABC, abstractmethod
-from typing import List, Dict, Callable
+from typing import List, Dict, Callable, Generator
+
+from .cache import LRUCache
 from .exceptions import InvalidThreadFormatError
+from .tokens import CHARS_PER_TOKEN, fit_to_budget, message_tokens
+from .utils import load_env
+
+load_env()
 
 ROLE_FIELD = "role"
+PROMPT_CACHE_MAX_THREADS = int(os.getenv("PROMPT_CACHE_MAX_THREADS", 1000))
+PROMPT_CACHE_MAX_BYTES = int(os.getenv("PROMPT_CACHE_MAX_BYTES", 20 * 1024 * 1024))
+
+
+class CachedPrompt:
+    """
+    Translated prompt of a thread, along with the identity of the list of messages
+    it was built from, so that the list itself isn't kept alive.
+    """
+
+    def __init__(self, thread, tags):
+        self.thread_identity = id(thread)
+        self.tags = tags
+        self.prompt = []
+        # estimated tokens of each message of the prompt
+        self.tokens = []
+        self.last_msg = None
+
+    def extends(self, thread, tags):
+        """Tells whether `thread` is the cached one, with messages only appended."""
+        size = len(self.prompt)
+        # the id of a list freed may be reused, but not with the last message
+        # kept here at the same position
+        return (
+            id(thread) == self.thread_identity
+            and tags == self.tags
+            and size <= len(thread)
+            and (not size or thread[size - 1] is self.last_msg)
+        )
+
+
+class PromptCache(LRUCache):
+    """Cached prompts by thread, capped in threads and in their estimated bytes."""
+
+    def __init__(
+        self, max_threads=PROMPT_CACHE_MAX_THREADS, max_bytes=PROMPT_CACHE_MAX_BYTES
+    ):
+        super().__init__(max_entries=max_threads, max_bytes=max_bytes)
+
+    def _measure(self, cached):
+        return sum(cached.tokens) * CHARS_PER_TOKEN
 
 
 class LLMHandler(ABC):
+    # what the LLM is good at, from routing.IMAGES and routing.REASONING
+    capabilities = frozenset()
+
     def __init__(self, name, model, client):
         self.name = name
         self.model = model
         self.client = client
+        # thread_id -> CachedPrompt
+        self.prompts = PromptCache()
+        # max tokens of the prompts sent, 0 for no limit
+        self.context_budget = 0
+        # tokens of the instructions sent along with every prompt
+        self.reserved_tokens = 0
 
     def get_info(self):
         """Returns the name and model of LLM."""
         return f"Name: {self.name} - Model: {self.model}"
 
+    def prewarm(self):
+        """Opens connections to the API of the LLM, if it keeps them in a pool."""
+
+    async def prewarm_async(self):
+        """Asyncio version of `prewarm()`."""
+
     @abstractmethod
     def llm_generate_content(self, prompt: str, callback: Callable, *callback_args):
         """It is an abstract method. It should be implemented in the child class."""
         pass
 
+    async def llm_generate_content_async(
+        self, prompt: str, callback: Callable, *callback_args
+    ):
+        """
+        Asyncio version of `llm_generate_content()`, where `callback` is a coroutine function.
+
+        Handlers with an async client should override it. By default the blocking
+        call runs in a separate thread and status updates are not reported.
+        """
+        return await asyncio.to_thread(self.llm_generate_content, prompt)
+
+    def llm_generate_content_stream(
+        self, prompt: str, callback: Callable, *callback_args
+    ) -> Generator[str, None, object]:
+        """
+        Streaming version of `llm_generate_content()`.
+
+        Yields the raw text deltas as they are generated, to show the progress, and
+        returns the final response in the same format as `llm_generate_content()`.
+        By default nothing is yielded and the whole response is returned at once.
+        """
+        yield from ()
+        return self.llm_generate_content(prompt, callback, *callback_args)
+
+    def llm_generate_text(self, prompt):
+        """
+        Generates the answer to an internal prompt, such as the summary of a thread,
+        as plain text: without tools, so nothing else is generated. By default the
+        same as `llm_generate_content()`.
+        """
+        return self.llm_generate_content(prompt)
+
+    async def llm_generate_text_async(self, prompt):
+        """Asyncio version of `llm_generate_text()`."""
+        return await self.llm_generate_content_async(prompt)
+
+    def format_response(self, response):
+        """Converts a complete text response to the format expected by the UI."""
+        return response
+
+    def translate_message(self, msg: Dict, assistant_tag: str, user_tag: str):
+        """Converts a message of the thread to the format of the LLM."""
+        formatted_msg = dict(msg)
+        if ROLE_FIELD not in formatted_msg:
+            raise InvalidThreadFormatError(
+                "The input thread doesn't have the field %s" % ROLE_FIELD
+            )
+        formatted_msg[ROLE_FIELD] = formatted_msg[ROLE_FIELD].replace(
+            assistant_tag, self.assistant_role
+        )
+        formatted_msg[ROLE_FIELD] = formatted_msg[ROLE_FIELD].replace(
+            user_tag, self.user_role
+        )
+        return formatted_msg
+
+    def count_tokens(self, msg: Dict):
+        """Estimates the tokens of a message translated by `translate_message()`."""
+        return message_tokens(msg)
+
     def get_prompt_from_thread(
-        self, thread: List[Dict], assistant_tag: str, user_tag: str
+        self, thread: List[Dict], assistant_tag: str, user_tag: str, thread_id=None
     ):
-        """Tries to get the prompt from the thread. If it fails, it raises an error."""
-        prompt = []
-        for msg in thread:
-            formatted_msg = dict(msg)
-            if ROLE_FIELD in formatted_msg:
-                formatted_msg[ROLE_FIELD] = formatted_msg[ROLE_FIELD].replace(
-                    assistant_tag, self.assistant_role
-                )
-                formatted_msg[ROLE_FIELD] = formatted_msg[ROLE_FIELD].replace(
-                    user_tag, self.user_role
-                )
-                prompt.append(formatted_msg)
-            else:
-                raise InvalidThreadFormatError(
-                    "The input thread doesn't have the field %s" % ROLE_FIELD
-                )
+        """
+        Tries to get the prompt from the thread. If it fails, it raises an error.
+
+        The prompt is trimmed to the first message and the newest ones that fit in
+        the `context_budget` of the handler.
+
+        If `thread_id` is given, the translated messages and their tokens are cached
+        and only the messages appended since the previous call are translated.
+        Replacing the list of messages of the thread, or any of them, starts a new
+        prompt.
+        """
+        if thread_id is None:
+            cached = CachedPrompt(thread, None)
+        else:
+            tags = (assistant_tag, user_tag)
+            cached = self.prompts.get(thread_id)
+            if cached is None or not cached.extends(thread, tags):
+                cached = CachedPrompt(thread, tags)
+        for msg in thread[len(cached.prompt) :]:
+            formatted_msg = self.translate_message(msg, assistant_tag, user_tag)
+            cached.prompt.append(formatted_msg)
+            cached.tokens.append(self.count_tokens(formatted_msg))
+            cached.last_msg = msg
+        if thread_id is not None:
+            self.prompts[thread_id] = cached
+        budget = self.context_budget
+        if budget:
+            budget = max(1, budget - self.reserved_tokens)
+        # the handlers are free to modify the prompt they get
+        prompt = fit_to_budget(cached.prompt, cached.tokens, budget, self.user_role)
+        if len(prompt) < len(cached.prompt):
+            logging.info(
+                "Prompt of %s trimmed from %s to %s messages"
+                % (self.name, len(cached.prompt), len(prompt))
+            )
         return prompt
 
+    def forget_thread(self, thread_id):
+        """Drops the cached prompt of the thread."""
+        self.prompts.pop(thread_id, None)
+
     def split_message(self, message):
         """
         Split a message into parts if it exceeds 4000 characters.
@@ -1,26 +1,194 @@
-from typing import List, Type, TypedDict, Dict
+import asyncio
+import itertools
+import logging
+import os
+import threading
+import time
+from collections.abc import MutableMapping
+from contextlib import asynccontextmanager, contextmanager
+from functools import partial
+from typing import FrozenSet, List, Type, TypedDict, Dict
+
+from .exceptions import HandlerUnavailableError, LLMUnavailableError
+from .hedging import Hedger
 from .llm_api_handler import LLMHandler
+from .metrics import ErrorRateTracker, LatencyTracker
+from .near_duplicates import first_message_text, near_duplicate_index_from_env
+from .response_cache import handler_identity, is_text_response, prompt_key
+from .response_cache import response_cache_from_env
+from .rate_limit import AIMDLimiter, is_throttling_error
+from .resilience import CircuitBreaker, RetryPolicy, is_transient_error
+from .routing import IMAGE_REQUEST, IMAGES, Router
+from .singleflight import SingleFlight
+from .utils import load_env
+
+load_env()
+
+# seconds above which LLM calls don't raise the concurrency limits, 0 to ignore
+LLM_LATENCY_TARGET = float(os.getenv("LLM_LATENCY_TARGET", 0))
+# key of the latencies until the first delta of the streams of an LLM
+FIRST_TOKEN_LATENCY = "%s first token"
+
+
+def asks_for_image(thread):
+    """Whether the last message of the thread is likely asking for an image."""
+    text = thread[-1].get("content") if thread else None
+    return isinstance(text, str) and IMAGE_REQUEST.search(text) is not None
 
 
-class LLMCfgRec(TypedDict):
+class RequiredLLMCfgRec(TypedDict):
     name: str
     handler: Type[LLMHandler]
     handler_args: Dict
 
 
+class LLMCfgRec(RequiredLLMCfgRec, total=False):
+    # max concurrent calls to the LLM, tuned down when throttled
+    max_concurrency: int
+    # overrides the capabilities declared by the handler, for routing
+    capabilities: FrozenSet[str]
+
+
 LLMCfgs = List[LLMCfgRec]
 
 
+class LazyHandlers(MutableMapping):
+    """
+    Handlers of the LLMs by name, built on first use by the function registered
+    for each of them. Handlers are built once, even if several threads use them at
+    the same time, and only the ones built are iterated by `built()`. A handler
+    that can't be built raises HandlerUnavailableError, and is built again next time.
+    """
+
+    def __init__(self):
+        self.factories = {}
+        self.handlers = {}
+        self.locks = {}
+
+    def register(self, name, factory):
+        self.factories[name] = factory
+        self.locks[name] = threading.Lock()
+
+    def __getitem__(self, name):
+        handler = self.handlers.get(name)
+        if handler is not None:
+            return handler
+        with self.locks[name]:
+            handler = self.handlers.get(name)
+            if handler is None:
+                started = time.monotonic()
+                try:
+                    handler = self.handlers[name] = self.factories[name]()
+                except Exception as e:
+                    logging.error("Error building the handler of %s: %s" % (name, e))
+                    raise HandlerUnavailableError(
+                        "The handler of %s couldn't be built" % name
+                    ) from e
+                logging.info(
+                    "Handler of %s built in %.2f seconds"
+                    % (name, time.monotonic() - started)
+                )
+            return handler
+
+    def __setitem__(self, name, handler):
+        self.register(name, lambda: handler)
+        self.handlers[name] = handler
+
+    def __delitem__(self, name):
+        del self.factories[name]
+        del self.locks[name]
+        self.handlers.pop(name, None)
+
+    def __contains__(self, name):
+        # registered, without building it as Mapping would
+        return name in self.factories
+
+    def __iter__(self):
+        return iter(self.factories)
+
+    def __len__(self):
+        return len(self.factories)
+
+    def built(self):
+        return list(self.handlers.values())
+
+
 class LLMController:
 
-    def __init__(self, llm_cfgs: LLMCfgs):
+    def __init__(
+        self,
+        llm_cfgs: LLMCfgs,
+        response_cache=None,
+        near_duplicates=None,
+        retry_policy=None,
+        sleep=time.sleep,
+        hedger=None,
+        router=None,
+    ):
         self.llm_cfgs = llm_cfgs
-        self.handlers = {}
+        self.handlers = LazyHandlers()
+        if response_cache is None:
+            response_cache = response_cache_from_env()
+        self.response_cache = response_cache
+        if near_duplicates is None:
+            near_duplicates = near_duplicate_index_from_env()
+        self.near_duplicates = near_duplicates
+        # identical calls in flight, by prompt key
+        self.in_flight = SingleFlight()
+        # name -> concurrency limiter of the LLMs with max_concurrency
+        self.limiters = {
+            llm["name"]: AIMDLimiter(
+                llm["max_concurrency"], latency_target=LLM_LATENCY_TARGET
+            )
+            for llm in llm_cfgs
+            if llm.get("max_concurrency")
+        }
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.sleep = sleep
+        # name -> circuit breaker of the API of the LLM
+        self.breakers = {llm["name"]: CircuitBreaker() for llm in llm_cfgs}
+        self.latencies = LatencyTracker()
+        # name -> share of the calls to the LLM failing with transient errors
+        self.errors = ErrorRateTracker()
+        self.hedger = hedger or Hedger()
+        self.router = router or Router(self.latencies, self.errors)
 
     def init_controller(self):
+        """Registers the handlers of the LLMs, which are built on first use."""
         for llm in self.llm_cfgs:
             name = llm["name"]
-            self.handlers[name] = self.get_handler(name)
+            self.handlers.register(name, partial(self.build_handler, name))
+
+    def warm_up(self, prewarm=False, names=None):
+        """
+        Builds the handlers of the LLMs `names`, or of all of them, not used yet in a
+        background thread, and returns it. With `prewarm`, the handlers also open
+        connections to their APIs.
+        """
+
+        def build_handlers():
+            for name in list(self.handlers) if names is None else names:
+                try:
+                    handler = self.handlers[name]
+                    if prewarm:
+                        handler.prewarm()
+                except Exception as e:
+                    logging.error("Error warming up the handler of %s: %s" % (name, e))
+
+        thread = threading.Thread(
+            target=build_handlers, name="geppetto-warm-up", daemon=True
+        )
+        thread.start()
+        return thread
+
+    async def prewarm_async(self):
+        """Opens connections to the APIs of the LLMs for the asyncio runtime."""
+        for name in list(self.handlers):
+            try:
+                handler = await asyncio.to_thread(self.get_handler, name)
+                await handler.prewarm_async()
+            except Exception as e:
+                logging.error("Error prewarming the handler of %s: %s" % (name, e))
 
     def list_llms(self):
         return [x["name"] for x in self.llm_cfgs]
@@ -31,6 +199,567 @@ class LLMController:
                 return llm
         raise ValueError("LLM configuration not found for name: %s" % name)
 
-    def get_handler(self, name):
+    def build_handler(self, name):
         llm_cfg = self.get_llm_cfg(name)
         return llm_cfg["handler"](**llm_cfg["handler_args"])
+
+    def get_handler(self, name):
+        """Returns the handler of the LLM, building it on first use."""
+        if name not in self.handlers:
+            self.get_llm_cfg(name)
+            self.handlers.register(name, partial(self.build_handler, name))
+        return self.handlers[name]
+
+    def get_capabilities(self, name):
+        llm_cfg = self.get_llm_cfg(name)
+        return llm_cfg.get(
+            "capabilities", getattr(llm_cfg["handler"], "capabilities", frozenset())
+        )
+
+    def route(self, msg):
+        """
+        Returns the LLM chosen by the router to answer the first message of a
+        thread, among the ones with their circuit breaker closed, or None if
+        routing is disabled.
+        """
+        if not self.router.enabled:
+            return None
+        llms = [
+            (name, self.get_capabilities(name))
+            for name in self.list_llms()
+            if self.breakers[name].state == CircuitBreaker.CLOSED
+        ]
+        return self.router.route(msg, llms)
+
+    def forget_thread(self, thread_id):
+        """Drops the prompts of the thread cached by the handlers."""
+        for handler in self.handlers.built():
+            handler.forget_thread(thread_id)
+
+    @contextmanager
+    def limited(self, name):
+        """Holds a slot of the concurrency limiter of the LLM, if any, while in use."""
+        limiter = self.limiters.get(name)
+        if limiter is None:
+            yield
+            return
+        token = limiter.acquire()
+        throttled = False
+        try:
+            yield
+        except Exception as e:
+            throttled = is_throttling_error(e)
+            raise
+        finally:
+            limiter.release(token, throttled)
+
+    @asynccontextmanager
+    async def limited_async(self, name):
+        limiter = self.limiters.get(name)
+        if limiter is None:
+            yield
+            return
+        token = await limiter.acquire_async()
+        throttled = False
+        try:
+            yield
+        except Exception as e:
+            throttled = is_throttling_error(e)
+            raise
+        finally:
+            limiter.release(token, throttled)
+
+    def stats(self):
+        """Returns the usage of the limiters, breakers and caches, and the latencies."""
+        stats = {
+            "limiters": {
+                name: limiter.stats() for name, limiter in self.limiters.items()
+            },
+            "breakers": {
+                name: breaker.stats() for name, breaker in self.breakers.items()
+            },
+            "in_flight": self.in_flight.stats(),
+            "latencies": self.latencies.stats(),
+            "error_rates": self.errors.stats(),
+            "hedging": self.hedger.stats(),
+            "routed": self.router.stats(),
+        }
+        if self.response_cache is not None:
+            stats["response_cache"] = self.response_cache.stats()
+        if self.near_duplicates is not None:
+            stats["near_duplicates"] = self.near_duplicates.stats()
+        return stats
+
+    def get_prompt(self, name, thread, assistant_tag, user_tag, thread_id=None):
+        """
+        Returns the handler of the LLM, the prompt of the thread for it and the
+        key identifying its response (None if the prompt isn't only text).
+        """
+        handler = self.handlers[name]
+        prompt = handler.get_prompt_from_thread(
+            thread, assistant_tag, user_tag, thread_id=thread_id
+        )
+        return handler, prompt, prompt_key(handler, prompt)
+
+    def cached_response(self, handler, prompt, key):
+        """
+        Returns the cached response to the prompt, or to a similar first message
+        of a thread, if any of those caches is enabled.
+        """
+        response = None
+        if key is not None and self.response_cache is not None:
+            response = self.response_cache.get(key)
+        if response is None and self.near_duplicates is not None:
+            text = first_message_text(prompt)
+            if text:
+                response = self.near_duplicates.lookup(handler_identity(handler), text)
+        if response is not None:
+            logging.info("Response of %s taken from the cache" % handler.name)
+        return response
+
+    def cache_response(self, handler, prompt, key, response):
+        if not is_text_response(response):
+            return
+        if key is not None and self.response_cache is not None:
+            self.response_cache.store(key, response)
+        if self.near_duplicates is not None:
+            text = first_message_text(prompt)
+            if text:
+                self.near_duplicates.add(handler_identity(handler), text, response)
+
+    def failover_order(self, name):
+        """
+        The LLM `name` followed by the other initialized LLMs, in the order of
+        `llm_cfgs` starting after it, which answer when it fails.
+        """
+        names = self.list_llms()
+        if name not in names:
+            return [name]
+        i = names.index(name)
+        return [n for n in names[i:] + names[:i] if n == name or n in self.handlers]
+
+    def after_failure(self, name, error, retry):
+        """
+        Records the failed call to the LLM. Returns the seconds to wait before
+        retrying it, or None if it mustn't be retried.
+        """
+        breaker = self.breakers[name]
+        if not is_transient_error(error):
+            # the API is up, the request itself was wrong
+            breaker.record_success()
+            return None
+        breaker.record_failure()
+        self.errors.record(name, True)
+        if retry >= self.retry_policy.max_retries or not breaker.allow():
+            return None
+        delay = self.retry_policy.delay(retry)
+        logging.warning(
+            "Call to %s failed: %s. Retrying in %.2f seconds" % (name, error, delay)
+        )
+        return delay
+
+    def call_with_retries(self, name, fn, *args):
+        """Returns `fn(*args)`, retrying it on transient errors of the LLM."""
+        for retry in itertools.count():
+            started = time.monotonic()
+            try:
+                with self.limited(name):
+                    result = fn(*args)
+            except Exception as e:
+                delay = self.after_failure(name, e, retry)
+                if delay is None:
+                    raise
+                self.sleep(delay)
+            else:
+                self.breakers[name].record_success()
+                self.errors.record(name, False)
+                self.latencies.record(name, time.monotonic() - started)
+                return result
+
+    def stream_with_retries(self, name, fn, *args):
+        """
+        Streaming version of `call_with_retries()`. The call is only retried if it
+        fails before streaming anything.
+        """
+        for retry in itertools.count():
+            streamed = False
+            started = time.monotonic()
+            try:
+                with self.limited(name):
+                    stream = fn(*args)
+                    while True:
+                        try:
+                            delta = next(stream)
+                        except StopIteration as stop:
+                            response = stop.value
+                            break
+                        if not streamed:
+                            self.latencies.record(
+                                FIRST_TOKEN_LATENCY % name, time.monotonic() - started
+                            )
+                            streamed = True
+                        yield delta
+            except Exception as e:
+                delay = self.after_failure(name, e, retry)
+                if streamed and is_transient_error(e):
+                    # part of the response is shown, so it can't fail over
+                    raise LLMUnavailableError("%s failed while streaming" % name) from e
+                if delay is None:
+                    raise
+                self.sleep(delay)
+            else:
+                self.breakers[name].record_success()
+                self.errors.record(name, False)
+                # the whole stream, as routing compares it with the other calls
+                self.latencies.record(name, time.monotonic() - started)
+                return response
+
+    async def call_with_retries_async(self, name, fn, *args):
+        """Asyncio version of `call_with_retries()`, where `fn` is a coroutine function."""
+        for retry in itertools.count():
+            started = time.monotonic()
+            try:
+                async with self.limited_async(name):
+                    result = await fn(*args)
+            except Exception as e:
+                delay = self.after_failure(name, e, retry)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+            else:
+                self.breakers[name].record_success()
+                self.errors.record(name, False)
+                self.latencies.record(name, time.monotonic() - started)
+                return result
+
+    def can_fail_over(self, name, error):
+        """
+        Whether the LLM failed in a way another one may not: its handler couldn't be
+        built, or the error is transient. Logs it if so. Calls failing once part of
+        the response is streamed raise LLMUnavailableError, which doesn't fail over.
+        """
+        if not (
+            isinstance(error, HandlerUnavailableError) or is_transient_error(error)
+        ):
+            return False
+        logging.warning("%s is failing, trying the next LLM: %s" % (name, error))
+        return True
+
+    def hedge_for(self, name, latency_key, thread, cancellable=False):
+        """
+        Returns the LLM to hedge the calls of the LLM `name` with, the next one with
+        its circuit breaker closed, and the seconds after which to do it, given the
+        latencies of `latency_key`. Returns None, None if they aren't hedged.
+
+        Unless the losing call is `cancellable`, threads asking for an image aren't
+        hedged between LLMs that can generate images: the losing call would still
+        generate, and bill, its images.
+        """
+        delay = self.hedger.delay(self.latencies, latency_key)
+        if delay is None:
+            return None, None
+        images = not cancellable and asks_for_image(thread)
+        if images and self.generates_images(name):
+            return None, None
+        for other in self.failover_order(name)[1:]:
+            if self.breakers[other].state == CircuitBreaker.CLOSED:
+                if not (images and self.generates_images(other)):
+                    return other, delay
+        return None, None
+
+    def generates_images(self, name):
+        try:
+            return IMAGES in self.get_capabilities(name)
+        except ValueError:
+            return False
+
+    def hedge_won(self, name, hedge, switch_llm):
+        logging.info("%s answered before %s, hedging it" % (hedge, name))
+        if switch_llm is not None:
+            switch_llm(hedge)
+
+    def answer(self, name, handler, prompt, key, *status_callback_args):
+        """Returns the response of the LLM to the prompt, and caches it."""
+        response = self.call_with_retries(
+            name, handler.llm_generate_content, prompt, *status_callback_args
+        )
+        self.cache_response(handler, prompt, key, response)
+        return response
+
+    def answer_stream(self, name, handler, prompt, key, *status_callback_args):
+        response = yield from self.stream_with_retries(
+            name, handler.llm_generate_content_stream, prompt, *status_callback_args
+        )
+        self.cache_response(handler, prompt, key, response)
+        return response
+
+    async def answer_async(self, name, handler, prompt, key, *status_callback_args):
+        response = await self.call_with_retries_async(
+            name, handler.llm_generate_content_async, prompt, *status_callback_args
+        )
+        self.cache_response(handler, prompt, key, response)
+        return response
+
+    def generate_text(self, name, thread, assistant_tag, user_tag):
+        """
+        Generates the plain text answer of the LLM `name` to an internal prompt, such
+        as the summary of a thread. Transient errors are retried and failed over as
+        in `generate_content()`, but the answer isn't hedged, shared with identical
+        calls, nor taken from or stored in the response caches.
+        """
+        failover = Failover(
+            self, name, thread, assistant_tag, user_tag, None, cached=False
+        )
+        for candidate, handler, prompt, key, response in failover:
+            try:
+                return self.call_with_retries(
+                    candidate, handler.llm_generate_text, prompt
+                )
+            except Exception as e:
+                failover.failed(candidate, e)
+        raise failover.unavailable()
+
+    async def generate_text_async(self, name, thread, assistant_tag, user_tag):
+        """Asyncio version of `generate_text()`."""
+        failover = Failover(
+            self, name, thread, assistant_tag, user_tag, None, cached=False
+        )
+        for candidate, handler, prompt, key, response in failover:
+            try:
+                return await self.call_with_retries_async(
+                    candidate, handler.llm_generate_text_async, prompt
+                )
+            except Exception as e:
+                failover.failed(candidate, e)
+        raise failover.unavailable()
+
+    def generate_content(
+        self,
+        name,
+        thread,
+        assistant_tag,
+        user_tag,
+        status_callback=None,
+        *status_callback_args,
+        thread_id=None,
+        switch_llm=None,
+    ):
+        """
+        Generates the response of the LLM `name` to the thread, reusing the response
+        to the same prompt if the response cache is enabled. Concurrent calls with
+        the same prompt share one call to the LLM.
+
+        Transient errors are retried. If they persist, or the circuit breaker of the
+        LLM is open, the next healthy LLM answers instead, and LLMUnavailableError
+        is raised if none can.
+
+        If hedging is enabled and the LLM takes longer than usual, the next healthy
+        LLM is asked too, and the first response is used. When it's the one of the
+        hedge, `switch_llm(hedge_name)` is called, if given.
+        """
+        callback_args = (status_callback, *status_callback_args)
+        failover = Failover(self, name, thread, assistant_tag, user_tag, thread_id)
+        for candidate, handler, prompt, key, response in failover:
+            if response is not None:
+                return response
+            hedge, delay = None, None
+            if candidate == name:
+                hedge, delay = self.hedge_for(name, name, thread)
+
+            def hedged():
+                handler, prompt, key = failover.get_prompt(hedge)
+                return self.answer(hedge, handler, prompt, key, *callback_args)
+
+            def call(name=candidate, handler=handler, prompt=prompt, key=key):
+                response, won = self.hedger.run(
+                    lambda: self.answer(name, handler, prompt, key, *callback_args),
+                    hedge and hedged,
+                    delay,
+                )
+                if won:
+                    self.hedge_won(name, hedge, switch_llm)
+                return response
+
+            try:
+                if key is None:
+                    return call()
+                return self.in_flight.do(key, call)
+            except Exception as e:
+                failover.failed(candidate, e)
+        raise failover.unavailable()
+
+    def generate_content_stream(
+        self,
+        name,
+        thread,
+        assistant_tag,
+        user_tag,
+        status_callback=None,
+        *status_callback_args,
+        thread_id=None,
+        switch_llm=None,
+    ):
+        """
+        Streaming version of `generate_content()`. Cached responses aren't streamed,
+        calls failing once part of the response is streamed don't fail over, and
+        hedges race to stream the first delta.
+        """
+        callback_args = (status_callback, *status_callback_args)
+        failover = Failover(self, name, thread, assistant_tag, user_tag, thread_id)
+        for candidate, handler, prompt, key, response in failover:
+            if response is not None:
+                return response
+            if key is not None:
+                future, leader = self.in_flight.join(key)
+                if not leader:
+                    # the same prompt is being answered, without streaming it here
+                    try:
+                        return future.result()
+                    except Exception as e:
+                        failover.failed(candidate, e)
+                        continue
+            hedge, delay = None, None
+            if candidate == name:
+                hedge, delay = self.hedge_for(name, FIRST_TOKEN_LATENCY % name, thread)
+
+            def hedged():
+                handler, prompt, key = failover.get_prompt(hedge)
+                return (
+                    yield from self.answer_stream(
+                        hedge, handler, prompt, key, *callback_args
+                    )
+                )
+
+            try:
+                stream, won = self.hedger.run_stream(
+                    lambda: self.answer_stream(
+                        candidate, handler, prompt, key, *callback_args
+                    ),
+                    hedge and hedged,
+                    delay,
+                )
+                if won:
+                    self.hedge_won(name, hedge, switch_llm)
+                response = yield from stream
+            except BaseException as e:
+                if key is not None:
+                    self.in_flight.done(key, future, error=e)
+                if not isinstance(e, Exception):
+                    raise
+                failover.failed(candidate, e)
+                continue
+            if key is not None:
+                self.in_flight.done(key, future, response)
+            return response
+        raise failover.unavailable()
+
+    async def generate_content_async(
+        self,
+        name,
+        thread,
+        assistant_tag,
+        user_tag,
+        status_callback=None,
+        *status_callback_args,
+        thread_id=None,
+        switch_llm=None,
+    ):
+        """Asyncio version of `generate_content()`. Hedges that lose are cancelled."""
+        callback_args = (status_callback, *status_callback_args)
+        failover = Failover(self, name, thread, assistant_tag, user_tag, thread_id)
+        for candidate, handler, prompt, key, response in failover:
+            if response is not None:
+                return response
+            hedge, delay = None, None
+            if candidate == name:
+                hedge, delay = self.hedge_for(name, name, thread, cancellable=True)
+
+            async def hedged():
+                handler, prompt, key = failover.get_prompt(hedge)
+                return await self.answer_async(
+                    hedge, handler, prompt, key, *callback_args
+                )
+
+            async def call(name=candidate, handler=handler, prompt=prompt, key=key):
+                response, won = await self.hedger.run_async(
+                    lambda: self.answer_async(
+                        name, handler, prompt, key, *callback_args
+                    ),
+                    hedge and hedged,
+                    delay,
+                )
+                if won:
+                    self.hedge_won(name, hedge, switch_llm)
+                return response
+
+            try:
+                if key is None:
+                    return await call()
+                return await self.in_flight.do_async(key, call)
+            except Exception as e:
+                failover.failed(candidate, e)
+        raise failover.unavailable()
+
+
+class Failover:
+    """
+    The LLMs that answer to a thread, the LLM of the thread followed by the ones
+    it fails over to, shared by the sync, streaming and asyncio calls.
+
+    Iterating it yields the name, handler, prompt, prompt key and cached response
+    (None if there is none, or if not `cached`) of each LLM in turn, skipping the
+    ones whose handler can't be built or whose circuit breaker is open. The errors of their calls are
+    passed to `failed()`, which re-raises them if they can't fail over.
+    """
+
+    def __init__(
+        self,
+        controller,
+        name,
+        thread,
+        assistant_tag,
+        user_tag,
+        thread_id,
+        cached=True,
+    ):
+        self.controller = controller
+        self.name = name
+        self.thread = thread
+        self.assistant_tag = assistant_tag
+        self.user_tag = user_tag
+        self.thread_id = thread_id
+        self.cached = cached
+        # the last error, the cause of LLMUnavailableError if no LLM answers
+        self.error = None
+
+    def get_prompt(self, name):
+        return self.controller.get_prompt(
+            name, self.thread, self.assistant_tag, self.user_tag, self.thread_id
+        )
+
+    def __iter__(self):
+        for candidate in self.controller.failover_order(self.name):
+            try:
+                handler, prompt, key = self.get_prompt(candidate)
+            except HandlerUnavailableError as e:
+                logging.warning("%s is unavailable, trying the next LLM" % candidate)
+                self.error = e
+                continue
+            response = None
+            if self.cached:
+                response = self.controller.cached_response(handler, prompt, key)
+            if response is None and not self.controller.breakers[candidate].allow():
+                continue
+            yield candidate, handler, prompt, key, response
+
+    def failed(self, name, error):
+        """Records the failed call of the LLM, or re-raises its error."""
+        if not self.controller.can_fail_over(name, error):
+            raise error
+        self.error = error
+
+    def unavailable(self):
+        """The error to raise when no LLM could answer."""
+        error = LLMUnavailableError("No LLM could answer to %s" % self.name)
+        error.__cause__ = self.error
+        return error
@@ -1,17 +1,27 @@
+import asyncio
 import os
 import logging
-from dotenv import load_dotenv
 
+from .http_pool import HTTP_PREWARM
 from .llm_controller import LLMController
+from .metrics import StatsLogger
 from .slack_handler import SlackHandler
-from .openai_handler import OpenAIHandler
-from .gemini_handler import GeminiHandler
-from .claude_handler import ClaudeHandler
+from .openai_handler import OPENAI_MAX_CONCURRENCY, OpenAIHandler
+from .gemini_handler import GEMINI_MAX_CONCURRENCY, GeminiHandler
+from .claude_handler import CLAUDE_MAX_CONCURRENCY, ClaudeHandler
 from slack_bolt.adapter.socket_mode import SocketModeHandler
-from .utils import load_json
+from .utils import load_env, load_json
 
-load_dotenv(os.path.join("config", ".env"))
+load_env()
 
+SLACK_BOT_TOKEN = os.getenv("SLACK_BOT_TOKEN")
+SLACK_APP_TOKEN = os.getenv("SLACK_APP_TOKEN")
+SIGNING_SECRET = os.getenv("SIGNING_SECRET")
+# Run on asyncio (AsyncApp) instead of a pool of worker threads
+GEPPETTO_ASYNC = os.getenv("GEPPETTO_ASYNC", "false").lower() == "true"
+# Build all the LLM handlers in the background once started, instead of only the
+# one of the default LLM, leaving the others to their first use
+LLM_WARM_UP = os.getenv("LLM_WARM_UP", "false").lower() == "true"
 
 DEFAULT_RESPONSES = load_json("default_responses.json")
 
@@ -20,7 +30,7 @@ DEFAULT_RESPONSES = load_json("default_responses.json")
 logging.basicConfig(level=logging.INFO)
 
 
-def initialized_llm_controller():
+def initialized_llm_controller(prewarm=False):
     controller = LLMController(
         [
             {
@@ -29,6 +39,7 @@ def initialized_llm_controller():
                 "handler_args": {
                     "personality": DEFAULT_RESPONSES["features"]["personality"]
                 },
+                "max_concurrency": OPENAI_MAX_CONCURRENCY,
             },
             {
                 "name": "Gemini",
@@ -36,6 +47,7 @@ def initialized_llm_controller():
                 "handler_args": {
                     "personality": DEFAULT_RESPONSES["features"]["personality"]
                 },
+                "max_concurrency": GEMINI_MAX_CONCURRENCY,
             },
             {
                 "name": "Claude",
@@ -43,21 +55,54 @@ def initialized_llm_controller():
                 "handler_args": {
                     "personality": DEFAULT_RESPONSES["features"]["personality"]
                 },
+                "max_concurrency": CLAUDE_MAX_CONCURRENCY,
             },
         ]
     )
     controller.init_controller()
+    if LLM_WARM_UP or prewarm:
+        controller.warm_up(prewarm=prewarm)
+    else:
+        # new threads go to the default LLM, the first one
+        controller.warm_up(names=controller.list_llms()[:1])
     return controller
 
 
+async def main_async():
+    # the asyncio stack of slack_bolt is slow to import, and only needed here
+    from .async_slack_handler import AsyncSlackHandler
+    from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
+
+    llm_controller = initialized_llm_controller()
+    Slack_Handler = AsyncSlackHandler(
+        load_json("allowed-slack-ids.json"),
+        DEFAULT_RESPONSES,
+        SLACK_BOT_TOKEN,
+        SIGNING_SECRET,
+        llm_controller,
+    )
+    StatsLogger(Slack_Handler.stats).start()
+    socket_mode = AsyncSocketModeHandler(Slack_Handler.app, SLACK_APP_TOKEN)
+    if HTTP_PREWARM:
+        # the connections of the asyncio clients belong to the event loop
+        await asyncio.gather(llm_controller.prewarm_async(), socket_mode.start_async())
+    else:
+        await socket_mode.start_async()
+
+
 def main():
+    if GEPPETTO_ASYNC:
+        asyncio.run(main_async())
+        return
+
     Slack_Handler = SlackHandler(
         load_json("allowed-slack-ids.json"),
         DEFAULT_RESPONSES,
         SLACK_BOT_TOKEN,
         SIGNING_SECRET,
-        initialized_llm_controller(),
+        initialized_llm_controller(prewarm=HTTP_PREWARM),
     )
+    StatsLogger(Slack_Handler.stats).start()
     SocketModeHandler(Slack_Handler.app, SLACK_APP_TOKEN).start()
 
 
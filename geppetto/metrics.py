@@ -0,0 +1,122 @@
+import json
+import logging
+import math
+import os
+import threading
+from collections import deque
+
+from .utils import load_env
+
+load_env()
+
+# latest calls of each LLM whose latencies are kept
+LATENCY_WINDOW = int(os.getenv("LATENCY_WINDOW", 200))
+# seconds between the logs of the stats, e.g. queue depth and limits, 0 to disable
+STATS_LOG_INTERVAL = float(os.getenv("STATS_LOG_INTERVAL", 60))
+
+
+class LatencyTracker:
+    """Seconds taken by the last `window` calls of each kind, e.g. of each LLM."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self.lock = threading.Lock()
+        # key -> deque of seconds
+        self.samples = {}
+
+    def record(self, key, seconds):
+        with self.lock:
+            samples = self.samples.get(key)
+            if samples is None:
+                samples = self.samples[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def count(self, key):
+        with self.lock:
+            return len(self.samples.get(key, ()))
+
+    def percentile(self, key, percent, min_samples=1):
+        """
+        Returns the `percent` percentile of the latencies of the key, or None if
+        there are fewer than `min_samples` of them.
+        """
+        with self.lock:
+            samples = sorted(self.samples.get(key, ()))
+        if not samples or len(samples) < min_samples:
+            return None
+        rank = max(1, math.ceil(percent / 100 * len(samples)))
+        return samples[min(rank, len(samples)) - 1]
+
+    def stats(self):
+        return {
+            key: {
+                "count": self.count(key),
+                "p50": self.percentile(key, 50),
+                "p99": self.percentile(key, 99),
+            }
+            for key in list(self.samples)
+        }
+
+
+class ErrorRateTracker:
+    """Share of the last `window` calls of each kind that failed."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self.lock = threading.Lock()
+        # key -> deque of whether each call failed
+        self.outcomes = {}
+
+    def record(self, key, failed):
+        with self.lock:
+            outcomes = self.outcomes.get(key)
+            if outcomes is None:
+                outcomes = self.outcomes[key] = deque(maxlen=self.window)
+            outcomes.append(failed)
+
+    def rate(self, key):
+        """The share of failed calls of the key, 0 if there are none."""
+        with self.lock:
+            outcomes = self.outcomes.get(key)
+            if not outcomes:
+                return 0.0
+            return sum(outcomes) / len(outcomes)
+
+    def stats(self):
+        return {key: self.rate(key) for key in list(self.outcomes)}
+
+
+class StatsLogger:
+    """Logs the stats returned by `source()` every `interval` seconds, as JSON."""
+
+    def __init__(self, source, interval=STATS_LOG_INTERVAL):
+        self.source = source
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def log(self):
+        try:
+            stats = self.source()
+        except Exception as e:
+            logging.error("Error collecting the stats: %s" % e)
+            return None
+        logging.info("Stats: %s" % json.dumps(stats, default=str, sort_keys=True))
+        return stats
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.log()
+
+    def start(self):
+        """Starts logging in a background thread, and returns it, unless disabled."""
+        if self.interval <= 0:
+            return None
+        self.thread = threading.Thread(
+            target=self.run, name="geppetto-stats", daemon=True
+        )
+        self.thread.start()
+        return self.thread
+
+    def stop(self):
+        self.stopped.set()
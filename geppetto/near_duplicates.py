@@ -0,0 +1,198 @@
+import hashlib
+import os
+import random
+import re
+from array import array
+
+from .cache import LRUCache
+from .response_cache import message_texts
+from .utils import load_env
+
+load_env()
+
+# seconds an answer is reused for similar first messages, 0 disables the index
+NEAR_DUPLICATE_TTL = float(os.getenv("NEAR_DUPLICATE_TTL", 0))
+# min share of words in common between similar messages
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", 0.9))
+NEAR_DUPLICATE_MAX_ENTRIES = int(os.getenv("NEAR_DUPLICATE_MAX_ENTRIES", 20000))
+# MinHash signature: BANDS bands of ROWS hashes each
+BANDS = 8
+ROWS = 4
+MERSENNE_PRIME = (1 << 61) - 1
+# hashes are truncated to 32 bits to keep the signatures small
+HASH_MASK = 0xFFFFFFFF
+# messages with fewer words are too short to tell similar ones apart
+MIN_WORDS = 3
+SLACK_MENTION = re.compile(r"<[@#!][^>]*>")
+WORD = re.compile(r"\w+")
+SENTENCE_END = re.compile(r"[.!?]")
+
+# (a, b) of the universal hash functions (a * x + b) % MERSENNE_PRIME
+_hash_rng = random.Random(0)
+HASH_PARAMS = [
+    (_hash_rng.randrange(1, MERSENNE_PRIME), _hash_rng.randrange(MERSENNE_PRIME))
+    for _ in range(BANDS * ROWS)
+]
+
+
+def message_features(text):
+    """The distinct words of a message, ignoring mentions and case."""
+    words = set(WORD.findall(SLACK_MENTION.sub(" ", text).casefold()))
+    if len(words) < MIN_WORDS:
+        return set()
+    return words
+
+
+def message_anchors(text):
+    """
+    The numbers and capitalized names of a message, e.g. "France", which similar
+    messages must share: "the capital of France" isn't "the capital of Spain".
+    Words starting a sentence, "I" and words with other capitals, e.g. "LLMs",
+    aren't names.
+    """
+    text = SLACK_MENTION.sub(" ", text)
+    anchors = set()
+    previous_end = None
+    for match in WORD.finditer(text):
+        word = match.group()
+        if word.isdigit():
+            anchors.add(word)
+        elif (
+            word[0].isupper()
+            and word[1:].islower()
+            and previous_end is not None
+            and not SENTENCE_END.search(text, previous_end, match.start())
+        ):
+            anchors.add(word.casefold())
+        previous_end = match.end()
+    return frozenset(anchors)
+
+
+def minhash(features):
+    """
+    Returns the MinHash signature of the features, as the bytes of its 32 bit
+    hashes. The share of equal hashes of two signatures estimates the Jaccard
+    similarity of their features.
+    """
+    signature = None
+    for feature in features:
+        x = int.from_bytes(
+            hashlib.blake2b(feature.encode(), digest_size=8).digest(), "big"
+        )
+        hashes = [(a * x + b) % MERSENNE_PRIME & HASH_MASK for a, b in HASH_PARAMS]
+        signature = hashes if signature is None else list(map(min, signature, hashes))
+    return array("I", signature).tobytes()
+
+
+def similarity(signature_a, signature_b):
+    hashes_a, hashes_b = array("I", signature_a), array("I", signature_b)
+    return sum(a == b for a, b in zip(hashes_a, hashes_b)) / len(hashes_a)
+
+
+def first_message_text(prompt):
+    """Returns the text of a prompt made only of the first message of a thread."""
+    if len(prompt) != 1:
+        return None
+    texts = message_texts(prompt[0])
+    return " ".join(texts) if texts else None
+
+
+class NearDuplicateIndex(LRUCache):
+    """
+    Answers to the first messages of threads, found by similar messages.
+
+    Messages are similar when at least `threshold` of their words are shared, as
+    estimated by their MinHash signatures, and they have the same numbers and names
+    (see `message_anchors()`). Signatures are indexed by bands of ROWS hashes (LSH),
+    so a message is only compared with the entries sharing a band with it, keeping
+    lookups fast with a large index (see scripts/bench_near_duplicates.py). Entries
+    take about 1.3 KB.
+
+    Answers are kept per provider, model and personality (`namespace`), and expire
+    `ttl` seconds after being stored.
+    """
+
+    def __init__(
+        self,
+        ttl=NEAR_DUPLICATE_TTL,
+        threshold=NEAR_DUPLICATE_THRESHOLD,
+        max_entries=NEAR_DUPLICATE_MAX_ENTRIES,
+        **kwargs,
+    ):
+        super().__init__(
+            max_entries=max_entries, ttl=ttl, refresh_on_access=False, **kwargs
+        )
+        self.threshold = threshold
+        # hash of (namespace, band, band hashes) -> key of the entry with it, which
+        # is (namespace, signature, anchors), or set of keys if there are several
+        self.buckets = {}
+
+    @staticmethod
+    def _buckets_of(namespace, signature, anchors=None):
+        band_size = ROWS * 4
+        return [
+            hash(
+                (namespace, band, signature[band * band_size : (band + 1) * band_size])
+            )
+            for band in range(BANDS)
+        ]
+
+    def _bucket_keys(self, bucket):
+        keys = self.buckets.get(bucket)
+        if keys is None:
+            return ()
+        return keys if isinstance(keys, set) else (keys,)
+
+    def _on_insert(self, key, value):
+        for bucket in self._buckets_of(*key):
+            keys = self.buckets.get(bucket)
+            if keys is None:
+                self.buckets[bucket] = key
+            elif isinstance(keys, set):
+                keys.add(key)
+            else:
+                self.buckets[bucket] = {keys, key}
+
+    def _on_remove(self, key, value, reason):
+        for bucket in self._buckets_of(*key):
+            keys = self.buckets[bucket]
+            if not isinstance(keys, set):
+                del self.buckets[bucket]
+                continue
+            keys.discard(key)
+            if len(keys) == 1:
+                self.buckets[bucket] = keys.pop()
+
+    def lookup(self, namespace, text):
+        """Returns the answer to the most similar message, None if there isn't any."""
+        features = message_features(text)
+        if not features:
+            return None
+        signature = minhash(features)
+        anchors = message_anchors(text)
+        with self.lock:
+            best_key, best_similarity = None, self.threshold
+            for bucket in self._buckets_of(namespace, signature):
+                for key in self._bucket_keys(bucket):
+                    if key[0] != namespace or key[2] != anchors:
+                        # same bucket hash for another namespace, or about others
+                        continue
+                    key_similarity = similarity(signature, key[1])
+                    if key_similarity >= best_similarity:
+                        best_key, best_similarity = key, key_similarity
+            if best_key is None:
+                self.misses += 1
+                return None
+            return self.get(best_key)
+
+    def add(self, namespace, text, answer):
+        features = message_features(text)
+        if features:
+            self[(namespace, minhash(features), message_anchors(text))] = answer
+
+
+def near_duplicate_index_from_env():
+    """Returns the near duplicate index configured by the environment, None if disabled."""
+    if NEAR_DUPLICATE_TTL <= 0:
+        return None
+    return NearDuplicateIndex()
@@ -1,23 +1,96 @@
-from io import BytesIO
+import asyncio
+import base64
 import json
-from openai import OpenAI
-from PIL import Image
-from urllib.request import urlopen
+from concurrent.futures import ThreadPoolExecutor
 import logging
 
+from .http_pool import http_package, shared_http_pool
+from .images import transcode, transcode_async
 from .llm_api_handler import LLMHandler
-from dotenv import load_dotenv
+from .routing import IMAGES, REASONING
+from .singleflight import SingleFlight
+from .tokens import estimate_tokens
+from .utils import LazyImport, load_env
 import os
 import re
 
-load_dotenv(os.path.join("config", ".env"))
+load_env()
+
+# the SDK is slow to import, and only needed once the handler is used
+openai = LazyImport("openai")
+OpenAI = LazyImport("openai", "OpenAI")
+AsyncOpenAI = LazyImport("openai", "AsyncOpenAI")
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 DALLE_MODEL = os.getenv("DALLE_MODEL")
+# images are sent in the responses as base64 with b64_json, instead of downloaded
+# from their url
+DALLE_RESPONSE_FORMAT = os.getenv("DALLE_RESPONSE_FORMAT", "b64_json")
 CHATGPT_MODEL = os.getenv("CHATGPT_MODEL")
 VERSION = os.getenv("GEPPETTO_VERSION")
+OPENAI_CONTEXT_BUDGET = int(os.getenv("OPENAI_CONTEXT_BUDGET", 16000))
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", 16))
+# images generated at once, on their own threads so that they don't hold the ones
+# answering messages
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", 4))
+# times the model can call tools before answering, running its calls of each round
+# at once on OPENAI_TOOL_WORKERS threads
+OPENAI_MAX_TOOL_ROUNDS = int(os.getenv("OPENAI_MAX_TOOL_ROUNDS", 3))
+OPENAI_TOOL_WORKERS = int(os.getenv("OPENAI_TOOL_WORKERS", 8))
 OPENAI_IMG_FUNCTION = "generate_image"
 ROLE_FIELD = "role"
+# output of the image tool calls, whose images are sent to the user instead
+IMAGE_TOOL_OUTPUT = "The image was generated and is being sent to the user."
+IMAGE_STATUS_MSG = (
+    "I'm preparing the image, please be patient :lower_left_paintbrush: ..."
+)
+OPENAI_TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": OPENAI_IMG_FUNCTION,
+            "description": "Generate an image from text",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "prompt": {"type": "string"},
+                    "size": {
+                        "type": "string",
+                        "enum": [
+                            "1024x1024",
+                            "1024x1792",
+                            "1792x1024",
+                        ],
+                    },
+                },
+                "required": ["prompt"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_functionalities",
+            "description": "Get app functionalities",
+        },
+    },
+]
+
+
+def as_tool_call(tool_call):
+    """The tool call of a response of the SDK, as sent back to the model."""
+    return {
+        "id": tool_call.id,
+        "type": "function",
+        "function": {
+            "name": tool_call.function.name,
+            "arguments": tool_call.function.arguments,
+        },
+    }
+
+
+def is_image_call(tool_call):
+    return tool_call["function"]["name"] == OPENAI_IMG_FUNCTION
 
 
 def convert_openai_markdown_to_slack(text):
@@ -53,25 +126,60 @@ def convert_openai_markdown_to_slack(text):
 
 
 class OpenAIHandler(LLMHandler):
+    capabilities = frozenset({IMAGES, REASONING})
 
     def __init__(
         self,
         personality,
+        http_pool=None,
     ):
-        super().__init__("OpenAI", CHATGPT_MODEL, OpenAI(api_key=OPENAI_API_KEY))
+        self.http_pool = http_pool or shared_http_pool()
+        self.http_package = http_package(openai)
+        super().__init__(
+            "OpenAI",
+            CHATGPT_MODEL,
+            OpenAI(
+                api_key=OPENAI_API_KEY,
+                http_client=self.http_pool.client(self.http_package),
+            ),
+        )
         self.dalle_model = DALLE_MODEL
         self.personality = personality
+        self.context_budget = OPENAI_CONTEXT_BUDGET
+        self.reserved_tokens = estimate_tokens(personality) + estimate_tokens(
+            json.dumps(OPENAI_TOOLS)
+        )
         self.system_role = "system"
         self.assistant_role = "assistant"
         self.user_role = "user"
+        self._async_client = None
+        # identical images being generated, by (prompt, size)
+        self.image_flights = SingleFlight()
+        self.image_jobs = ThreadPoolExecutor(
+            IMAGE_WORKERS, thread_name_prefix="geppetto-image"
+        )
+        self.tool_jobs = ThreadPoolExecutor(
+            OPENAI_TOOL_WORKERS, thread_name_prefix="geppetto-tool"
+        )
 
-    @staticmethod
-    def download_image(url):
-        img = Image.open(urlopen(url=url))
-        img_byte_arr = BytesIO()
-        img.save(img_byte_arr, format="PNG")
-        img_byte_arr = img_byte_arr.getvalue()
-        return img_byte_arr
+    def download_image(self, url):
+        return transcode(self.http_pool.get(url, self.http_package))
+
+    async def download_image_async(self, url):
+        return await transcode_async(
+            await self.http_pool.get_async(url, self.http_package)
+        )
+
+    def image_bytes(self, image):
+        """The bytes to upload of a generated image, sent as base64 or at its url."""
+        if getattr(image, "b64_json", None):
+            return transcode(base64.b64decode(image.b64_json))
+        return self.download_image(image.url)
+
+    async def image_bytes_async(self, image):
+        if getattr(image, "b64_json", None):
+            return await transcode_async(base64.b64decode(image.b64_json))
+        return await self.download_image_async(image.url)
 
     @staticmethod
     def get_functionalities():
@@ -82,95 +190,259 @@ class OpenAIHandler(LLMHandler):
             ]
         )
 
+    @property
+    def async_client(self):
+        """AsyncOpenAI client used by the asyncio runtime, created on first use."""
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI(
+                api_key=OPENAI_API_KEY,
+                http_client=self.http_pool.async_client(self.http_package),
+            )
+        return self._async_client
+
+    def prewarm(self):
+        return self.http_pool.prewarm(str(self.client.base_url), self.http_package)
+
+    async def prewarm_async(self):
+        return await self.http_pool.prewarm_async(
+            str(self.async_client.base_url), self.http_package
+        )
+
     def generate_image(self, prompt, size="1024x1024"):
+        """Generates an image, sharing the generation with identical requests in flight."""
+        return self.image_flights.do(
+            (prompt, size), self.generate_new_image, prompt, size
+        )
+
+    def submit_image(self, prompt, size="1024x1024"):
+        """Generates an image in the background. Returns a Future of its bytes."""
+        return self.image_jobs.submit(self.generate_image, prompt, size)
+
+    async def generate_image_async(self, prompt, size="1024x1024"):
+        return await self.image_flights.do_async(
+            (prompt, size), self.generate_new_image_async, prompt, size
+        )
+
+    def generate_new_image(self, prompt, size="1024x1024"):
         logging.info("Generating image: %s with size: %s" % (prompt, size))
         try:
-            response_url = self.client.images.generate(
+            response = self.client.images.generate(
                 model=self.dalle_model,
                 prompt=prompt,
                 size=size,
                 quality="standard",
                 n=1,
+                response_format=DALLE_RESPONSE_FORMAT,
             )
-            return self.download_image(response_url.data[0].url)
+            return self.image_bytes(response.data[0])
         except Exception as e:
             logging.error(f"Error generating image: {e}")
 
-    def llm_generate_content(
-        self, user_prompt, status_callback=None, *status_callback_args
-    ):
-        logging.info("Sending msg to chatgpt: %s" % user_prompt)
-        tools = [
-            {
-                "type": "function",
-                "function": {
-                    "name": OPENAI_IMG_FUNCTION,
-                    "description": "Generate an image from text",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "prompt": {"type": "string"},
-                            "size": {
-                                "type": "string",
-                                "enum": [
-                                    "1024x1024",
-                                    "1024x1792",
-                                    "1792x1024",
-                                ],
-                            },
-                        },
-                        "required": ["prompt"],
-                    },
-                },
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "get_functionalities",
-                    "description": "Get app functionalities",
-                },
-            },
-        ]
-        # Initial conversation message
-        messages = [
+    async def generate_new_image_async(self, prompt, size="1024x1024"):
+        logging.info("Generating image: %s with size: %s" % (prompt, size))
+        try:
+            response = await self.async_client.images.generate(
+                model=self.dalle_model,
+                prompt=prompt,
+                size=size,
+                quality="standard",
+                n=1,
+                response_format=DALLE_RESPONSE_FORMAT,
+            )
+            return await self.image_bytes_async(response.data[0])
+        except Exception as e:
+            logging.error(f"Error generating image: {e}")
+
+    def get_messages(self, user_prompt):
+        """Initial conversation messages: the personality followed by the prompt."""
+        return [
             {
                 "role": self.system_role,
                 "content": self.personality,
             },
             *user_prompt,
         ]
+
+    def format_response(self, response):
+        markdown_response = convert_openai_markdown_to_slack(response)
+        if len(markdown_response) > 4000:
+            # Split the message if it's too long
+            response_parts = self.split_message(markdown_response)
+            return response_parts
+        else:
+            return markdown_response
+
+    def with_images(self, content, images):
+        """The formatted response of the model, followed by the images it generated."""
+        response = self.format_response(content or "")
+        if not images:
+            return response
+        return [*(response if isinstance(response, list) else [response]), *images]
+
+    def tool_choice(self, tool_round):
+        """The last round can't call tools, so that the model ends with an answer."""
+        return "auto" if tool_round < OPENAI_MAX_TOOL_ROUNDS else "none"
+
+    def call_tool(self, tool_call):
+        """
+        Runs a function requested by the model with its JSON encoded arguments.
+        Images are generated in the background, returning a Future of their bytes.
+        """
+        available_functions = {
+            OPENAI_IMG_FUNCTION: self.submit_image,
+            "get_functionalities": self.get_functionalities,
+        }
+        function = tool_call["function"]
+        function_args = json.loads(function["arguments"] or "{}")
+        return available_functions[function["name"]](**function_args)
+
+    async def call_tool_async(self, tool_call):
+        if is_image_call(tool_call):
+            function_args = json.loads(tool_call["function"]["arguments"] or "{}")
+            return await self.generate_image_async(**function_args)
+        return self.call_tool(tool_call)
+
+    def tool_messages(self, tool_calls, results):
+        """
+        Returns the messages telling the model the outputs of its tool calls, and
+        the images they generated, which are sent to the user instead.
+        """
+        messages = [
+            {"role": self.assistant_role, "content": None, "tool_calls": tool_calls}
+        ]
+        images = []
+        for tool_call, result in zip(tool_calls, results):
+            if is_image_call(tool_call):
+                images.append(result)
+                result = IMAGE_TOOL_OUTPUT
+            messages.append(
+                {"role": "tool", "tool_call_id": tool_call["id"], "content": result}
+            )
+        return messages, images
+
+    def run_tools(self, tool_calls, status_callback=None, *status_callback_args):
+        """Runs the tool calls of the model at once. Returns `tool_messages()`."""
+        if status_callback and any(is_image_call(call) for call in tool_calls):
+            status_callback(*status_callback_args, IMAGE_STATUS_MSG)
+        results = list(self.tool_jobs.map(self.call_tool, tool_calls))
+        return self.tool_messages(tool_calls, results)
+
+    async def run_tools_async(
+        self, tool_calls, status_callback=None, *status_callback_args
+    ):
+        if status_callback and any(is_image_call(call) for call in tool_calls):
+            await status_callback(*status_callback_args, IMAGE_STATUS_MSG)
+        results = await asyncio.gather(*map(self.call_tool_async, tool_calls))
+        return self.tool_messages(tool_calls, results)
+
+    def llm_generate_content(
+        self, user_prompt, status_callback=None, *status_callback_args
+    ):
+        logging.info("Sending msg to chatgpt: %s" % user_prompt)
+        messages = self.get_messages(user_prompt)
+        images = []
+        for tool_round in range(OPENAI_MAX_TOOL_ROUNDS + 1):
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                tools=OPENAI_TOOLS,
+                tool_choice=self.tool_choice(tool_round),
+            )
+            message = response.choices[0].message
+            if not message.tool_calls or tool_round == OPENAI_MAX_TOOL_ROUNDS:
+                break
+            tool_messages, tool_images = self.run_tools(
+                [as_tool_call(call) for call in message.tool_calls],
+                status_callback,
+                *status_callback_args,
+            )
+            messages = [*messages, *tool_messages]
+            images.extend(tool_images)
+        return self.with_images(message.content, images)
+
+    def llm_generate_text(self, user_prompt):
         response = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            tools=tools,
-            tool_choice="auto",
+            model=self.model, messages=self.get_messages(user_prompt)
         )
-        # Handle the tool calls
-        tool_calls = response.choices[0].message.tool_calls
-        if tool_calls:
-            available_functions = {
-                OPENAI_IMG_FUNCTION: self.generate_image,
-                "get_functionalities": self.get_functionalities,
-            }
-            tool_call = tool_calls[0]
-            function_name = tool_call.function.name
-            function_args = json.loads(tool_call.function.arguments)
-            function = available_functions[function_name]
-
-            if function_name == OPENAI_IMG_FUNCTION and status_callback:
-                status_callback(
-                    *status_callback_args,
-                    "I'm preparing the image, please be patient "
-                    ":lower_left_paintbrush: ...",
-                )
-            response = function(**function_args)
-            return response
-        else:
-            response = response.choices[0].message.content
-            markdown_response = convert_openai_markdown_to_slack(response)
-            if len(markdown_response) > 4000:
-                # Split the message if it's too long
-                response_parts = self.split_message(markdown_response)
-                return response_parts
-            else:
-                return markdown_response
+        return response.choices[0].message.content
+
+    async def llm_generate_text_async(self, user_prompt):
+        response = await self.async_client.chat.completions.create(
+            model=self.model, messages=self.get_messages(user_prompt)
+        )
+        return response.choices[0].message.content
+
+    def llm_generate_content_stream(
+        self, user_prompt, status_callback=None, *status_callback_args
+    ):
+        logging.info("Streaming msg to chatgpt: %s" % user_prompt)
+        messages = self.get_messages(user_prompt)
+        images = []
+        # the text of every round, as it was all streamed
+        text = []
+        for tool_round in range(OPENAI_MAX_TOOL_ROUNDS + 1):
+            stream = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                tools=OPENAI_TOOLS,
+                tool_choice=self.tool_choice(tool_round),
+                stream=True,
+            )
+            # tool call index -> tool call, received in fragments
+            tool_calls = {}
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                for fragment in delta.tool_calls or []:
+                    tool_call = tool_calls.setdefault(
+                        fragment.index,
+                        {
+                            "id": "",
+                            "type": "function",
+                            "function": {"name": "", "arguments": ""},
+                        },
+                    )
+                    tool_call["id"] += fragment.id or ""
+                    tool_call["function"]["name"] += fragment.function.name or ""
+                    tool_call["function"]["arguments"] += (
+                        fragment.function.arguments or ""
+                    )
+                if delta.content:
+                    text.append(delta.content)
+                    yield delta.content
+            if not tool_calls or tool_round == OPENAI_MAX_TOOL_ROUNDS:
+                break
+            tool_messages, tool_images = self.run_tools(
+                [tool_calls[index] for index in sorted(tool_calls)],
+                status_callback,
+                *status_callback_args,
+            )
+            messages = [*messages, *tool_messages]
+            images.extend(tool_images)
+        return self.with_images("".join(text), images)
+
+    async def llm_generate_content_async(
+        self, user_prompt, status_callback=None, *status_callback_args
+    ):
+        logging.info("Sending msg to chatgpt: %s" % user_prompt)
+        messages = self.get_messages(user_prompt)
+        images = []
+        for tool_round in range(OPENAI_MAX_TOOL_ROUNDS + 1):
+            response = await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                tools=OPENAI_TOOLS,
+                tool_choice=self.tool_choice(tool_round),
+            )
+            message = response.choices[0].message
+            if not message.tool_calls or tool_round == OPENAI_MAX_TOOL_ROUNDS:
+                break
+            tool_messages, tool_images = await self.run_tools_async(
+                [as_tool_call(call) for call in message.tool_calls],
+                status_callback,
+                *status_callback_args,
+            )
+            messages = [*messages, *tool_messages]
+            images.extend(tool_images)
+        return self.with_images(message.content, images)
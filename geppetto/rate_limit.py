@@ -0,0 +1,163 @@
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter.
+
+    Args:
+        rate (float): Tokens added per second.
+        capacity (float): Maximum number of tokens, i.e. the allowed burst.
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens=1):
+        """Takes the tokens if available. Returns whether they were taken."""
+        with self.lock:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def reserve(self, tokens=1):
+        """
+        Takes the tokens, going into debt if needed, and returns the seconds
+        to wait before using them.
+        """
+        with self.lock:
+            self._refill()
+            self.tokens -= tokens
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self, tokens=1, sleep=time.sleep):
+        """Blocks until the tokens are available and takes them."""
+        wait = self.reserve(tokens)
+        if wait:
+            sleep(wait)
+
+
+def is_throttling_error(error):
+    """Tells whether an exception of an API client means it was rate limited (429)."""
+    return 429 in (getattr(error, "status_code", None), getattr(error, "code", None))
+
+
+class AIMDLimiter:
+    """
+    Concurrency limiter that tunes its limit by additive increase, multiplicative
+    decrease (AIMD), like TCP congestion control.
+
+    The limit starts at `max_limit`. A throttled call multiplies it by `decrease`,
+    once for all the calls that were running at that point. Calls during which the
+    limiter got full add `increase / limit`, growing the limit by about
+    `increase` per round of calls, up to `max_limit`. Calls slower than
+    `latency_target` seconds, if set, don't increase it.
+    """
+
+    def __init__(
+        self,
+        max_limit,
+        min_limit=1,
+        increase=1.0,
+        decrease=0.5,
+        latency_target=0,
+        clock=time.monotonic,
+    ):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.clock = clock
+        self.limit = float(max_limit)
+        self.in_use = 0
+        self.waiting = 0
+        # decreases so far, calls started before the last one don't decrease it again
+        self.epoch = 0
+        self.throttled = 0
+        # times the limiter got full
+        self.saturations = 0
+        self.cond = threading.Condition()
+
+    def _take(self):
+        token = self.epoch, self.saturations, self.clock()
+        self.in_use += 1
+        if self.in_use >= int(self.limit):
+            self.saturations += 1
+        return token
+
+    def try_acquire(self):
+        """Takes a slot if available. Returns its token, to be released, or None."""
+        with self.cond:
+            if self.in_use < int(self.limit):
+                return self._take()
+            return None
+
+    def acquire(self):
+        """Blocks until a slot is available and takes it. Returns its token."""
+        with self.cond:
+            self.waiting += 1
+            try:
+                while self.in_use >= int(self.limit):
+                    self.cond.wait()
+            finally:
+                self.waiting -= 1
+            return self._take()
+
+    async def acquire_async(self, poll_interval=0.05):
+        """Asyncio version of `acquire()`, checking for a free slot periodically."""
+        token = self.try_acquire()
+        if token is not None:
+            return token
+        with self.cond:
+            self.waiting += 1
+        try:
+            while token is None:
+                await asyncio.sleep(poll_interval)
+                token = self.try_acquire()
+        finally:
+            with self.cond:
+                self.waiting -= 1
+        return token
+
+    def release(self, token, throttled=False):
+        """Frees the slot taken with `token`, adjusting the limit with the outcome."""
+        epoch, saturations, started = token
+        with self.cond:
+            was_full = saturations != self.saturations
+            self.in_use -= 1
+            if throttled:
+                self.throttled += 1
+                if epoch == self.epoch:
+                    self.epoch += 1
+                    self.limit = max(self.min_limit, self.limit * self.decrease)
+            elif was_full and (
+                not self.latency_target or self.clock() - started <= self.latency_target
+            ):
+                self.limit = min(
+                    self.max_limit, self.limit + self.increase / self.limit
+                )
+            self.cond.notify_all()
+
+    def stats(self):
+        with self.cond:
+            return {
+                "limit": int(self.limit),
+                "in_use": self.in_use,
+                "waiting": self.waiting,
+                "throttled": self.throttled,
+            }
@@ -0,0 +1,127 @@
+import os
+import random
+import threading
+import time
+
+from .rate_limit import is_throttling_error
+from .utils import load_env
+
+load_env()
+
+# retries of an LLM call failing with a transient error, before failing over
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))
+# seconds of the first backoff, doubled on every retry up to the max
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", 0.5))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", 8))
+# consecutive transient errors opening the circuit breaker of an LLM
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", 5))
+# seconds an open breaker waits before letting a trial call through
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", 30))
+
+# status codes of the errors worth retrying: timeout, throttling and server errors
+TRANSIENT_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+# the SDKs of the providers raise these when the API can't be reached
+TRANSIENT_ERROR_NAMES = ("Timeout", "Connection", "ServiceUnavailable", "Overloaded")
+
+
+def is_transient_error(e):
+    """Whether the error of an LLM call may not happen again if retried."""
+    if is_throttling_error(e) or isinstance(e, (TimeoutError, ConnectionError)):
+        return True
+    for field in ("status_code", "code"):
+        status = getattr(e, field, None)
+        if isinstance(status, int) and status in TRANSIENT_STATUS_CODES:
+            return True
+    return any(
+        part in cls.__name__
+        for cls in type(e).__mro__
+        for part in TRANSIENT_ERROR_NAMES
+    )
+
+
+class RetryPolicy:
+    """
+    Bounded retries with exponential backoff and full jitter: the n-th retry waits
+    a random time up to `base_delay * 2 ** n`, capped to `max_delay`, so the
+    callers failing at once don't retry at once.
+    """
+
+    def __init__(
+        self,
+        max_retries=LLM_MAX_RETRIES,
+        base_delay=LLM_RETRY_BASE_DELAY,
+        max_delay=LLM_RETRY_MAX_DELAY,
+        rng=random.random,
+    ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rng = rng
+
+    def delay(self, retry):
+        """Seconds to wait before the retry number `retry`, counting from 0."""
+        return self.rng() * min(self.max_delay, self.base_delay * 2**retry)
+
+
+class CircuitBreaker:
+    """
+    Stops calling an API after `failures` consecutive transient errors.
+
+    The breaker is closed while the calls succeed. When it opens, calls aren't
+    allowed for `cooldown` seconds, and then a single trial call is (half open):
+    the breaker closes if it succeeds and opens again if it fails. A trial that
+    doesn't report back in `cooldown` seconds is replaced by another one.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failures=LLM_BREAKER_FAILURES,
+        cooldown=LLM_BREAKER_COOLDOWN,
+        clock=time.monotonic,
+    ):
+        self.max_failures = failures
+        self.cooldown = cooldown
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        # time the breaker opened, or the trial call started when half open
+        self.since = 0
+        self.opened = 0
+
+    def allow(self):
+        """Whether a call can be made now. Its outcome must be recorded."""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.clock() - self.since < self.cooldown:
+                return False
+            self.state = self.HALF_OPEN
+            self.since = self.clock()
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.max_failures:
+                if self.state != self.OPEN:
+                    self.opened += 1
+                self.state = self.OPEN
+                self.since = self.clock()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "opened": self.opened,
+            }
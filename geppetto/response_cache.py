@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+
+from .cache import LRUCache
+from .utils import load_env
+
+load_env()
+
+# seconds a response is reused, 0 disables the cache
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 0))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1000))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 10 * 1024 * 1024))
+ROLE_FIELD = "role"
+# fields holding the text of a prompt message, depending on the LLM
+TEXT_FIELDS = ("content", "parts")
+
+
+def normalize_text(text):
+    return " ".join(text.split()).casefold()
+
+
+def handler_identity(handler):
+    """The provider, model and personality of a handler, which shape its responses."""
+    return handler.name, handler.model, getattr(handler, "personality", None)
+
+
+def message_texts(msg):
+    """Returns the texts of a prompt message, or None if it has anything else."""
+    if set(msg) - {ROLE_FIELD, *TEXT_FIELDS}:
+        return None
+    texts = [msg[field] for field in TEXT_FIELDS if field in msg]
+    if len(texts) == 1 and isinstance(texts[0], list):
+        texts = texts[0]
+    if not all(isinstance(text, str) for text in texts):
+        return None
+    return texts
+
+
+def prompt_key(handler, prompt):
+    """
+    Returns a hash of the normalized prompt, the model and the personality of the
+    handler, or None if the prompt has anything but text, e.g. images or tool calls.
+    """
+    normalized = []
+    for msg in prompt:
+        texts = message_texts(msg)
+        if texts is None:
+            return None
+        normalized.append([msg.get(ROLE_FIELD), [normalize_text(t) for t in texts]])
+    data = json.dumps([*handler_identity(handler), normalized], default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def is_text_response(response):
+    if isinstance(response, list):
+        return bool(response) and all(isinstance(part, str) for part in response)
+    return isinstance(response, str)
+
+
+class ResponseCache(LRUCache):
+    """
+    Text responses of the LLMs, keyed by `prompt_key()`. Entries expire `ttl` seconds
+    after being stored, however often they are used.
+    """
+
+    def __init__(
+        self,
+        ttl=RESPONSE_CACHE_TTL,
+        max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+        max_bytes=RESPONSE_CACHE_MAX_BYTES,
+        **kwargs,
+    ):
+        super().__init__(
+            max_entries=max_entries,
+            max_bytes=max_bytes,
+            ttl=ttl,
+            refresh_on_access=False,
+            **kwargs,
+        )
+
+    def _measure(self, response):
+        parts = response if isinstance(response, list) else [response]
+        return sum(len(part.encode()) for part in parts)
+
+    def store(self, key, response):
+        """Stores the response if it is text. Returns whether it was stored."""
+        if key is None or not is_text_response(response):
+            return False
+        self[key] = response
+        return True
+
+
+def response_cache_from_env():
+    """Returns the response cache configured by the environment, None if disabled."""
+    if RESPONSE_CACHE_TTL <= 0:
+        return None
+    return ResponseCache()
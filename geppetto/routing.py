@@ -0,0 +1,97 @@
+import logging
+import os
+import re
+import threading
+
+from .tokens import estimate_tokens
+from .utils import load_env
+
+load_env()
+
+# whether the LLM of new threads without a llm_ tag is chosen by routing
+LLM_ROUTING = os.getenv("LLM_ROUTING", "false").lower() == "true"
+# tokens from which a message is routed to the LLMs good at reasoning
+ROUTING_LONG_PROMPT_TOKENS = int(os.getenv("ROUTING_LONG_PROMPT_TOKENS", 300))
+# capabilities the handlers may declare
+IMAGES = "images"
+REASONING = "reasoning"
+# messages likely asking for an image, in English or Spanish
+IMAGE_REQUEST = re.compile(
+    r"\b(image|picture|photo|drawing|draw|illustration|logo|sketch|paint"
+    r"|imagen|foto|dibuj|ilustraci|pint)\w*",
+    re.IGNORECASE,
+)
+# highest error rate counted, so LLMs that always fail keep a finite cost
+MAX_ERROR_RATE = 0.95
+
+
+class Router:
+    """
+    Chooses the LLM of the new threads from what their first message needs and
+    how the LLMs are doing.
+
+    Messages asking for an image go to the LLMs with the IMAGES capability, and
+    the ones of at least `long_prompt_tokens` to the LLMs with REASONING. Among
+    those, or among all if none has the capability, the one expected to answer
+    the fastest is chosen: the one with the lowest latency (the median, or the
+    95th percentile for long prompts) divided by its share of successful calls.
+    LLMs without latencies yet are chosen first, so that all get measured.
+    """
+
+    def __init__(
+        self,
+        latencies,
+        errors,
+        enabled=LLM_ROUTING,
+        long_prompt_tokens=ROUTING_LONG_PROMPT_TOKENS,
+    ):
+        self.latencies = latencies
+        self.errors = errors
+        self.enabled = enabled
+        self.long_prompt_tokens = long_prompt_tokens
+        self.lock = threading.Lock()
+        # name -> threads routed to the LLM
+        self.routed = {}
+
+    def needs(self, text):
+        """The capabilities needed to answer the message."""
+        needs = set()
+        if IMAGE_REQUEST.search(text):
+            needs.add(IMAGES)
+        if estimate_tokens(text) >= self.long_prompt_tokens:
+            needs.add(REASONING)
+        return needs
+
+    def expected_latency(self, name, percent):
+        latency = self.latencies.percentile(name, percent)
+        if latency is None:
+            return 0.0
+        return latency / (1 - min(self.errors.rate(name), MAX_ERROR_RATE))
+
+    def route(self, text, llms):
+        """
+        Returns the name of the LLM to answer the message, given the names and
+        capabilities of the available `llms`, or None if there are none.
+        """
+        if not llms:
+            return None
+        needs = self.needs(text)
+        capable = [name for name, capabilities in llms if needs <= set(capabilities)]
+        if not capable:
+            # the ones with most of the capabilities needed
+            best = max(len(needs & set(capabilities)) for _, capabilities in llms)
+            capable = [
+                name
+                for name, capabilities in llms
+                if len(needs & set(capabilities)) == best
+            ]
+        percent = 95 if REASONING in needs else 50
+        name = min(capable, key=lambda name: self.expected_latency(name, percent))
+        with self.lock:
+            self.routed[name] = self.routed.get(name, 0) + 1
+        logging.info("Routing a new thread needing %s to %s" % (needs or "-", name))
+        return name
+
+    def stats(self):
+        with self.lock:
+            return dict(self.routed)
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs the call,
+    and the ones arriving while it is in flight wait for it and get its result,
+    or its exception.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key -> Future of the call in flight
+        self.calls = {}
+        # key -> asyncio.Future of the coroutine in flight
+        self.async_calls = {}
+        self.coalesced = 0
+
+    def join(self, key):
+        """
+        Returns the Future of the call in flight for the key and whether the caller
+        must run the call, i.e. it is the first one. Then it must call `done()`.
+        """
+        with self.lock:
+            future = self.calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self.calls[key] = Future()
+            return future, True
+
+    def done(self, key, future, result=None, error=None):
+        """Ends the call in flight for the key, handing its outcome to the waiters."""
+        with self.lock:
+            del self.calls[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn, *args, **kwargs):
+        """Returns `fn(*args, **kwargs)`, sharing the call with the concurrent ones."""
+        future, leader = self.join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self.done(key, future, error=e)
+            raise
+        self.done(key, future, result)
+        return result
+
+    async def do_async(self, key, fn, *args, **kwargs):
+        """Asyncio version of `do()`, where `fn` is a coroutine function."""
+        future = self.async_calls.get(key)
+        if future is not None:
+            self.coalesced += 1
+            # a cancelled waiter must not cancel the shared call
+            return await asyncio.shield(future)
+        future = self.async_calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn(*args, **kwargs)
+        except asyncio.CancelledError:
+            del self.async_calls[key]
+            future.cancel()
+            raise
+        except BaseException as e:
+            del self.async_calls[key]
+            future.set_exception(e)
+            # retrieved by the caller, even if there are no waiters
+            future.exception()
+            raise
+        del self.async_calls[key]
+        future.set_result(result)
+        return result
+
+    def stats(self):
+        return {
+            "in_flight": len(self.calls) + len(self.async_calls),
+            "coalesced": self.coalesced,
+        }
@@ -1,9 +1,25 @@
+import functools
 import logging
 import os
+from concurrent.futures import Future
 from slack_bolt import App
 import certifi
 import re
 
+from geppetto.admission import AdmissionControl
+from geppetto.dispatcher import SLACK_LANES, SLACK_LONG_CONTEXT_TOKENS
+from geppetto.dispatcher import Dispatcher, parse_lanes
+from geppetto.event_dedup import SeenEvents
+from geppetto.exceptions import LLMUnavailableError
+from geppetto.fairness import SenderLimits
+from geppetto.hedging import LLM_HEDGE_SWITCH_THREADS
+from geppetto.history_store import history_backend_from_env
+from geppetto.slack_outbox import SlackOutbox
+from geppetto.routing import IMAGE_REQUEST
+from geppetto.summarizer import Summarizer
+from geppetto.streaming import SLACK_STREAM_RESPONSES, StreamedMessage, consume_stream
+from geppetto.thread_store import HEDGE_SWITCH_FIELD, LLM_FIELD, ThreadStore
+from geppetto.tokens import CHARS_PER_TOKEN, estimate_tokens
 from geppetto.utils import is_image_data, lower_string_list
 
 # Set SSL certificate for secure requests
@@ -12,6 +28,31 @@ os.environ["SSL_CERT_FILE"] = certifi.where()
 # UI roles
 USER = "slack_user"
 ASSISTANT = "geppetto"
+# lanes of the dispatcher the messages are handled in, see SLACK_LANES
+COMMAND_LANE = "command"
+DM_LANE = "dm"
+MENTION_LANE = "mention"
+LONG_LANE = "long"
+IMAGE_LANE = "image"
+
+POSTING_ERROR_MSG = "There was an error when posting the message."
+LLMS_LIST_ERROR_MSG = "There was an error when posting llms list."
+# answers to the commands setting whether hedges may switch the LLM of a thread
+HEDGE_SWITCH_MSGS = {
+    True: "Other LLMs answering faster than the one of this thread may replace it.",
+    False: "The LLM of this thread won't be replaced by faster ones.",
+}
+SLOW_DOWN_MSG = (
+    "You're sending messages faster than I can answer them, "
+    "please slow down and try again in a moment."
+)
+BUSY_MSG = "I'm busy right now, please try again shortly."
+LLM_ERROR_MSG = "There was an error generating the response, please try again."
+IMAGE_ERROR_MSG = "The image couldn't be generated, please try again later."
+LLM_UNAVAILABLE_MSG = (
+    "Unfortunately, we're currently unable to generate a response, "
+    "the LLM APIs may be experiencing issues. Please try again later."
+)
 
 
 class SlackHandler:
@@ -23,20 +64,83 @@ class SlackHandler:
         SLACK_BOT_TOKEN,
         SIGNING_SECRET,
         llm_controller,
+        thread_store=None,
+        dispatcher=None,
+        stream_responses=SLACK_STREAM_RESPONSES,
+        rate_limits=None,
+        summarizer=None,
+        sender_limits=None,
+        admission=None,
     ):
         """
         Slack Handler receives messages from the slack channel and sends responses back.
         It also handles commands.
+
+        The conversation of each thread is kept in `thread_store`, a bounded
+        `ThreadStore` built from the environment settings if not provided
+        (persisted to SQLite when HISTORY_DB_PATH is set).
+
+        Messages are handled by `dispatcher` on a pool of SLACK_WORKERS threads,
+        one at a time per slack thread, with the channels and their users taking
+        turns. Users over their rate in `sender_limits`, or in a channel over its
+        rate, are asked to slow down instead. The allowed users can be given a
+        weight, e.g. {"id": "U123", "weight": 2}, to get more turns and a higher rate.
+        Commands, direct messages and mentions are handled ahead of the messages
+        likely asking for an image or with a long context, each in a lane with
+        workers reserved to it (see `message_lane()`). When too many messages are
+        waiting, or one waited too long, `admission` sheds them with a reply that
+        the bot is busy.
+
+        If `stream_responses` is set, the thought balloon is edited with the
+        response while it is being generated.
+
+        Web API calls go through a `SlackOutbox` that keeps them within `rate_limits`
+        (Slack's tier limits by default) and retries them when throttled.
+
+        Once answered, long threads are summarized in the background by `summarizer`.
         """
         self.name = "Geppetto Slack handler"
         self.llm_ctrl = llm_controller
         self.llm = llm_controller.handlers
-        self.app = App(signing_secret=SIGNING_SECRET, token=SLACK_BOT_TOKEN)
+        self.app = self.create_app(SIGNING_SECRET, SLACK_BOT_TOKEN)
+        self.client = self.create_client(rate_limits)
         self.allowed_users = allowed_users
         self.bot_default_responses = bot_default_responses
-        self.thread_messages = {}
-        self.commands = {"llms": self.list_llms}
+        if thread_store is None:
+            thread_store = ThreadStore(backend=history_backend_from_env())
+        # the prompts of the threads evicted aren't kept either
+        thread_store.on_evict = llm_controller.forget_thread
+        self.thread_messages = thread_store
+        if dispatcher is None:
+            dispatcher = self.create_dispatcher()
+        self.dispatcher = dispatcher
+        self.sender_limits = sender_limits or SenderLimits()
+        self.admission = admission or AdmissionControl()
+        self.stream_responses = stream_responses
+        self.seen_events = SeenEvents()
+        if summarizer is None:
+            summarizer = self.create_summarizer()
+        self.summarizer = summarizer
+        self.commands = {
+            "llms": self.list_llms,
+            "hedge_switch_on": self.allow_hedge_switch,
+            "hedge_switch_off": self.deny_hedge_switch,
+        }
+        self.register_listeners()
+
+    def create_app(self, signing_secret, token):
+        return App(signing_secret=signing_secret, token=token)
+
+    def create_client(self, rate_limits):
+        return SlackOutbox(self.app.client, rate_limits)
 
+    def create_dispatcher(self):
+        return Dispatcher(weight=self.group_weight, lanes=parse_lanes(SLACK_LANES))
+
+    def create_summarizer(self):
+        return Summarizer(self.llm_ctrl, self.thread_messages, ASSISTANT, USER)
+
+    def register_listeners(self):
         # Direct Message Event
         @self.app.event("message")
         def handle_direct_messages(body):
@@ -47,6 +151,54 @@ class SlackHandler:
         def handle_app_mentions(body):
             self.handle_event(body)
 
+    def get_thread_history(self, thread_id):
+        return self.thread_messages.get(thread_id, {"llm": "", "msgs": []})
+
+    def get_command(self, msg):
+        """Returns the command requested in the message, or None if it is not a command."""
+        # when using the command,
+        # msg_copy can be ['llms'] or ['<@...>', 'llms']
+        # so we get the last element
+        msg_copy = msg.split()
+        command = msg_copy[-1]
+        if len(msg_copy) <= 2 and command in self.commands:
+            return command
+        return None
+
+    def add_user_message(self, msg, thread_id, thread_history):
+        """
+        Adds a general message to the thread and returns the LLM that must answer it.
+        If the message switches the LLM of the thread, the previous conversation is
+        dumped except for its first message, along with its cached prompts.
+        """
+        selected_llm = self.select_llm_from_msg(msg, thread_history["llm"])
+        current_usr_msg = {"role": USER, "content": msg}
+
+        if thread_history["llm"] == "":
+            thread_history["llm"] = selected_llm
+
+        if thread_history["llm"] == selected_llm:
+            thread_history["msgs"].append(current_usr_msg)
+        else:
+            thread_history["llm"] = selected_llm
+            thread_history["msgs"] = [thread_history["msgs"][0], current_usr_msg]
+            self.llm_ctrl.forget_thread(thread_id)
+        return selected_llm
+
+    def add_response(self, response_from_llm_api, thread_id, thread_history):
+        """
+        Adds the text responses to the thread and stores it. Of the responses in
+        parts, e.g. a long text split or a text with images, the text is added.
+        """
+        if isinstance(response_from_llm_api, list):
+            texts = [part for part in response_from_llm_api if isinstance(part, str)]
+            response_from_llm_api = "".join(texts) if texts else None
+        if isinstance(response_from_llm_api, str):
+            thread_history["msgs"].append(
+                {"role": ASSISTANT, "content": response_from_llm_api}
+            )
+        self.thread_messages[thread_id] = thread_history
+
     def handle_command(self, command, channel_id, thread_id, thread_history):
         """
         Selects the function to handle the specified command.
@@ -56,16 +208,23 @@ class SlackHandler:
         """
         current_msg = {"role": USER, "content": command}
         thread_history["msgs"].append(current_msg)
-        response = self.commands[command](channel_id, thread_id)
-        thread_history["msgs"].append({"role": ASSISTANT, "content": response})
+        # stored for the commands that change the thread
         self.thread_messages[thread_id] = thread_history
+        response = self.commands[command](channel_id, thread_id)
+        self.add_response(response, thread_id, thread_history)
 
-    def handle_message(self, msg, channel_id, thread_id):
+    def handle_message(self, msg, channel_id, thread_id, ticket=None, lane=None):
         """
         Receives a message from the slack channel and distincs if it is a command or a message.
         If it is a command, it calls the `handle_command()` function.
         If it is not, it generates a response using the selected LLM and post it.
+        Messages admitted with a `ticket` that waited too long are answered that the
+        bot is busy instead. The summary of the thread is applied in the `lane` of the
+        message, so it can't wait behind the reservations of the other lanes.
         """
+        if ticket is not None and not self.admission.start(ticket):
+            self.send_busy_message(channel_id, thread_id)
+            return
         logging.info(
             "Authorized user - Msg received: %s in channel: %s and thread: %s",
             msg,
@@ -73,57 +232,102 @@ class SlackHandler:
             thread_id,
         )
         msg = msg.strip()  # deleting extra spaces
+        thread_history = self.get_thread_history(thread_id)
+        command = self.get_command(msg)
 
-        # when using the command,
-        # msg_copy can be ['llms'] or ['<@...>', 'llms']
-        # so we get the last element
-        msg_copy = msg.split()
-        command = msg_copy[-1]
-
-        if len(msg_copy) <= 2 and command in self.commands:
-            thread_history = self.thread_messages.get(
-                thread_id, {"llm": "", "msgs": []}
-            )
+        if command:
             self.handle_command(command, channel_id, thread_id, thread_history)
         else:
             # This branch handles general messages
-            thread_history = self.thread_messages.get(
-                thread_id, {"llm": "", "msgs": []}
-            )
-            selected_llm = self.select_llm_from_msg(msg, thread_history["llm"])
-            current_usr_msg = {"role": USER, "content": msg}
-
-            if thread_history["llm"] == "":
-                thread_history["llm"] = selected_llm
-
-            if thread_history["llm"] == selected_llm:
-                thread_history["msgs"].append(current_usr_msg)
-            else:
-                thread_history["llm"] = selected_llm
-                thread_history["msgs"] = [thread_history["msgs"][0], current_usr_msg]
+            selected_llm = self.add_user_message(msg, thread_id, thread_history)
             # send_thought_balloon() tells the user that their message is being processed
             timestamp = self.send_thought_balloon(channel_id, thread_id)
-            response_from_llm_api = self.use_prompt_from_thread(
-                selected_llm, thread_history, channel_id, thread_id
-            )
+            try:
+                if self.stream_responses and timestamp:
+                    response_from_llm_api = self.stream_prompt_from_thread(
+                        selected_llm, thread_history, channel_id, thread_id, timestamp
+                    )
+                else:
+                    response_from_llm_api = self.use_prompt_from_thread(
+                        selected_llm, thread_history, channel_id, thread_id
+                    )
+            except LLMUnavailableError as e:
+                logging.error("No LLM could answer: %s", e.__cause__ or e)
+                response_from_llm_api = LLM_UNAVAILABLE_MSG
+            except Exception as e:
+                # e.g. a request rejected by the API, which isn't failed over
+                logging.exception("Error generating the response: %s", e)
+                response_from_llm_api = LLM_ERROR_MSG
             self.post_response(
                 response_from_llm_api, channel_id, thread_id, thread_history, timestamp
             )
+            self.summarizer.submit(
+                thread_id,
+                thread_history,
+                functools.partial(self.dispatcher.submit, lane=lane),
+            )
+
+    def hedge_switcher(self, thread_history):
+        """
+        Returns the function switching the thread to the LLM of a hedged request
+        that answered it, or None if the thread doesn't allow it.
+        """
+        if not thread_history.get(HEDGE_SWITCH_FIELD, LLM_HEDGE_SWITCH_THREADS):
+            return None
+
+        def switch_llm(llm):
+            logging.info("Switching thread to %s, which answered faster" % llm)
+            thread_history[LLM_FIELD] = llm
+
+        return switch_llm
 
     def use_prompt_from_thread(
         self, selected_llm, thread_history, channel_id, thread_id
     ):
         """Gets prompt from the thread and generates a response using the selected LLM."""
-        prompt = self.llm[selected_llm].get_prompt_from_thread(
-            thread_history["msgs"], ASSISTANT, USER
+        return self.llm_ctrl.generate_content(
+            selected_llm,
+            thread_history["msgs"],
+            ASSISTANT,
+            USER,
+            self.send_message,
+            channel_id,
+            thread_id,
+            thread_id=thread_id,
+            switch_llm=self.hedge_switcher(thread_history),
         )
-        return self.llm[selected_llm].llm_generate_content(
-            prompt,
+
+    def stream_prompt_from_thread(
+        self, selected_llm, thread_history, channel_id, thread_id, timestamp
+    ):
+        """
+        Like `use_prompt_from_thread()`, but shows the response in the message
+        with the given timestamp while it is being generated.
+        """
+        stream = self.llm_ctrl.generate_content_stream(
+            selected_llm,
+            thread_history["msgs"],
+            ASSISTANT,
+            USER,
             self.send_message,
             channel_id,
             thread_id,
+            thread_id=thread_id,
+            switch_llm=self.hedge_switcher(thread_history),
         )
 
+        def update_message(text):
+            return self.client.chat_update(
+                channel=channel_id, text=text, thread_ts=thread_id, ts=timestamp
+            )
+
+        response = consume_stream(stream, StreamedMessage(update_message).push)
+        if isinstance(response, list) and response:
+            # the first part replaces the streamed text, the rest is posted apart
+            update_message(response[0])
+            response = response[1:]
+        return response
+
     def send_thought_balloon(self, channel_id, thread_id):
         """
         Sends a thought balloon to the slack channel to indicate the user
@@ -141,16 +345,32 @@ class SlackHandler:
     def post_response(
         self, response_from_llm_api, channel_id, thread_id, thread_history, timestamp
     ):
-        """Tries to post the response generated by the llm to the slack channel."""
-        try:
-            if isinstance(response_from_llm_api, str):
-                thread_history["msgs"].append(
-                    {"role": ASSISTANT, "content": response_from_llm_api}
+        """
+        Tries to post the response generated by the llm to the slack channel.
+        Responses still being generated in the background, as Futures, are posted
+        once done, in turn with the messages of the thread.
+        """
+        if isinstance(response_from_llm_api, Future):
+            response_from_llm_api.add_done_callback(
+                lambda job: self.dispatcher.submit(
+                    thread_id,
+                    self.post_job_response,
+                    job,
+                    channel_id,
+                    thread_id,
+                    timestamp,
+                    lane=IMAGE_LANE,
                 )
-            self.thread_messages[thread_id] = thread_history
+            )
+            return
+        if response_from_llm_api is None:
+            # the handlers return None when the image couldn't be generated
+            response_from_llm_api = IMAGE_ERROR_MSG
+        try:
+            self.add_response(response_from_llm_api, thread_id, thread_history)
 
             if is_image_data(response_from_llm_api):
-                self.app.client.files_upload_v2(
+                self.client.files_upload_v2(
                     channel=channel_id,
                     thread_ts=thread_id,
                     content=response_from_llm_api,
@@ -165,7 +385,13 @@ class SlackHandler:
                 # If there are multiple parts, send each part separately
                 if isinstance(response_from_llm_api, list):
                     for part in response_from_llm_api:
-                        self.app.client.chat_postMessage(
+                        if not isinstance(part, str):
+                            # images generated along with the answer
+                            self.post_response(
+                                part, channel_id, thread_id, thread_history, timestamp
+                            )
+                            continue
+                        self.client.chat_postMessage(
                             channel=channel_id,
                             text=part,
                             thread_ts=thread_id,
@@ -173,7 +399,7 @@ class SlackHandler:
                         )
                 else:
                     # If it is a single message, send it normally
-                    self.app.client.chat_update(
+                    self.client.chat_update(
                         channel=channel_id,
                         text=response_from_llm_api,
                         thread_ts=thread_id,
@@ -181,16 +407,23 @@ class SlackHandler:
                     )
         except Exception as e:
             logging.error("Error posting message: %s", e)
-            error_msg = "There was an error when posting the message."
-            thread_history["msgs"].append({"role": ASSISTANT, "content": error_msg})
-            self.thread_messages[thread_id] = thread_history
+            error_msg = POSTING_ERROR_MSG
+            self.add_response(error_msg, thread_id, thread_history)
             self.send_message(channel_id, thread_id, error_msg)
 
-    def handle_event(self, body):
-        """
-        Receives an event from the slack channel and checks if the user that sent the message is allowed to interact with the Geppetto.
-        If the user is allowed, it calls the `handle_message()` function.
-        """
+    def post_job_response(self, job, channel_id, thread_id, timestamp):
+        """Posts the response of a background job, e.g. an image, on its thread."""
+        try:
+            response = job.result()
+        except Exception as e:
+            logging.error("Error generating the response in the background: %s", e)
+            response = LLM_UNAVAILABLE_MSG
+        thread_history = self.get_thread_history(thread_id)
+        self.post_response(response, channel_id, thread_id, thread_history, timestamp)
+
+    @staticmethod
+    def parse_event(body):
+        """Returns the message, channel, thread and user of a slack event."""
         event = body["event"]
         msg = event["text"]
         channel_id = event["channel"]
@@ -199,29 +432,147 @@ class SlackHandler:
 
         logging.info("Received event: %s" % event)
         logging.info("%s: %s" % (user_id, msg))
+        return msg, channel_id, thread_id, user_id
+
+    def is_duplicate_event(self, body):
+        if self.seen_events.is_duplicate(body):
+            logging.info(
+                "Dropping duplicate event %s (%s dropped so far)"
+                % (body.get("event_id"), self.seen_events.stats()["dropped"])
+            )
+            return True
+        return False
+
+    def allowed_entries(self):
+        """The member id and weight of each allowed user, "*" standing for anyone."""
+        for entry in self.allowed_users.values():
+            if isinstance(entry, dict):
+                yield entry.get("id"), entry.get("weight", 1)
+            else:
+                yield entry, 1
 
+    def is_allowed(self, user_id):
         # Check if user is allowed or * as wildcard to all users
-        if "*" in self.allowed_users.values() or user_id in self.allowed_users.values():
-            self.handle_message(msg, channel_id, thread_id)
-        else:
-            permission_denied_message = self.bot_default_responses["user"][
-                "permission_denied"
-            ]
+        return any(member in ("*", user_id) for member, _ in self.allowed_entries())
+
+    def user_weight(self, user_id):
+        """The weight of the user in the allow-list, or the one of "*" if not listed."""
+        weights = {member: weight for member, weight in self.allowed_entries()}
+        return weights.get(user_id, weights.get("*", 1))
+
+    def group_weight(self, group):
+        """Turns in a row of a (channel, user) group in the dispatcher."""
+        return self.user_weight(group[1]) if len(group) == 2 else 1
+
+    def message_lane(self, body):
+        """
+        The lane of the dispatcher of a message: a command, a message likely asking
+        for an image, one whose thread in memory and itself are long, a direct
+        message, or any other mention.
+        """
+        event = body["event"]
+        msg = event["text"].strip()
+        if msg and self.get_command(msg):
+            return COMMAND_LANE
+        if IMAGE_REQUEST.search(msg):
+            return IMAGE_LANE
+        thread_id = event.get("thread_ts", None) or event["ts"]
+        thread_tokens = self.thread_messages.memory_size(thread_id) // CHARS_PER_TOKEN
+        if estimate_tokens(msg) + thread_tokens >= SLACK_LONG_CONTEXT_TOKENS:
+            return LONG_LANE
+        if event.get("channel_type") == "im" or event["channel"].startswith("D"):
+            return DM_LANE
+        return MENTION_LANE
+
+    def get_default_response(self, section, name, default):
+        return self.bot_default_responses.get(section, {}).get(name, default)
+
+    def send_busy_message(self, channel_id, thread_id):
+        return self.send_message(
+            channel_id,
+            thread_id,
+            self.get_default_response("user", "busy", BUSY_MSG),
+            "busy",
+        )
+
+    def stats(self):
+        """
+        Returns the messages waiting and shed, the senders over their rate, the
+        lanes of the workers and the stats of the LLMs, e.g. their concurrency limits.
+        """
+        stats = {
+            "admission": self.admission.stats(),
+            "senders": self.sender_limits.stats(),
+            "duplicate_events": self.seen_events.stats(),
+            "llms": self.llm_ctrl.stats(),
+        }
+        if self.dispatcher is not None:
+            stats["lanes"] = self.dispatcher.stats()
+        return stats
+
+    def handle_event(self, body):
+        """
+        Receives an event from the slack channel and checks if the user that sent the message is allowed to interact with the Geppetto.
+        If the user is allowed, it schedules the `handle_message()` function in the dispatcher,
+        after the messages of the same thread that are still being handled, in the turn
+        of the channel and the user within the lane of the message. Users over their
+        rate are asked to slow down, and everyone is told the bot is busy when too
+        many messages are waiting.
+        Events delivered more than once are dropped.
+        """
+        if self.is_duplicate_event(body):
+            return
+        msg, channel_id, thread_id, user_id = self.parse_event(body)
+
+        if not self.is_allowed(user_id):
+            self.send_message(
+                channel_id,
+                thread_id,
+                self.bot_default_responses["user"]["permission_denied"],
+                "permission_denied",
+            )
+        elif not self.sender_limits.allow(
+            user_id, channel_id, self.user_weight(user_id)
+        ):
             self.send_message(
-                channel_id, thread_id, permission_denied_message, "permission_denied"
+                channel_id,
+                thread_id,
+                self.get_default_response("user", "slow_down", SLOW_DOWN_MSG),
+                "slow_down",
+            )
+        else:
+            ticket = self.admission.admit()
+            if ticket is None:
+                self.send_busy_message(channel_id, thread_id)
+                return
+            lane = self.message_lane(body)
+            # the lane of the message is passed by position, `lane=` is the one
+            # of the dispatcher
+            self.dispatcher.submit(
+                thread_id,
+                self.handle_message,
+                msg,
+                channel_id,
+                thread_id,
+                ticket,
+                lane,
+                group=(channel_id, user_id),
+                lane=lane,
             )
 
     def send_message(self, channel_id, thread_id, message, tag="general"):
         """Sends message to the slack channel."""
         logging.info("Sending %s message: %s" % (tag, message))
-        return self.app.client.chat_postMessage(
+        return self.client.chat_postMessage(
             channel=channel_id, text=message, thread_ts=thread_id, mrkdwn=True
         )
 
     def select_llm_from_msg(self, message, last_llm=""):
         """
-        Selects the LLM from the message. If the LLM is not specified, the default LLM is chosen.
-        In this case, ChatGPT.
+        Selects the LLM from the message. If the LLM is not specified, the one of the
+        thread is kept, and new threads are routed to the LLM that suits the message
+        best if routing is enabled. Otherwise, the default LLM is chosen. In this
+        case, ChatGPT.
         """
         mentions = re.findall(r"(?<=\bllm_)\w+", message)
         clean_mentions = [
@@ -236,32 +587,59 @@ class SlackHandler:
             return controlled_llms[controlled_llms_l.index(check_list[0])]
         elif len(check_list) == 0 and last_llm != "":
             return last_llm
-        else:
-            # default first LLM
-            return controlled_llms[0]
+        elif len(check_list) == 0:
+            # new threads are routed, if enabled
+            routed_llm = self.llm_ctrl.route(message)
+            if routed_llm:
+                return routed_llm
+        # default first LLM
+        return controlled_llms[0]
 
     def list_llms(self, channel_id, thread_id):
         """
         Implementation of 'llms' command.
         Lists all available LLMs and sends it to the slack channel.
         """
-        availables_assistants = self.llm_ctrl.list_llms()
-        format_msg = ["Here are the available AI models!"]
-
-        for assistant in availables_assistants:
-            format_msg.append(f"* {assistant} -> llm_{assistant.lower()}")
-
-        reminder = "Example: Using 'llm_gemini' at the start of your message to Geppetto switches to gemini model."
-        format_msg.append(reminder)
-        formated_msg = "\n".join(format_msg)
+        formated_msg = self.get_llms_list_message()
         logging.info("Sending list_llms command %s")
         response = self.send_message(channel_id, thread_id, formated_msg)
         if response["ok"]:
             timestamp = response["message"]["ts"]
-            self.app.client.chat_update(
+            self.client.chat_update(
                 channel=channel_id, text=formated_msg, thread_ts=thread_id, ts=timestamp
             )
         else:
             logging.error("Failed to post message")
-            formated_msg = "There was an error when posting llms list."
+            formated_msg = LLMS_LIST_ERROR_MSG
         return formated_msg
+
+    def set_hedge_switch(self, thread_id, allowed):
+        """Sets whether the LLM of the thread may switch to faster ones."""
+        thread_history = self.thread_messages[thread_id]
+        thread_history[HEDGE_SWITCH_FIELD] = allowed
+        # persisted with the thread, like its LLM
+        self.thread_messages[thread_id] = thread_history
+        return HEDGE_SWITCH_MSGS[allowed]
+
+    def allow_hedge_switch(self, channel_id, thread_id):
+        """Implementation of 'hedge_switch_on' command."""
+        msg = self.set_hedge_switch(thread_id, True)
+        self.send_message(channel_id, thread_id, msg)
+        return msg
+
+    def deny_hedge_switch(self, channel_id, thread_id):
+        """Implementation of 'hedge_switch_off' command."""
+        msg = self.set_hedge_switch(thread_id, False)
+        self.send_message(channel_id, thread_id, msg)
+        return msg
+
+    def get_llms_list_message(self):
+        availables_assistants = self.llm_ctrl.list_llms()
+        format_msg = ["Here are the available AI models!"]
+
+        for assistant in availables_assistants:
+            format_msg.append(f"* {assistant} -> llm_{assistant.lower()}")
+
+        reminder = "Example: Using 'llm_gemini' at the start of your message to Geppetto switches to gemini model."
+        format_msg.append(reminder)
+        return "\n".join(format_msg)
@@ -0,0 +1,139 @@
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+from slack_sdk.errors import SlackApiError
+
+from .cache import LRUCache
+from .rate_limit import TokenBucket
+from .utils import load_env
+
+load_env()
+
+SLACK_MAX_RETRIES = int(os.getenv("SLACK_MAX_RETRIES", 3))
+SLACK_RETRY_JITTER = float(os.getenv("SLACK_RETRY_JITTER", 1.0))
+# Web API method -> (requests per minute, burst), per channel
+SLACK_RATE_LIMITS = {
+    # special tier: 1 message per second per channel, allowing short bursts
+    "chat_postMessage": (60, 5),
+    # tier 3
+    "chat_update": (50, 10),
+    # tier 2
+    "files_upload_v2": (20, 3),
+}
+MAX_BUCKETS = 10000
+
+
+class PendingUpdate:
+    def __init__(self, kwargs):
+        self.kwargs = kwargs
+        self.future = Future()
+
+
+class SlackOutbox:
+    """
+    Delivers the Slack Web API calls of the bot without exceeding Slack's rate limits.
+
+    Calls are delayed by a token bucket per method and channel sized after the
+    method tier in `rate_limits`. When Slack answers 429 anyway, the call is
+    retried after the `Retry-After` time plus a random jitter. Edits of the same
+    message that pile up while waiting are merged: only the newest text is sent
+    and every caller gets its response.
+
+    Any `WebClient` method can be called on the outbox, e.g. `outbox.chat_postMessage(...)`.
+    """
+
+    def __init__(
+        self,
+        client,
+        rate_limits=None,
+        max_retries=SLACK_MAX_RETRIES,
+        jitter=SLACK_RETRY_JITTER,
+        sleep=time.sleep,
+    ):
+        self.client = client
+        self.rate_limits = SLACK_RATE_LIMITS if rate_limits is None else rate_limits
+        self.max_retries = max_retries
+        self.jitter = jitter
+        self.sleep = sleep
+        self.buckets = LRUCache(max_entries=MAX_BUCKETS)
+        self.lock = threading.Lock()
+        # (channel, ts) -> PendingUpdate
+        self.pending_updates = {}
+        self.retries = 0
+        self.merged_updates = 0
+
+    def __getattr__(self, method):
+        if method.startswith("_"):
+            raise AttributeError(method)
+        return lambda **kwargs: self.call(method, **kwargs)
+
+    def _bucket(self, method, channel):
+        if method not in self.rate_limits:
+            return None
+        with self.buckets.lock:
+            bucket = self.buckets.get((method, channel))
+            if bucket is None:
+                per_minute, burst = self.rate_limits[method]
+                bucket = TokenBucket(per_minute / 60, burst)
+                self.buckets[(method, channel)] = bucket
+            return bucket
+
+    def call(self, method, **kwargs):
+        """Calls a Web API method, waiting for the rate limits and retrying if throttled."""
+        bucket = self._bucket(method, kwargs.get("channel"))
+        attempt = 0
+        while True:
+            if bucket is not None:
+                bucket.acquire(sleep=self.sleep)
+            try:
+                return getattr(self.client, method)(**kwargs)
+            except SlackApiError as e:
+                if e.response.status_code != 429 or attempt >= self.max_retries:
+                    raise
+                retry_after = float(e.response.headers.get("Retry-After", 1))
+                attempt += 1
+                self.retries += 1
+                logging.warning(
+                    "Slack rate limited %s, retrying in %s seconds"
+                    % (method, retry_after)
+                )
+                self.sleep(retry_after + random.uniform(0, self.jitter))
+
+    def chat_update(self, **kwargs):
+        key = (kwargs.get("channel"), kwargs.get("ts"))
+        with self.lock:
+            pending = self.pending_updates.get(key)
+            if pending is not None:
+                # an update of the same message is waiting, send this text instead
+                pending.kwargs = kwargs
+                self.merged_updates += 1
+                leader = False
+            else:
+                pending = self.pending_updates[key] = PendingUpdate(kwargs)
+                leader = True
+        if not leader:
+            return pending.future.result()
+
+        try:
+            while True:
+                with self.lock:
+                    sent_kwargs = pending.kwargs
+                response = self.call("chat_update", **sent_kwargs)
+                with self.lock:
+                    if pending.kwargs is sent_kwargs:
+                        del self.pending_updates[key]
+                        break
+        except Exception as e:
+            with self.lock:
+                self.pending_updates.pop(key, None)
+            pending.future.set_exception(e)
+            raise
+        pending.future.set_result(response)
+        return response
+
+    def stats(self):
+        return {"retries": self.retries, "merged_updates": self.merged_updates}
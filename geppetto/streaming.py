@@ -0,0 +1,71 @@
+import logging
+import os
+import time
+
+from .utils import load_env
+
+load_env()
+
+SLACK_STREAM_RESPONSES = os.getenv("SLACK_STREAM_RESPONSES", "false").lower() == "true"
+STREAM_UPDATE_INTERVAL_MS = int(os.getenv("STREAM_UPDATE_INTERVAL_MS", 1200))
+STREAM_UPDATE_MIN_CHARS = int(os.getenv("STREAM_UPDATE_MIN_CHARS", 40))
+STREAMING_SUFFIX = " :writing_hand:"
+
+
+class StreamedMessage:
+    """
+    Shows a response in a slack message while it is being generated.
+
+    `update(text)` is called with the text received so far, but only once at
+    least `interval_ms` milliseconds passed since the previous edit and at least
+    `min_chars` new characters arrived, so the edits stay within the
+    `chat.update` rate limits however fast the deltas come.
+    """
+
+    def __init__(
+        self,
+        update,
+        interval_ms=STREAM_UPDATE_INTERVAL_MS,
+        min_chars=STREAM_UPDATE_MIN_CHARS,
+        clock=time.monotonic,
+    ):
+        self.update = update
+        self.interval = interval_ms / 1000
+        self.min_chars = min_chars
+        self.clock = clock
+        self.parts = []
+        self.length = 0
+        self.shown_length = 0
+        self.last_update = clock()
+        self.updates = 0
+
+    def push(self, delta):
+        """Adds a delta of the response, editing the message if it's time to."""
+        self.parts.append(delta)
+        self.length += len(delta)
+        now = self.clock()
+        if (
+            now - self.last_update >= self.interval
+            and self.length - self.shown_length >= self.min_chars
+        ):
+            try:
+                self.update("".join(self.parts) + STREAMING_SUFFIX)
+            except Exception as e:
+                # partial edits are best effort, the final response is posted anyway
+                logging.warning("Error updating streamed message: %s" % e)
+            self.shown_length = self.length
+            self.last_update = now
+            self.updates += 1
+
+
+def consume_stream(stream, on_delta):
+    """
+    Iterates a response stream from `LLMHandler.llm_generate_content_stream()`,
+    calling `on_delta` with each text delta, and returns the final response.
+    """
+    while True:
+        try:
+            delta = next(stream)
+        except StopIteration as stop:
+            return stop.value
+        on_delta(delta)
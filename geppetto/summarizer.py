@@ -0,0 +1,189 @@
+import logging
+import os
+import re
+import threading
+
+from .dispatcher import Dispatcher
+from .thread_store import MSGS_FIELD, LLM_FIELD, CONTENT_FIELD
+from .utils import load_env
+
+load_env()
+
+# LLM writing the summaries, the one of the thread if empty
+SUMMARY_LLM = os.getenv("SUMMARY_LLM", "")
+SUMMARY_AFTER_MESSAGES = int(os.getenv("SUMMARY_AFTER_MESSAGES", 40))
+SUMMARY_KEEP_MESSAGES = int(os.getenv("SUMMARY_KEEP_MESSAGES", 10))
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", 2))
+SUMMARY_INSTRUCTIONS = (
+    "Summarize the following conversation between a user and an assistant. "
+    "Keep the facts, decisions and open questions needed to continue it, "
+    "in the language of the conversation. Answer only with the summary.\n\n%s"
+)
+SUMMARY_INTRO = "Summary of the conversation so far:\n"
+# footer added by the handlers to their responses
+SOURCE_FOOTER = re.compile(r"\n\n_\(Geppetto v.*\)_\s*$", re.DOTALL)
+
+
+def strip_footer(text):
+    return SOURCE_FOOTER.sub("", text)
+
+
+class Summarizer:
+    """
+    Replaces the older messages of long threads by a summary.
+
+    Once a thread has more than `after_messages`, all but its last `keep_messages`
+    are summarized by the `llm` of `llm_controller`, or by the LLM of the thread if
+    not set, on a pool of `workers` threads. The calls go through the controller, so
+    they share the limits, retries and failover of the messages, but without tools
+    nor the response caches. The summary
+    replaces those messages only if the thread still starts with them by then,
+    prepended to the first kept message, so that the roles still alternate.
+    """
+
+    def __init__(
+        self,
+        llm_controller,
+        thread_store,
+        assistant_tag,
+        user_tag,
+        llm=SUMMARY_LLM,
+        after_messages=SUMMARY_AFTER_MESSAGES,
+        keep_messages=SUMMARY_KEEP_MESSAGES,
+        workers=SUMMARY_WORKERS,
+    ):
+        self.llm_ctrl = llm_controller
+        self.thread_store = thread_store
+        self.assistant_tag = assistant_tag
+        self.user_tag = user_tag
+        self.llm = llm
+        self.after_messages = after_messages
+        self.keep_messages = keep_messages
+        self.dispatcher = Dispatcher(workers, name="geppetto-summarizer")
+        self.lock = threading.Lock()
+        # threads being summarized
+        self.pending = set()
+        self.summarized = 0
+
+    def start(self, thread_id, thread_history):
+        """
+        Returns the LLM and the messages to summarize if the thread is due, and
+        marks it as being summarized. Returns None otherwise.
+        """
+        msgs = thread_history[MSGS_FIELD]
+        if self.after_messages <= 0 or len(msgs) <= self.after_messages:
+            return None
+        # the kept messages start with a user message
+        cut = len(msgs) - max(1, self.keep_messages)
+        while cut > 1 and msgs[cut]["role"] != self.user_tag:
+            cut -= 1
+        if cut <= 1:
+            return None
+        with self.lock:
+            if thread_id in self.pending:
+                return None
+            self.pending.add(thread_id)
+        return self.llm or thread_history[LLM_FIELD], msgs[:cut]
+
+    def summary_thread(self, msgs):
+        """The thread asking for a summary of the messages."""
+        conversation = "\n\n".join(
+            "%s: %s"
+            % (
+                "Assistant" if msg["role"] == self.assistant_tag else "User",
+                strip_footer(msg[CONTENT_FIELD]),
+            )
+            for msg in msgs
+        )
+        return [{"role": self.user_tag, "content": SUMMARY_INSTRUCTIONS % conversation}]
+
+    @staticmethod
+    def summary_text(summary):
+        if isinstance(summary, list):
+            summary = "".join(part for part in summary if isinstance(part, str))
+        if not isinstance(summary, str) or not summary.strip():
+            return None
+        return strip_footer(summary)
+
+    def summarize(self, llm, msgs):
+        """Asks the LLM for a summary of the messages. Returns None if it fails."""
+        try:
+            return self.summary_text(
+                self.llm_ctrl.generate_text(
+                    llm, self.summary_thread(msgs), self.assistant_tag, self.user_tag
+                )
+            )
+        except Exception as e:
+            logging.error("Error summarizing a thread with %s: %s" % (llm, e))
+            return None
+
+    async def summarize_async(self, llm, msgs):
+        """Asyncio version of `summarize()`."""
+        try:
+            return self.summary_text(
+                await self.llm_ctrl.generate_text_async(
+                    llm, self.summary_thread(msgs), self.assistant_tag, self.user_tag
+                )
+            )
+        except Exception as e:
+            logging.error("Error summarizing a thread with %s: %s" % (llm, e))
+            return None
+
+    def finish(self, thread_id):
+        """Marks the thread as no longer being summarized."""
+        with self.lock:
+            self.pending.discard(thread_id)
+
+    def apply(self, thread_id, msgs, summary):
+        """
+        Replaces the summarized messages of the thread. Must run when no message of
+        the thread is being handled.
+        """
+        try:
+            if summary is None:
+                return False
+            thread_history = self.thread_store.get(thread_id)
+            current_msgs = thread_history and thread_history[MSGS_FIELD]
+            if not current_msgs or len(current_msgs) <= len(msgs):
+                return False
+            if any(a is not b for a, b in zip(current_msgs, msgs)):
+                # the thread was reset meanwhile
+                return False
+            first, *rest = current_msgs[len(msgs) :]
+            summary_msg = {
+                **first,
+                CONTENT_FIELD: "%s%s\n\n%s"
+                % (SUMMARY_INTRO, summary, first[CONTENT_FIELD]),
+            }
+            thread_history[MSGS_FIELD] = [summary_msg, *rest]
+            self.thread_store.rewrite(thread_id, thread_history)
+            self.llm_ctrl.forget_thread(thread_id)
+            self.summarized += 1
+            logging.info("Summarized %s messages of thread %s" % (len(msgs), thread_id))
+            return True
+        finally:
+            self.finish(thread_id)
+
+    def submit(self, thread_id, thread_history, schedule):
+        """
+        Summarizes the thread in the background if it is due. The summary is applied
+        by `schedule(thread_id, fn, *args)`, which must serialize it with the
+        handling of the messages of the thread, e.g. `Dispatcher.submit`.
+        """
+        started = self.start(thread_id, thread_history)
+        if started is None:
+            return None
+        llm, msgs = started
+
+        def run():
+            scheduled = False
+            try:
+                summary = self.summarize(llm, msgs)
+                schedule(thread_id, self.apply, thread_id, msgs, summary)
+                scheduled = True
+            finally:
+                # otherwise `apply()` does it
+                if not scheduled:
+                    self.finish(thread_id)
+
+        return self.dispatcher.submit(thread_id, run)
@@ -0,0 +1,148 @@
+import os
+import logging
+
+from .cache import LRUCache
+from .utils import load_env
+
+load_env()
+
+THREAD_STORE_MAX_THREADS = int(os.getenv("THREAD_STORE_MAX_THREADS", 1000))
+THREAD_STORE_MAX_MESSAGES = int(os.getenv("THREAD_STORE_MAX_MESSAGES", 20000))
+THREAD_STORE_MAX_BYTES = int(os.getenv("THREAD_STORE_MAX_BYTES", 50 * 1024 * 1024))
+THREAD_STORE_IDLE_TTL = float(os.getenv("THREAD_STORE_IDLE_TTL", 7 * 24 * 3600))
+LLM_FIELD = "llm"
+# whether the LLM of the thread may switch to a hedge that answered faster
+HEDGE_SWITCH_FIELD = "hedge_switch"
+MSGS_FIELD = "msgs"
+CONTENT_FIELD = "content"
+
+
+def thread_size(thread_history):
+    """Approximates the memory held by a thread by the length of its messages."""
+    return sum(
+        len(str(msg.get(CONTENT_FIELD, ""))) for msg in thread_history[MSGS_FIELD]
+    )
+
+
+class ThreadStore(LRUCache):
+    """
+    Keeps the conversation of each slack thread, keyed by `thread_ts`.
+
+    Threads are evicted in least-recently-used order once any of the caps on
+    threads, total messages or total bytes is exceeded, and after being idle
+    for `idle_ttl` seconds. Sizes are measured when a thread is stored, so
+    callers must store the thread again after appending messages to it.
+
+    If a `HistoryBackend` is given, every stored thread is also persisted
+    (only the messages appended since the last store are written) and
+    threads missing in memory are loaded from the backend on access, so
+    eviction only frees memory.
+
+    `on_evict(thread_id)`, if given, is called when a thread is evicted, so that
+    what is kept along with it, like its cached prompts, is dropped too.
+    """
+
+    def __init__(
+        self,
+        max_threads=THREAD_STORE_MAX_THREADS,
+        max_messages=THREAD_STORE_MAX_MESSAGES,
+        max_bytes=THREAD_STORE_MAX_BYTES,
+        idle_ttl=THREAD_STORE_IDLE_TTL,
+        backend=None,
+        on_evict=None,
+        **kwargs,
+    ):
+        super().__init__(
+            max_entries=max_threads, max_bytes=max_bytes, ttl=idle_ttl, **kwargs
+        )
+        self.max_messages = max_messages
+        self.backend = backend
+        self.on_evict = on_evict
+        self.message_counts = {}
+        self.messages = 0
+        # thread_id -> (llm, hedge switch, number of messages) last sent to the
+        # backend
+        self.persisted = {}
+
+    def _measure(self, thread_history):
+        return thread_size(thread_history)
+
+    def _over_capacity(self):
+        if self.max_messages and self.messages > self.max_messages:
+            return True
+        return super()._over_capacity()
+
+    def _on_insert(self, thread_id, thread_history):
+        count = len(thread_history[MSGS_FIELD])
+        self.message_counts[thread_id] = count
+        self.messages += count
+
+    def _on_remove(self, thread_id, thread_history, reason):
+        self.messages -= self.message_counts.pop(thread_id)
+        self.persisted.pop(thread_id, None)
+        if reason is not None:
+            logging.info("Thread %s evicted from memory (%s)" % (thread_id, reason))
+            if self.on_evict is not None:
+                self.on_evict(thread_id)
+
+    def _load(self, thread_id):
+        """Brings a thread from the backend into memory. Returns None if unknown."""
+        thread_history = self.backend.load(thread_id)
+        if thread_history is not None:
+            super().__setitem__(thread_id, thread_history)
+            self.persisted[thread_id] = (
+                thread_history[LLM_FIELD],
+                thread_history.get(HEDGE_SWITCH_FIELD),
+                len(thread_history[MSGS_FIELD]),
+            )
+        return thread_history
+
+    def get(self, thread_id, default=None):
+        with self.lock:
+            thread_history = super().get(thread_id)
+            if thread_history is None and self.backend is not None:
+                thread_history = self._load(thread_id)
+            return default if thread_history is None else thread_history
+
+    def __contains__(self, thread_id):
+        return self.get(thread_id) is not None
+
+    def memory_size(self, thread_id):
+        """
+        The size of the thread if it's in memory, or 0, without loading it from the
+        backend or refreshing it.
+        """
+        with self.lock:
+            entry = self._entries.get(thread_id)
+            return entry[1] if entry is not None else 0
+
+    def __setitem__(self, thread_id, thread_history):
+        with self.lock:
+            last_persisted = self.persisted.get(thread_id, (None, None, None))
+            super().__setitem__(thread_id, thread_history)
+            if self.backend is not None:
+                self._persist(thread_id, thread_history, *last_persisted)
+
+    def rewrite(self, thread_id, thread_history):
+        """Stores a thread whose previous messages were modified, not only appended."""
+        with self.lock:
+            self.persisted.pop(thread_id, None)
+            self[thread_id] = thread_history
+
+    def _persist(self, thread_id, thread_history, last_llm, last_switch, count):
+        llm = thread_history[LLM_FIELD]
+        hedge_switch = thread_history.get(HEDGE_SWITCH_FIELD)
+        msgs = thread_history[MSGS_FIELD]
+        if (last_llm, last_switch) == (llm, hedge_switch) and count <= len(msgs):
+            self.backend.append(thread_id, llm, count, msgs[count:], hedge_switch)
+        else:
+            # unknown state, the history was reset or the settings of the thread
+            # changed: write it all
+            self.backend.replace(thread_id, llm, msgs, hedge_switch)
+        self.persisted[thread_id] = (llm, hedge_switch, len(msgs))
+
+    def stats(self):
+        with self.lock:
+            stats = super().stats()
+            stats["messages"] = self.messages
+            return stats
@@ -0,0 +1,51 @@
+import math
+import re
+
+# words and single symbols, the pieces the text is split in before counting
+TOKEN_PIECES = re.compile(r"\w+|[^\w\s]")
+CHARS_PER_TOKEN = 6
+# tokens taken by the role and separators of every message
+MESSAGE_OVERHEAD = 4
+
+
+def estimate_tokens(content):
+    """
+    Estimates the tokens of a text, or of a list of texts, without the tokenizer of
+    the provider: every word takes a token each CHARS_PER_TOKEN characters and any
+    other symbol takes one.
+    """
+    if isinstance(content, (list, tuple)):
+        return sum(estimate_tokens(part) for part in content)
+    if not isinstance(content, str):
+        return 0
+    return sum(
+        math.ceil(len(piece) / CHARS_PER_TOKEN)
+        for piece in TOKEN_PIECES.findall(content)
+    )
+
+
+def message_tokens(msg, content_field="content"):
+    """Estimates the tokens of a prompt message."""
+    return MESSAGE_OVERHEAD + estimate_tokens(msg.get(content_field, ""))
+
+
+def fit_to_budget(prompt, counts, budget, user_role):
+    """
+    Trims the prompt to its first message and the newest messages that fit in
+    `budget` tokens, given the tokens of each message in `counts`.
+
+    The newest messages start at a user message, and the last message is always
+    kept. A `budget` of 0 means no limit.
+    """
+    if budget <= 0 or len(prompt) <= 2:
+        return list(prompt)
+    used = counts[0] + counts[-1]
+    start = len(prompt) - 1
+    while start > 1 and used + counts[start - 1] <= budget:
+        start -= 1
+        used += counts[start]
+    if start == 1:
+        return list(prompt)
+    while start < len(prompt) - 1 and prompt[start].get("role") != user_role:
+        start += 1
+    return [prompt[0], *prompt[start:]]
@@ -1,8 +1,45 @@
+import functools
+import importlib
 import json
 import logging
 import os
 from typing import List
 
+from dotenv import load_dotenv
+
+
+@functools.lru_cache(maxsize=None)
+def load_env():
+    """Loads the settings in config/.env into the environment, only once."""
+    load_dotenv(os.path.join("config", ".env"))
+
+
+class LazyImport:
+    """
+    A module, or an attribute of it, imported on first use, so that importing the
+    modules that use heavy SDKs stays fast. Calling it or getting its attributes
+    uses the imported object.
+    """
+
+    def __init__(self, module, attribute=None):
+        self._module = module
+        self._attribute = attribute
+        self._target = None
+
+    def _resolve(self):
+        if self._target is None:
+            target = importlib.import_module(self._module)
+            if self._attribute is not None:
+                target = getattr(target, self._attribute)
+            self._target = target
+        return self._target
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
 
 def load_json(file_name):
     """Load information from a JSON file."""
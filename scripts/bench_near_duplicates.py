@@ -0,0 +1,56 @@
+"""
+Measures the lookups of the near duplicate index with many entries: the messages
+similar to a stored one, and the ones similar to none.
+
+    python -m scripts.bench_near_duplicates [entries] [lookups]
+"""
+
+import random
+import statistics
+import sys
+import time
+
+from geppetto.near_duplicates import NearDuplicateIndex
+
+NAMESPACE = ("OpenAI", "gpt-4", "helpful")
+WORDS = ["word%d" % i for i in range(5000)]
+
+
+def message(rng, length=12):
+    return " ".join(rng.sample(WORDS, length))
+
+
+def timed_lookups(index, texts):
+    times = []
+    for text in texts:
+        started = time.perf_counter()
+        index.lookup(NAMESPACE, text)
+        times.append((time.perf_counter() - started) * 1000)
+    return times
+
+
+def main(entries, lookups):
+    rng = random.Random(0)
+    index = NearDuplicateIndex(ttl=3600, max_entries=entries)
+    stored = [message(rng) for _ in range(entries)]
+    started = time.perf_counter()
+    for i, text in enumerate(stored):
+        index.add(NAMESPACE, text, "answer %d" % i)
+    print("%d entries added in %.1f s" % (entries, time.perf_counter() - started))
+
+    # the stored messages with a word added, and new messages
+    similar = [text + " please" for text in rng.sample(stored, lookups)]
+    new = [message(rng) for _ in range(lookups)]
+    for name, texts in (("similar", similar), ("new", new)):
+        times = sorted(timed_lookups(index, texts))
+        print(
+            "%-8s lookups: median %.3f ms, p99 %.3f ms"
+            % (name, statistics.median(times), times[int(len(times) * 0.99)])
+        )
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 100000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 1000,
+    )
@@ -0,0 +1,74 @@
+"""
+Measures the startup of Geppetto: importing geppetto.main, initializing the LLM
+controller, and getting the handler of the default LLM, which answers the first
+message, in fresh interpreters so that no module is already imported.
+
+Given the path of another checkout, e.g. of the baseline with
+`git worktree add /tmp/geppetto-baseline <commit>`, it is measured too.
+
+    python scripts/bench_startup.py [runs] [baseline checkout]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+
+CODE = r"""
+import os
+import time
+
+for key in ("OPENAI_API_KEY", "CLAUDE_API_KEY", "GOOGLE_API_KEY"):
+    os.environ.setdefault(key, "x")
+started = time.perf_counter()
+import geppetto.main as main
+imported = time.perf_counter()
+controller = main.initialized_llm_controller()
+initialized = time.perf_counter()
+controller.handlers[controller.list_llms()[0]]
+usable = time.perf_counter()
+print(imported - started, initialized - imported, usable - started)
+"""
+STEPS = (
+    "import geppetto.main",
+    "initialized_llm_controller()",
+    "first handler usable",
+)
+
+
+def measure(runs, checkout):
+    times = {step: [] for step in STEPS}
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", CODE],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=checkout,
+        )
+        for step, time in zip(STEPS, map(float, out.stdout.split()[-3:])):
+            times[step].append(time * 1000)
+    return times
+
+
+def report(title, times):
+    print(title)
+    for step in STEPS:
+        print(
+            "  %-30s median %7.1f ms, min %7.1f ms"
+            % (step, statistics.median(times[step]), min(times[step]))
+        )
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 9
+    current = measure(runs, os.path.dirname(os.path.dirname(__file__)) or ".")
+    report("current", current)
+    if len(sys.argv) > 2:
+        baseline = measure(runs, sys.argv[2])
+        report("baseline", baseline)
+        step = STEPS[-1]
+        print(
+            "first handler usable %.2fx faster than the baseline"
+            % (statistics.median(baseline[step]) / statistics.median(current[step]))
+        )
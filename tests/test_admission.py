@@ -0,0 +1,46 @@
+import unittest
+
+from geppetto.admission import AdmissionControl
+from tests import TestBase
+
+
+class TestAdmissionControl(TestBase):
+    def setUp(self):
+        super().setUp()
+        self.now = 0.0
+        self.admission = AdmissionControl(
+            max_depth=2, max_delay=10, clock=lambda: self.now
+        )
+
+    def test_messages_over_the_depth_are_turned_away(self):
+        first = self.admission.admit()
+        self.assertIsNotNone(self.admission.admit())
+        self.assertIsNone(self.admission.admit())
+        self.assertTrue(self.admission.start(first))
+        self.assertIsNotNone(self.admission.admit())
+        self.assertEqual(
+            self.admission.stats(),
+            {"depth": 2, "admitted": 3, "shed": {"full": 1, "late": 0}},
+        )
+
+    def test_messages_waiting_too_long_are_shed(self):
+        early = self.admission.admit()
+        self.now = 5
+        late = self.admission.admit()
+        self.now = 12
+        self.assertFalse(self.admission.start(early))
+        self.assertTrue(self.admission.start(late))
+        self.assertEqual(
+            self.admission.stats(),
+            {"depth": 0, "admitted": 2, "shed": {"full": 0, "late": 1}},
+        )
+
+    def test_no_limits(self):
+        admission = AdmissionControl(max_depth=0, max_delay=0, clock=lambda: self.now)
+        tickets = [admission.admit() for _ in range(100)]
+        self.now = 1000
+        self.assertTrue(all(admission.start(ticket) for ticket in tickets))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import unittest
+
+from unittest.mock import AsyncMock, patch, ANY
+from geppetto.async_slack_handler import AsyncSlackHandler
+from geppetto.utils import load_json
+from tests.test_slack import (
+    CHANNEL_ID,
+    THREAD_ID,
+    MOCK_GENERIC_LLM_RESPONSE,
+    initialized_test_llm_controller,
+)
+
+
+class TestAsyncSlack(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        logging.getLogger().setLevel(logging.CRITICAL)
+        self.patcherA = patch("tests.test_controller.HandlerMockA")
+        self.patcherB = patch("tests.test_controller.HandlerMockB")
+        self.patcherC = patch("tests.test_controller.HandlerMockC")
+        self.MockLLMHandlerA = self.patcherA.start()
+        self.MockLLMHandlerB = self.patcherB.start()
+        self.MockLLMHandlerC = self.patcherC.start()
+        self.patcher1 = patch("geppetto.async_slack_handler.AsyncApp")
+        self.MockApp = self.patcher1.start()
+        self.client = self.MockApp().client = AsyncMock()
+        self.client.chat_postMessage.return_value = {
+            "ok": True,
+            "message": {"ts": "2"},
+        }
+
+        self.slack_handler = AsyncSlackHandler(
+            {"test_user_id": "Test User"},
+            load_json("default_responses.json"),
+            "slack_bot_token",
+            "signing_secret",
+            initialized_test_llm_controller(
+                self.MockLLMHandlerA, self.MockLLMHandlerB, self.MockLLMHandlerC
+            ),
+        )
+
+    def tearDown(self):
+        self.patcher1.stop()
+        self.patcherA.stop()
+        self.patcherB.stop()
+        self.patcherC.stop()
+
+    async def test_permission_check(self):
+        body = {
+            "event": {
+                "text": "Test message",
+                "channel": CHANNEL_ID,
+                "ts": "1",
+                "user": "disallowed_user_id",
+            }
+        }
+
+        await self.slack_handler.handle_event(body)
+
+        self.client.chat_postMessage.assert_awaited_with(
+            channel=CHANNEL_ID,
+            text=self.slack_handler.bot_default_responses["user"]["permission_denied"],
+            thread_ts="1",
+            mrkdwn=True,
+        )
+
+    async def test_handle_message(self):
+        self.MockLLMHandlerA().llm_generate_content_async = AsyncMock(
+            return_value=MOCK_GENERIC_LLM_RESPONSE
+        )
+        message = "Test message"
+
+        await self.slack_handler.handle_message(message, CHANNEL_ID, THREAD_ID)
+
+        self.assertEqual(
+            self.slack_handler.thread_messages[THREAD_ID]["msgs"],
+            [
+                {"role": "slack_user", "content": message},
+                {"role": "geppetto", "content": MOCK_GENERIC_LLM_RESPONSE},
+            ],
+        )
+        self.client.chat_postMessage.assert_awaited_with(
+            channel=CHANNEL_ID,
+            text=":thought_balloon:",
+            thread_ts=THREAD_ID,
+            mrkdwn=True,
+        )
+        self.client.chat_update.assert_awaited_with(
+            channel=CHANNEL_ID,
+            text=MOCK_GENERIC_LLM_RESPONSE,
+            thread_ts=THREAD_ID,
+            ts=ANY,
+        )
+
+    async def test_same_thread_messages_are_serialized(self):
+        async def generate(prompt, *args):
+            await asyncio.sleep(0.01)
+            return MOCK_GENERIC_LLM_RESPONSE
+
+        self.MockLLMHandlerA().llm_generate_content_async = generate
+        await asyncio.gather(
+            *(
+                self.slack_handler.handle_message("msg %d" % i, CHANNEL_ID, THREAD_ID)
+                for i in range(3)
+            )
+        )
+
+        msgs = self.slack_handler.thread_messages[THREAD_ID]["msgs"]
+        self.assertEqual([msg["role"] for msg in msgs], ["slack_user", "geppetto"] * 3)
+        self.assertEqual(self.slack_handler.thread_locks, {})
+
+    async def test_handle_command(self):
+        await self.slack_handler.handle_message("llms", CHANNEL_ID, THREAD_ID)
+
+        self.assertIn(
+            {
+                "role": "geppetto",
+                "content": self.slack_handler.get_llms_list_message(),
+            },
+            self.slack_handler.thread_messages[THREAD_ID]["msgs"],
+        )
+        self.client.chat_update.assert_awaited_with(
+            channel=CHANNEL_ID,
+            text=self.slack_handler.get_llms_list_message(),
+            thread_ts=THREAD_ID,
+            ts="2",
+        )
+
+    async def test_no_worker_threads(self):
+        self.assertIsNone(self.slack_handler.dispatcher)
+        self.assertEqual(self.slack_handler.summarizer.dispatcher.workers, 0)
+        self.assertNotIn("lanes", self.slack_handler.stats())
+
+        # summaries are written as coroutines
+        self.slack_handler.llm_ctrl.generate_text_async = AsyncMock(
+            return_value="the summary"
+        )
+        msgs = [{"role": "slack_user", "content": "question"}]
+        summary = await self.slack_handler.summarizer.summarize_async("LlmA", msgs)
+        self.assertEqual(summary, "the summary")
+        llm, thread, *_ = self.slack_handler.llm_ctrl.generate_text_async.call_args.args
+        self.assertEqual(llm, "LlmA")
+        self.assertIn("User: question", thread[0]["content"])
+
+
+if __name__ == "__main__":
+    unittest.main()
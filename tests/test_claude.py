@@ -1,10 +1,11 @@
+import asyncio
 import logging
 import os
 import sys
 import unittest
 
 from geppetto.claude_handler import ClaudeHandler
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, Mock, patch
 from tests import TestBase
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -44,15 +45,31 @@ class TestClaude(TestBase):
         self.assertEqual(response, "Mocked Claude response")
 
     def test_failed_to_llm_generate_content(self):
-        failed_response = "Unfortunately, we're currently unable to generate a response, may be Claude API is experiencing issues. (Check status here https://status.anthropic.com). In the meantime, you can switch to other LLM models by using the commands llm_openai or llm_gemini."
+        # errors reach the controller, which retries or fails over
+        error = Exception("Overloaded")
+        self.claude_handler.client.messages.create = Mock(side_effect=error)
 
-        mock_claude = Mock()
-        mock_claude.content = [Mock(text=failed_response)]
-        mock_claude.return_value = mock_claude
-        self.claude_handler.client.messages.create = mock_claude
+        with self.assertRaises(Exception) as raised:
+            self.claude_handler.llm_generate_content([])
+        self.assertIs(raised.exception, error)
 
-        response = self.claude_handler.llm_generate_content("")
-        self.assertEqual(response, failed_response)
+    @patch("geppetto.claude_handler.AsyncAnthropic")
+    def test_llm_generate_content_async(self, mock_async_claude):
+        user_prompt = [{"role": "user", "content": "Hello, Claude!"}]
+
+        mock_response = Mock()
+        mock_response.content = [Mock(text="Mocked async Claude response")]
+        mock_async_claude().messages.create = AsyncMock(return_value=mock_response)
+        self.claude_handler._async_client = None
+
+        response = (
+            asyncio.run(self.claude_handler.llm_generate_content_async(user_prompt))
+            .split("\n\n_(Geppetto", 1)[0]
+            .strip()
+        )
+        self.assertEqual(response, "Mocked async Claude response")
+        # the prompt is not modified
+        self.assertEqual(user_prompt, [{"role": "user", "content": "Hello, Claude!"}])
 
 
 if __name__ == "__main__":
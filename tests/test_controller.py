@@ -1,6 +1,13 @@
+import threading
 import unittest
+from unittest.mock import Mock
+from geppetto.exceptions import LLMUnavailableError
+from geppetto.hedging import Hedger
 from geppetto.llm_api_handler import LLMHandler
 from geppetto.llm_controller import LLMController
+from geppetto.near_duplicates import NearDuplicateIndex
+from geppetto.resilience import CircuitBreaker, RetryPolicy
+from geppetto.response_cache import ResponseCache
 from tests import TestBase
 
 ClientMock = {}
@@ -72,6 +79,97 @@ class TestController(TestBase):
         self.assertEqual(len(self.llm_controller.llm_cfgs), 2)
         self.assertEqual(len(self.llm_controller.handlers), 2)
 
+    def test_handlers_are_built_on_first_use(self):
+        built = []
+        cfgs = [
+            {
+                **sample_llms_cfg[1],
+                "handler": lambda **args: built.append(args) or HandlerMockB(**args),
+            }
+        ]
+        controller = LLMController(cfgs)
+        controller.init_controller()
+        self.assertEqual(list(controller.handlers), ["Second LLM"])
+        self.assertEqual(built, [])
+
+        handlers = []
+        users = [
+            threading.Thread(
+                target=lambda: handlers.append(controller.handlers["Second LLM"])
+            )
+            for _ in range(4)
+        ]
+        for user in users:
+            user.start()
+        for user in users:
+            user.join(5)
+        self.assertEqual(built, [{"some_arg": "SecondGPT"}])
+        self.assertEqual(len(set(map(id, handlers))), 1)
+        self.assertIs(controller.get_handler("Second LLM"), handlers[0])
+        self.assertEqual(controller.handlers.built(), handlers[:1])
+
+    def test_handlers_that_cant_be_built_are_failed_over(self):
+        def handler(name):
+            handler = Mock(model=name, personality="")
+            handler.name = name
+            handler.get_prompt_from_thread.side_effect = (
+                lambda thread, a, u, thread_id: thread
+            )
+            handler.llm_generate_content.return_value = "from %s" % name
+            return lambda **args: handler
+
+        def broken(**args):
+            raise RuntimeError("missing API key")
+
+        cfgs = [
+            {"name": "A", "handler": handler("A"), "handler_args": {}},
+            {"name": "B", "handler": handler("B"), "handler_args": {}},
+            {"name": "C", "handler": broken, "handler_args": {}},
+        ]
+        controller = LLMController(cfgs)
+        controller.init_controller()
+        thread = [{"role": "user", "content": "Hi"}]
+
+        self.assertEqual(controller.generate_content("A", thread, "a", "u"), "from A")
+        # checking the LLMs to fail over to doesn't build them
+        self.assertEqual([h.name for h in controller.handlers.built()], ["A"])
+        self.assertIn("C", controller.handlers)
+        self.assertEqual(controller.generate_content("C", thread, "a", "u"), "from A")
+        self.assertRaises(LLMUnavailableError, controller.get_handler, "C")
+
+    def test_warm_up_prewarms_the_connections(self):
+        handler = Mock()
+        failing = Mock()
+        failing.prewarm.side_effect = ConnectionError("unreachable")
+        controller = LLMController(
+            [
+                {"name": "First LLM", "handler": lambda: handler, "handler_args": {}},
+                {"name": "Third LLM", "handler": lambda: failing, "handler_args": {}},
+            ]
+        )
+        controller.init_controller()
+        controller.warm_up(prewarm=True).join(5)
+        handler.prewarm.assert_called_once_with()
+        failing.prewarm.assert_called_once_with()
+        controller.warm_up().join(5)
+        handler.prewarm.assert_called_once_with()
+
+    def test_warm_up_builds_only_the_given_llms(self):
+        built = []
+        controller = LLMController(
+            [
+                {
+                    "name": name,
+                    "handler": lambda name=name: built.append(name) or Mock(),
+                    "handler_args": {},
+                }
+                for name in ("First LLM", "Second LLM")
+            ]
+        )
+        controller.init_controller()
+        controller.warm_up(names=["First LLM"]).join(5)
+        self.assertEqual(built, ["First LLM"])
+
     def test_get_llm_cfg(self):
         cfg = self.llm_controller.get_llm_cfg("Second LLM")
         self.assertEqual(cfg["handler_args"]["some_arg"], "SecondGPT")
@@ -95,6 +193,315 @@ class TestController(TestBase):
             self.llm_controller.handlers["Second LLM"].some_arg, "SecondGPT"
         )
 
+    def test_generate_content_uses_response_cache(self):
+        controller = LLMController(
+            sample_llms_cfg, response_cache=ResponseCache(ttl=60)
+        )
+        handler = Mock(model="LLM1", personality="")
+        handler.name = "First LLM"
+        handler.get_prompt_from_thread.side_effect = (
+            lambda thread, a, u, thread_id: thread
+        )
+        handler.llm_generate_content.return_value = "an answer"
+        controller.handlers["First LLM"] = handler
+        thread = [{"role": "user", "content": "What can you do?"}]
+        for thread_id in ["t1", "t2"]:
+            response = controller.generate_content(
+                "First LLM", thread, "geppetto", "user", None, thread_id=thread_id
+            )
+            self.assertEqual(response, "an answer")
+        handler.llm_generate_content.assert_called_once_with(thread, None)
+        self.assertEqual(controller.response_cache.stats()["hits"], 1)
+
+    def test_generate_text_bypasses_the_response_cache(self):
+        controller = LLMController(
+            sample_llms_cfg, response_cache=ResponseCache(ttl=60)
+        )
+        (handler,) = self.mock_handlers(controller, "First LLM")
+        handler.llm_generate_content.return_value = "an answer"
+        handler.llm_generate_text.return_value = "a summary"
+        thread = [{"role": "user", "content": "Summarize this"}]
+        controller.generate_content("First LLM", thread, "geppetto", "user")
+        for _ in range(2):
+            response = controller.generate_text("First LLM", thread, "geppetto", "user")
+            self.assertEqual(response, "a summary")
+        # without tools, and never the cached answer of a message
+        self.assertEqual(handler.llm_generate_text.call_count, 2)
+        self.assertEqual(controller.response_cache.stats()["hits"], 0)
+
+    def test_generate_content_answers_similar_first_messages(self):
+        controller = LLMController(
+            sample_llms_cfg, near_duplicates=NearDuplicateIndex(ttl=60)
+        )
+        handler = Mock(model="LLM1", personality="")
+        handler.name = "First LLM"
+        handler.get_prompt_from_thread.side_effect = (
+            lambda thread, a, u, thread_id: thread
+        )
+        handler.llm_generate_content.return_value = "Type llms"
+        controller.handlers["First LLM"] = handler
+        for question in ["which llms can I use?", "Which LLMs can I use"]:
+            response = controller.generate_content(
+                "First LLM", [{"role": "user", "content": question}], "geppetto", "user"
+            )
+            self.assertEqual(response, "Type llms")
+        handler.llm_generate_content.assert_called_once()
+
+        # later messages of a thread are always answered by the LLM
+        thread = [{"role": "user", "content": "which llms can I use?"}] * 2
+        controller.generate_content("First LLM", thread, "geppetto", "user")
+        self.assertEqual(handler.llm_generate_content.call_count, 2)
+
+    def test_concurrent_identical_calls_are_coalesced(self):
+        controller = LLMController(sample_llms_cfg)
+        handler = Mock(model="LLM1", personality="")
+        handler.name = "First LLM"
+        handler.get_prompt_from_thread.side_effect = (
+            lambda thread, a, u, thread_id: thread
+        )
+        release = threading.Event()
+        handler.llm_generate_content.side_effect = lambda *args: release.wait(5) and "a"
+        controller.handlers["First LLM"] = handler
+        thread = [{"role": "user", "content": "Hi"}]
+        responses = []
+        callers = [
+            threading.Thread(
+                target=lambda: responses.append(
+                    controller.generate_content("First LLM", thread, "geppetto", "user")
+                )
+            )
+            for _ in range(2)
+        ]
+        for caller in callers:
+            caller.start()
+        while controller.in_flight.stats()["coalesced"] < 1:
+            release.wait(0.001)
+        release.set()
+        for caller in callers:
+            caller.join(5)
+        self.assertEqual(responses, ["a", "a"])
+        handler.llm_generate_content.assert_called_once()
+
+    def mock_handlers(self, controller, *names):
+        handlers = []
+        for name in names:
+            handler = Mock(model=name, personality="")
+            handler.name = name
+            handler.get_prompt_from_thread.side_effect = (
+                lambda thread, a, u, thread_id: thread
+            )
+            controller.handlers[name] = handler
+            handlers.append(handler)
+        return handlers
+
+    def test_transient_errors_are_retried(self):
+        sleeps = []
+        controller = LLMController(
+            sample_llms_cfg,
+            retry_policy=RetryPolicy(max_retries=2, base_delay=1, rng=lambda: 0.5),
+            sleep=sleeps.append,
+        )
+        first, second = self.mock_handlers(controller, "First LLM", "Second LLM")
+        first.llm_generate_content.side_effect = [
+            TimeoutError("timed out"),
+            ConnectionError("reset"),
+            "an answer",
+        ]
+        thread = [{"role": "user", "content": "Hi"}]
+        response = controller.generate_content("First LLM", thread, "a", "u")
+        self.assertEqual(response, "an answer")
+        self.assertEqual(sleeps, [0.5, 1])
+        second.llm_generate_content.assert_not_called()
+        self.assertEqual(
+            controller.stats()["breakers"]["First LLM"],
+            {"state": "closed", "failures": 0, "opened": 0},
+        )
+
+        # other errors are raised at once
+        first.llm_generate_content.side_effect = ValueError("bad request")
+        self.assertRaises(
+            ValueError, controller.generate_content, "First LLM", thread, "a", "u"
+        )
+        self.assertEqual(first.llm_generate_content.call_count, 4)
+
+    def test_failing_llm_fails_over_to_the_next_one(self):
+        now = [0]
+        controller = LLMController(
+            sample_llms_cfg,
+            retry_policy=RetryPolicy(max_retries=1, base_delay=0),
+            sleep=lambda delay: None,
+        )
+        controller.breakers["Second LLM"] = CircuitBreaker(
+            failures=2, cooldown=30, clock=lambda: now[0]
+        )
+        first, second = self.mock_handlers(controller, "First LLM", "Second LLM")
+        unavailable = Exception("unavailable")
+        unavailable.status_code = 503
+        second.llm_generate_content.side_effect = unavailable
+        first.llm_generate_content.return_value = "from the first"
+        thread = [{"role": "user", "content": "Hi"}]
+
+        response = controller.generate_content("Second LLM", thread, "a", "u")
+        self.assertEqual(response, "from the first")
+        self.assertEqual(second.llm_generate_content.call_count, 2)
+        # the prompt is translated by the handler answering
+        first.get_prompt_from_thread.assert_called_once()
+        self.assertEqual(controller.stats()["breakers"]["Second LLM"]["state"], "open")
+
+        # the open breaker skips the LLM until the cooldown ends
+        controller.generate_content("Second LLM", thread, "a", "u")
+        self.assertEqual(second.llm_generate_content.call_count, 2)
+        now[0] = 30
+        second.llm_generate_content.side_effect = None
+        second.llm_generate_content.return_value = "from the second"
+        response = controller.generate_content("Second LLM", thread, "a", "u")
+        self.assertEqual(response, "from the second")
+        self.assertEqual(
+            controller.stats()["breakers"]["Second LLM"]["state"], "closed"
+        )
+
+        # no LLM left to answer
+        first.llm_generate_content.side_effect = unavailable
+        second.llm_generate_content.side_effect = unavailable
+        self.assertRaises(
+            LLMUnavailableError,
+            controller.generate_content,
+            "First LLM",
+            thread,
+            "a",
+            "u",
+        )
+
+    def test_stream_fails_over_before_streaming(self):
+        controller = LLMController(
+            sample_llms_cfg, retry_policy=RetryPolicy(max_retries=0)
+        )
+        first, second = self.mock_handlers(controller, "First LLM", "Second LLM")
+
+        def failing_stream(*args):
+            raise TimeoutError("timed out")
+            yield
+
+        def stream(*args):
+            yield "an "
+            yield "answer"
+            return "an answer"
+
+        first.llm_generate_content_stream.side_effect = failing_stream
+        second.llm_generate_content_stream.side_effect = stream
+        thread = [{"role": "user", "content": "Hi"}]
+        deltas = []
+        stream_gen = controller.generate_content_stream("First LLM", thread, "a", "u")
+        while True:
+            try:
+                deltas.append(next(stream_gen))
+            except StopIteration as stop:
+                response = stop.value
+                break
+        self.assertEqual(deltas, ["an ", "answer"])
+        self.assertEqual(response, "an answer")
+        # routing and hedging know how long the stream took
+        self.assertEqual(controller.latencies.count("Second LLM"), 1)
+        self.assertEqual(controller.latencies.count("Second LLM first token"), 1)
+
+    def test_stream_failing_after_streaming_does_not_fail_over(self):
+        controller = LLMController(
+            sample_llms_cfg, retry_policy=RetryPolicy(max_retries=0)
+        )
+        first, second = self.mock_handlers(controller, "First LLM", "Second LLM")
+
+        def failing_stream(*args):
+            yield "an "
+            raise TimeoutError("timed out")
+
+        first.llm_generate_content_stream.side_effect = failing_stream
+        thread = [{"role": "user", "content": "Hi"}]
+        deltas = []
+        stream_gen = controller.generate_content_stream("First LLM", thread, "a", "u")
+        with self.assertRaises(LLMUnavailableError):
+            for delta in stream_gen:
+                deltas.append(delta)
+        # the answer of another LLM would follow the part already shown
+        self.assertEqual(deltas, ["an "])
+        second.llm_generate_content_stream.assert_not_called()
+
+    def test_slow_calls_are_hedged(self):
+        controller = LLMController(
+            sample_llms_cfg, hedger=Hedger(percentile=50, min_samples=1, workers=2)
+        )
+        first, second = self.mock_handlers(controller, "First LLM", "Second LLM")
+        release = threading.Event()
+        first.llm_generate_content.side_effect = lambda *args: release.wait(5) and "a"
+        second.llm_generate_content.return_value = "b"
+        controller.latencies.record("First LLM", 0.01)
+        switched = []
+        thread = [{"role": "user", "content": "Hi"}]
+        try:
+            response = controller.generate_content(
+                "First LLM", thread, "a", "u", switch_llm=switched.append
+            )
+        finally:
+            release.set()
+        self.assertEqual(response, "b")
+        self.assertEqual(switched, ["Second LLM"])
+        self.assertEqual(controller.stats()["hedging"], {"hedged": 1, "won": 1})
+        controller.hedger.executor.shutdown()
+        self.assertEqual(controller.latencies.count("First LLM"), 2)
+
+    def test_image_requests_are_not_hedged_between_llms_generating_images(self):
+        cfgs = [
+            {**sample_llms_cfg[0], "capabilities": frozenset({"images"})},
+            sample_llms_cfg[1],
+        ]
+        controller = LLMController(
+            cfgs, hedger=Hedger(percentile=50, min_samples=1, workers=2)
+        )
+        self.mock_handlers(controller, "First LLM", "Second LLM")
+        controller.latencies.record("First LLM", 0.01)
+        controller.latencies.record("Second LLM", 0.01)
+        image = [{"role": "user", "content": "Draw a cat"}]
+        text = [{"role": "user", "content": "Hi"}]
+        # the losing call would still generate its images
+        self.assertEqual(
+            controller.hedge_for("First LLM", "First LLM", image), (None, None)
+        )
+        self.assertEqual(
+            controller.hedge_for("Second LLM", "Second LLM", image), (None, None)
+        )
+        # unless it can be cancelled, or no image is asked for
+        hedge, delay = controller.hedge_for(
+            "First LLM", "First LLM", image, cancellable=True
+        )
+        self.assertEqual(hedge, "Second LLM")
+        hedge, delay = controller.hedge_for("First LLM", "First LLM", text)
+        self.assertEqual(hedge, "Second LLM")
+        hedge, delay = controller.hedge_for("Second LLM", "Second LLM", text)
+        self.assertEqual(hedge, "First LLM")
+
+    def test_throttled_calls_lower_the_concurrency_limit(self):
+        controller = LLMController(
+            [{**sample_llms_cfg[0], "max_concurrency": 8}, sample_llms_cfg[1]],
+            retry_policy=RetryPolicy(max_retries=0),
+        )
+        self.assertEqual(list(controller.limiters), ["First LLM"])
+        handler = Mock(model="LLM1", personality="")
+        handler.name = "First LLM"
+        handler.get_prompt_from_thread.side_effect = (
+            lambda thread, a, u, thread_id: thread
+        )
+        throttled = Exception("rate limited")
+        throttled.status_code = 429
+        handler.llm_generate_content.side_effect = throttled
+        controller.handlers["First LLM"] = handler
+        thread = [{"role": "user", "content": "Hi"}]
+        self.assertRaises(
+            Exception, controller.generate_content, "First LLM", thread, "a", "u"
+        )
+        self.assertEqual(
+            controller.stats()["limiters"]["First LLM"],
+            {"limit": 4, "in_use": 0, "waiting": 0, "throttled": 1},
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
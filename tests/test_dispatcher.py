@@ -0,0 +1,150 @@
+import threading
+import time
+import unittest
+
+from geppetto.dispatcher import SLACK_LANES, Dispatcher, FairQueue, parse_lanes
+from tests import TestBase
+
+
+class TestDispatcher(TestBase):
+    def setUp(self):
+        super().setUp()
+        self.dispatcher = Dispatcher(workers=4)
+
+    def tearDown(self):
+        self.dispatcher.shutdown()
+
+    def test_same_key_runs_in_order(self):
+        results = []
+
+        def task(i):
+            time.sleep(0.001 * (5 - i))
+            results.append(i)
+
+        for i in range(5):
+            self.dispatcher.submit("thread", task, i)
+        self.assertTrue(self.dispatcher.join(timeout=5))
+        self.assertEqual(results, [0, 1, 2, 3, 4])
+
+    def test_different_keys_run_in_parallel(self):
+        barrier = threading.Barrier(3, timeout=5)
+        futures = [
+            self.dispatcher.submit("thread_%d" % i, barrier.wait) for i in range(3)
+        ]
+        for future in futures:
+            future.result(timeout=5)
+
+    def test_workers_are_bounded(self):
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        def task():
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.pop()
+
+        for i in range(20):
+            self.dispatcher.submit("thread_%d" % i, task)
+        self.assertTrue(self.dispatcher.join(timeout=5))
+        self.assertLessEqual(max(peak), 4)
+        self.assertLessEqual(len(self.dispatcher.threads), 4)
+
+    def test_errors_are_reported_in_the_future(self):
+        future = self.dispatcher.submit("thread", lambda: 1 / 0)
+        self.assertRaises(ZeroDivisionError, future.result, 5)
+        self.assertEqual(self.dispatcher.submit("thread", lambda: 1).result(5), 1)
+
+    def test_inline_mode(self):
+        dispatcher = Dispatcher(workers=0)
+        future = dispatcher.submit("thread", threading.current_thread)
+        self.assertIs(future.result(), threading.current_thread())
+
+    def test_groups_take_turns(self):
+        dispatcher = Dispatcher(workers=1)
+        self.addCleanup(dispatcher.shutdown)
+        started = threading.Event()
+        release = threading.Event()
+        order = []
+        dispatcher.submit("busy", lambda: started.set() or release.wait(5))
+        started.wait(5)
+        # a chatty user with several threads, and a quiet one
+        for i in range(3):
+            dispatcher.submit(
+                "thread_a%d" % i, order.append, "a%d" % i, group=("C1", "chatty")
+            )
+        dispatcher.submit("thread_b", order.append, "b", group=("C1", "quiet"))
+        dispatcher.submit("thread_c", order.append, "c", group=("C2", "other"))
+        release.set()
+        self.assertTrue(dispatcher.join(timeout=5))
+        self.assertEqual(order, ["a0", "c", "b", "a1", "a2"])
+
+    def test_lanes_run_in_order_of_priority(self):
+        dispatcher = Dispatcher(workers=1, lanes={"fast": 0, "slow": 0})
+        self.addCleanup(dispatcher.shutdown)
+        started = threading.Event()
+        release = threading.Event()
+        order = []
+        dispatcher.submit("busy", lambda: started.set() or release.wait(5))
+        started.wait(5)
+        dispatcher.submit("thread_a", order.append, "slow", lane="slow")
+        dispatcher.submit("thread_b", order.append, "other", lane="other")
+        dispatcher.submit("thread_c", order.append, "fast", lane="fast")
+        release.set()
+        self.assertTrue(dispatcher.join(5))
+        self.assertEqual(order, ["fast", "slow", "other"])
+
+    def test_lanes_keep_their_reserved_workers(self):
+        dispatcher = Dispatcher(workers=3, lanes={"fast": 1, "slow": 1})
+        self.addCleanup(dispatcher.shutdown)
+        release = threading.Event()
+        for i in range(4):
+            dispatcher.submit("slow_%d" % i, release.wait, 5, lane="slow")
+        time.sleep(0.05)
+        # the worker reserved to the fast lane is left free for it
+        self.assertEqual(dispatcher.stats()["slow"], {"ready": 2, "running": 2})
+        fast = dispatcher.submit("fast", threading.current_thread, lane="fast")
+        self.assertIsNotNone(fast.result(5))
+        release.set()
+        self.assertTrue(dispatcher.join(5))
+
+    def test_tasks_keep_the_lane_of_their_message(self):
+        with self.assertLogs(level="WARNING"):
+            dispatcher = Dispatcher(workers=4, lanes=parse_lanes(SLACK_LANES))
+        self.addCleanup(dispatcher.shutdown)
+        # e.g. a summary applied in the lane of the message that triggered it
+        first = dispatcher.submit("thread", lambda: "summary", lane="mention")
+        second = dispatcher.submit("thread", lambda: "answer", lane="dm")
+        self.assertTrue(dispatcher.join(1))
+        self.assertEqual((first.result(), second.result()), ("summary", "answer"))
+
+    def test_parse_lanes(self):
+        self.assertEqual(
+            parse_lanes("dm:2, image:1,long"), {"dm": 2, "image": 1, "long": 0}
+        )
+        self.assertEqual(parse_lanes(""), {})
+
+
+class TestFairQueue(TestBase):
+    def test_weighted_round_robin(self):
+        weights = {("heavy",): 2}
+        queue = FairQueue(lambda path: weights.get(path, 1))
+        for i in range(4):
+            queue.append("h%d" % i, ("heavy",))
+            queue.append("l%d" % i, ("light",))
+        queue.append("summary")
+        self.assertEqual(len(queue), 9)
+        self.assertEqual(
+            [queue.popleft() for _ in range(9)],
+            ["h0", "h1", "l0", "summary", "h2", "h3", "l1", "l2", "l3"],
+        )
+        self.assertEqual(len(queue), 0)
+        self.assertEqual(queue.root.subgroups, {})
+        self.assertRaises(IndexError, queue.popleft)
+
+
+if __name__ == "__main__":
+    unittest.main()
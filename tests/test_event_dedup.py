@@ -0,0 +1,57 @@
+import unittest
+
+from geppetto.event_dedup import SeenEvents
+from tests import TestBase
+
+
+def event_body(event_id, event_type="message", ts="1", client_msg_id="msg-1"):
+    return {
+        "event_id": event_id,
+        "event": {
+            "type": event_type,
+            "text": "hello",
+            "channel": "C1",
+            "ts": ts,
+            "client_msg_id": client_msg_id,
+        },
+    }
+
+
+class TestSeenEvents(TestBase):
+    def setUp(self):
+        super().setUp()
+        self.seen_events = SeenEvents(window=60, max_events=100)
+
+    def test_retried_event(self):
+        self.assertFalse(self.seen_events.is_duplicate(event_body("Ev1")))
+        self.assertTrue(self.seen_events.is_duplicate(event_body("Ev1")))
+        self.assertEqual(self.seen_events.stats()["duplicates"]["event_id"], 1)
+
+    def test_message_and_app_mention_of_the_same_message(self):
+        self.assertFalse(self.seen_events.is_duplicate(event_body("Ev1")))
+        self.assertTrue(self.seen_events.is_duplicate(event_body("Ev2", "app_mention")))
+        self.assertEqual(self.seen_events.stats()["duplicates"]["client_msg_id"], 1)
+
+    def test_same_channel_and_ts_without_ids(self):
+        body = event_body(None, client_msg_id=None)
+        self.assertFalse(self.seen_events.is_duplicate(body))
+        self.assertTrue(self.seen_events.is_duplicate(body))
+        self.assertEqual(self.seen_events.stats()["duplicates"]["channel_ts"], 1)
+
+    def test_different_messages(self):
+        self.assertFalse(self.seen_events.is_duplicate(event_body("Ev1")))
+        self.assertFalse(
+            self.seen_events.is_duplicate(event_body("Ev2", ts="2", client_msg_id="2"))
+        )
+        self.assertEqual(self.seen_events.stats()["dropped"], 0)
+
+    def test_window(self):
+        now = [0]
+        self.seen_events.seen.clock = lambda: now[0]
+        self.assertFalse(self.seen_events.is_duplicate(event_body("Ev1")))
+        now[0] = 61
+        self.assertFalse(self.seen_events.is_duplicate(event_body("Ev1")))
+
+
+if __name__ == "__main__":
+    unittest.main()
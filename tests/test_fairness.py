@@ -0,0 +1,40 @@
+import unittest
+
+from geppetto.fairness import SenderLimits
+from tests import TestBase
+
+
+class TestSenderLimits(TestBase):
+    def setUp(self):
+        super().setUp()
+        self.now = 0.0
+        self.limits = SenderLimits(
+            user_limit=(60, 2), channel_limit=(60, 3), clock=lambda: self.now
+        )
+
+    def test_users_over_their_rate_are_limited(self):
+        self.assertTrue(self.limits.allow("U1", "C1"))
+        self.assertTrue(self.limits.allow("U1", "C1"))
+        self.assertFalse(self.limits.allow("U1", "C1"))
+        # a message per second is refilled
+        self.now = 1
+        self.assertTrue(self.limits.allow("U1", "C1"))
+        self.assertEqual(self.limits.stats()["limited"], {"user": 1, "channel": 0})
+
+    def test_channels_over_their_rate_are_limited(self):
+        for user in ("U1", "U2", "U3"):
+            self.assertTrue(self.limits.allow(user, "C1"))
+        self.assertFalse(self.limits.allow("U4", "C1"))
+        self.assertTrue(self.limits.allow("U4", "C2"))
+        self.assertEqual(self.limits.stats()["limited"], {"user": 0, "channel": 1})
+
+    def test_weights_raise_the_limits(self):
+        limits = SenderLimits(user_limit=(60, 2), channel_limit=(0, 0))
+        self.assertEqual(
+            [limits.allow("U1", "C1", weight=2) for _ in range(5)],
+            [True, True, True, True, False],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
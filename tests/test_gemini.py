@@ -1,9 +1,12 @@
+import asyncio
 import os
 import sys
 import unittest
 from geppetto.gemini_handler import GeminiHandler
+from geppetto.http_pool import HTTP_READ_TIMEOUT
+from geppetto.llm_api_handler import PromptCache
 from geppetto.exceptions import InvalidThreadFormatError
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, Mock, patch
 from tests import TestBase
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -69,6 +72,71 @@ class TestGemini(TestBase):
                 incomplete_thread, assistant_tag="geppetto", user_tag="slack_user"
             )
 
+    def test_get_prompt_from_thread_cached(self):
+        thread = [
+            {"role": "slack_user", "content": "Message 1"},
+            {"role": "geppetto", "content": "Message 2"},
+        ]
+        prompt = self.gemini_handler.get_prompt_from_thread(
+            thread, "geppetto", "slack_user", thread_id="thread"
+        )
+        self.assertEqual(prompt[1], {"role": "model", "parts": ["Message 2"]})
+
+        # only the new messages are translated
+        thread.append({"role": "slack_user", "content": "Message 3"})
+        with patch.object(
+            self.gemini_handler,
+            "translate_message",
+            wraps=self.gemini_handler.translate_message,
+        ) as translate_message:
+            new_prompt = self.gemini_handler.get_prompt_from_thread(
+                thread, "geppetto", "slack_user", thread_id="thread"
+            )
+        translate_message.assert_called_once_with(thread[2], "geppetto", "slack_user")
+        self.assertEqual(new_prompt[:2], prompt)
+        self.assertEqual(new_prompt[2], {"role": "user", "parts": ["Message 3"]})
+
+        # a new list of messages starts a new prompt
+        reset_thread = [thread[0], {"role": "slack_user", "content": "Message 4"}]
+        reset_prompt = self.gemini_handler.get_prompt_from_thread(
+            reset_thread, "geppetto", "slack_user", thread_id="thread"
+        )
+        self.assertEqual(reset_prompt[1], {"role": "user", "parts": ["Message 4"]})
+        self.assertEqual(len(reset_prompt), 2)
+
+        self.gemini_handler.forget_thread("thread")
+        self.assertNotIn("thread", self.gemini_handler.prompts)
+
+    def test_prompt_cache_is_capped_in_bytes(self):
+        threads = {
+            thread_id: [{"role": "slack_user", "content": "Message of %s" % thread_id}]
+            for thread_id in ("t1", "t2")
+        }
+        with patch.object(self.gemini_handler, "prompts", PromptCache(max_bytes=1)):
+            for thread_id, thread in threads.items():
+                self.gemini_handler.get_prompt_from_thread(
+                    thread, "geppetto", "slack_user", thread_id=thread_id
+                )
+            # the newest prompt is kept even if it alone exceeds the cap
+            self.assertNotIn("t1", self.gemini_handler.prompts)
+            self.assertIn("t2", self.gemini_handler.prompts)
+
+    def test_get_prompt_from_thread_budget(self):
+        thread = [
+            {"role": "slack_user" if i % 2 == 0 else "geppetto", "content": "word"}
+            for i in range(9)
+        ]
+        with patch.object(self.gemini_handler, "context_budget", 14):
+            prompt = self.gemini_handler.get_prompt_from_thread(
+                thread, "geppetto", "slack_user", thread_id="budget"
+            )
+        # 5 tokens per message: the first one and the newest user message fit
+        self.assertEqual(
+            prompt,
+            [{"role": "user", "parts": ["word"]}, {"role": "user", "parts": ["word"]}],
+        )
+        self.gemini_handler.forget_thread("budget")
+
     def test_llm_generate_content_user_repetition(self):
         user_prompt = [
             {"role": "user", "parts": ["Hello"]},
@@ -89,9 +157,35 @@ class TestGemini(TestBase):
                 [
                     {"role": "user", "parts": ["Hello", "How are you?"]},
                     {"role": "geppetto", "parts": ["I'm fine."]},
-                ]
+                ],
+                request_options={"timeout": HTTP_READ_TIMEOUT},
             )
 
+    def test_llm_generate_content_async(self):
+        user_prompt = [
+            {"role": "user", "parts": ["Hello"]},
+            {"role": "user", "parts": ["How are you?"]},
+        ]
+        mock_response = Mock()
+        mock_response.text = "Mocked async Gemini response"
+
+        with patch.object(
+            self.gemini_handler.client,
+            "generate_content_async",
+            AsyncMock(return_value=mock_response),
+        ) as mock_generate_content_async:
+            response = asyncio.run(
+                self.gemini_handler.llm_generate_content_async(user_prompt)
+            )
+
+            mock_generate_content_async.assert_awaited_once_with(
+                [{"role": "user", "parts": ["Hello", "How are you?"]}],
+                request_options={"timeout": HTTP_READ_TIMEOUT},
+            )
+        self.assertEqual(
+            response.split("\n\n_(Geppetto", 1)[0], "Mocked async Gemini response"
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
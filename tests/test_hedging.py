@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import unittest
+
+from geppetto.hedging import Hedger
+from geppetto.metrics import LatencyTracker
+from tests import TestBase
+
+
+class TestHedger(TestBase):
+    def setUp(self):
+        super().setUp()
+        self.hedger = Hedger(percentile=90, min_samples=2, workers=4)
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        if self.hedger.executor is not None:
+            self.hedger.executor.shutdown()
+
+    def slow(self):
+        self.release.wait(5)
+        return "slow"
+
+    def test_hedge_answers_when_the_call_is_slow(self):
+        result = self.hedger.run(self.slow, lambda: "hedge", 0.01)
+        self.assertEqual(result, ("hedge", True))
+        self.assertEqual(self.hedger.stats(), {"hedged": 1, "won": 1})
+
+        # fast calls aren't hedged
+        self.release.set()
+        result = self.hedger.run(self.slow, lambda: "hedge", 1)
+        self.assertEqual(result, ("slow", False))
+        self.assertEqual(self.hedger.stats(), {"hedged": 1, "won": 1})
+
+    def test_failed_hedge_waits_for_the_call(self):
+        def failing():
+            self.release.set()
+            raise TimeoutError()
+
+        result = self.hedger.run(self.slow, failing, 0.01)
+        self.assertEqual(result, ("slow", False))
+        self.assertEqual(self.hedger.stats(), {"hedged": 1, "won": 0})
+
+    def test_losing_stream_is_closed(self):
+        closed = []
+
+        def closing_stream(name, wait):
+            try:
+                if wait:
+                    self.release.wait(5)
+                yield name
+                return name + "!"
+            finally:
+                closed.append(name)
+
+        stream, won = self.hedger.run_stream(
+            lambda: closing_stream("slow", True),
+            lambda: closing_stream("hedge", False),
+            0.01,
+        )
+        self.assertTrue(won)
+        self.assertEqual(next(stream), "hedge")
+        self.release.set()
+        with self.assertRaises(StopIteration) as stop:
+            next(stream)
+        self.assertEqual(stop.exception.value, "hedge!")
+        self.hedger.executor.shutdown()
+        self.assertCountEqual(closed, ["slow", "hedge"])
+
+    def test_losing_coroutine_is_cancelled(self):
+        cancelled = []
+
+        async def slow():
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        async def hedge():
+            return "hedge"
+
+        result = asyncio.run(self.hedger.run_async(slow, hedge, 0.01))
+        self.assertEqual(result, ("hedge", True))
+        self.assertEqual(cancelled, [True])
+
+    def test_hedging_delay(self):
+        latencies = LatencyTracker()
+        latencies.record("LLM", 1)
+        self.assertIsNone(self.hedger.delay(latencies, "LLM"))
+        for seconds in range(2, 11):
+            latencies.record("LLM", seconds)
+        self.assertEqual(self.hedger.delay(latencies, "LLM"), 9)
+        self.hedger.percentile = 0
+        self.assertIsNone(self.hedger.delay(latencies, "LLM"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from geppetto.history_store import SQLiteHistoryBackend
+from geppetto.thread_store import ThreadStore
+from tests import TestBase
+
+
+def msg(role, content):
+    return {"role": role, "content": content}
+
+
+class TestSQLiteHistoryBackend(TestBase):
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "history.db")
+        self.backend = SQLiteHistoryBackend(self.path, flush_interval=0.01)
+
+    def tearDown(self):
+        self.backend.close()
+        self.tmp_dir.cleanup()
+
+    def test_wal_mode(self):
+        mode = self.backend.read_conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, "wal")
+
+    def test_append_and_load(self):
+        self.backend.append("t1", "LlmA", 0, [msg("slack_user", "hi")])
+        self.backend.append("t1", "LlmA", 1, [msg("geppetto", "hello")])
+        self.assertEqual(
+            self.backend.load("t1"),
+            {
+                "llm": "LlmA",
+                "msgs": [msg("slack_user", "hi"), msg("geppetto", "hello")],
+            },
+        )
+        self.assertIsNone(self.backend.load("unknown"))
+
+    def test_replace(self):
+        self.backend.append(
+            "t1", "LlmA", 0, [msg("slack_user", "a"), msg("geppetto", "b")]
+        )
+        self.backend.replace("t1", "LlmB", [msg("slack_user", "a")])
+        self.assertEqual(
+            self.backend.load("t1"), {"llm": "LlmB", "msgs": [msg("slack_user", "a")]}
+        )
+
+    def test_survives_reopening(self):
+        self.backend.append("t1", "LlmA", 0, [msg("slack_user", "hi")])
+        self.backend.close()
+        self.backend = SQLiteHistoryBackend(self.path)
+        self.assertEqual(self.backend.load("t1")["msgs"], [msg("slack_user", "hi")])
+
+
+class TestThreadStoreWithBackend(TestBase):
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.backend = SQLiteHistoryBackend(
+            os.path.join(self.tmp_dir.name, "history.db"), flush_interval=0.01
+        )
+
+    def tearDown(self):
+        self.backend.close()
+        self.tmp_dir.cleanup()
+
+    def test_only_new_messages_are_written(self):
+        store = ThreadStore(backend=self.backend)
+        calls = []
+        append = self.backend.append
+        self.backend.append = lambda *args: calls.append(args) or append(*args)
+
+        history = store.get("t1", {"llm": "", "msgs": []})
+        history["llm"] = "LlmA"
+        history["msgs"] += [msg("slack_user", "a"), msg("geppetto", "b")]
+        store["t1"] = history
+        history["msgs"] += [msg("slack_user", "c"), msg("geppetto", "d")]
+        store["t1"] = history
+
+        self.assertEqual(calls[-1], ("t1", "LlmA", 2, history["msgs"][2:], None))
+        self.assertEqual(self.backend.load("t1"), history)
+
+    def test_evicted_thread_is_loaded_lazily(self):
+        store = ThreadStore(max_threads=1, backend=self.backend)
+        store["t1"] = {"llm": "LlmA", "msgs": [msg("slack_user", "a")]}
+        store["t2"] = {"llm": "LlmA", "msgs": [msg("slack_user", "b")]}
+        self.assertEqual(len(store), 1)
+
+        self.assertIn("t1", store)
+        self.assertEqual(store["t1"]["msgs"], [msg("slack_user", "a")])
+
+    def test_llm_switch_rewrites_thread(self):
+        store = ThreadStore(backend=self.backend)
+        history = {
+            "llm": "LlmA",
+            "msgs": [msg("slack_user", "a"), msg("geppetto", "b")],
+        }
+        store["t1"] = history
+        history["llm"] = "LlmB"
+        history["msgs"] = [history["msgs"][0], msg("slack_user", "c")]
+        store["t1"] = history
+
+        self.assertEqual(ThreadStore(backend=self.backend)["t1"], history)
+
+    def test_hedge_switch_is_reloaded(self):
+        store = ThreadStore(backend=self.backend)
+        history = {"llm": "LlmA", "msgs": [msg("slack_user", "a")]}
+        store["t1"] = history
+        history["hedge_switch"] = True
+        store["t1"] = history
+        self.assertIs(ThreadStore(backend=self.backend)["t1"]["hedge_switch"], True)
+
+        history["hedge_switch"] = False
+        history["msgs"].append(msg("geppetto", "b"))
+        store["t1"] = history
+        self.assertEqual(ThreadStore(backend=self.backend)["t1"], history)
+
+    def test_databases_without_hedge_switch_are_migrated(self):
+        path = os.path.join(self.tmp_dir.name, "old.db")
+        conn = sqlite3.connect(path)
+        conn.executescript(
+            "CREATE TABLE threads (thread_id TEXT PRIMARY KEY, llm TEXT NOT NULL);"
+            "INSERT INTO threads VALUES ('t1', 'LlmA');"
+        )
+        conn.close()
+        backend = SQLiteHistoryBackend(path, flush_interval=0.01)
+        try:
+            self.assertEqual(backend.load("t1"), {"llm": "LlmA", "msgs": []})
+            backend.replace("t1", "LlmA", [], hedge_switch=True)
+            self.assertIs(backend.load("t1")["hedge_switch"], True)
+        finally:
+            backend.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import asyncio
+import socket
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import httpx
+
+from geppetto.http_pool import HTTPPool, http_package
+from tests import TestBase, OF
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        self.server.clients.add(self.client_address)
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        self.server.clients.add(self.client_address)
+        body = b"content"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHTTPPool(TestBase):
+    def setUp(self):
+        super().setUp()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+        self.server.clients = set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:%s/" % self.server.server_port
+        self.pool = HTTPPool(http2=False)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        for client in self.pool.clients.values():
+            if isinstance(client, httpx.Client):
+                client.close()
+        super().tearDown()
+
+    def test_prewarmed_connections_are_reused(self):
+        self.assertEqual(self.pool.prewarm(self.url, connections=2), 2)
+        self.assertEqual(len(self.server.clients), 2)
+        self.assertEqual(self.pool.get(self.url), b"content")
+        self.assertEqual(self.pool.get(self.url), b"content")
+        self.assertEqual(len(self.server.clients), 2)
+
+    def test_prewarm_async(self):
+        async def prewarm_and_get():
+            try:
+                opened = await self.pool.prewarm_async(self.url, connections=2)
+                return opened, await self.pool.get_async(self.url)
+            finally:
+                await self.pool.async_client().aclose()
+
+        self.assertEqual(asyncio.run(prewarm_and_get()), (2, b"content"))
+        self.assertEqual(len(self.server.clients), 2)
+
+    def test_prewarm_failures_are_not_raised(self):
+        with socket.socket() as unused:
+            unused.bind(("127.0.0.1", 0))
+            url = "http://127.0.0.1:%s/" % unused.getsockname()[1]
+        self.assertEqual(self.pool.prewarm(url, connections=1), 0)
+
+    def test_settings(self):
+        pool = HTTPPool(max_connections=10, connect_timeout=2, read_timeout=30)
+        client = pool.client()
+        self.assertIs(pool.client("httpx"), client)
+        self.assertEqual(client.timeout.connect, 2)
+        self.assertEqual(client.timeout.read, 30)
+        self.assertEqual(pool._client_args(httpx)["limits"].max_connections, 10)
+        client.close()
+        with patch("geppetto.http_pool.http2_available", return_value=False):
+            self.assertFalse(HTTPPool(http2=True).http2)
+        with patch("geppetto.http_pool.http2_available", return_value=True):
+            pool = HTTPPool(http2=True)
+            self.assertTrue(pool.http2)
+            # HTTP/2 multiplexes the requests on a single connection
+            self.assertEqual(pool._connections(4), 1)
+
+    def test_http_package_of_the_sdks(self):
+        class DefaultHttpxClient(httpx.Client):
+            pass
+
+        self.assertEqual(
+            http_package(OF(DefaultHttpxClient=DefaultHttpxClient)), "httpx"
+        )
+        # SDKs without a default client are built on httpx
+        self.assertEqual(http_package(OF()), "httpx")
+
+
+if __name__ == "__main__":
+    unittest.main()
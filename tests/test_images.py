@@ -0,0 +1,49 @@
+import asyncio
+import unittest
+from io import BytesIO
+from unittest.mock import patch
+
+from PIL import Image
+
+from geppetto.images import image_format, needs_transcoding, transcode
+from geppetto.images import transcode_async
+from tests import TestBase
+
+
+def encoded(pillow_format, mode="RGBA"):
+    output = BytesIO()
+    Image.new(mode, (8, 8), "red").save(output, format=pillow_format)
+    return output.getvalue()
+
+
+class TestImages(TestBase):
+    def test_image_format(self):
+        self.assertEqual(image_format(encoded("PNG")), "png")
+        self.assertEqual(image_format(encoded("JPEG", "RGB")), "jpeg")
+        self.assertEqual(image_format(encoded("WEBP")), "webp")
+        self.assertIsNone(image_format(b"not an image"))
+
+    def test_known_formats_are_passed_through(self):
+        png = encoded("PNG")
+        with patch("geppetto.images.Image") as pillow:
+            self.assertIs(transcode(png, ""), png)
+            self.assertIs(transcode(png, "png"), png)
+            self.assertIs(asyncio.run(transcode_async(png, "")), png)
+        pillow.open.assert_not_called()
+        self.assertFalse(needs_transcoding(png, "png"))
+        self.assertTrue(needs_transcoding(png, "webp"))
+
+    def test_transcoding(self):
+        png = encoded("PNG")
+        self.assertEqual(image_format(transcode(png, "webp", 50)), "webp")
+        # jpeg has no transparency
+        self.assertEqual(image_format(transcode(png, "jpeg", 50)), "jpeg")
+        bmp = encoded("BMP", "RGB")
+        self.assertEqual(image_format(transcode(bmp, "")), "png")
+        self.assertEqual(
+            image_format(asyncio.run(transcode_async(bmp, "webp"))), "webp"
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import logging
+import unittest
+
+from geppetto.metrics import ErrorRateTracker, LatencyTracker, StatsLogger
+from tests import TestBase
+
+
+class TestLatencyTracker(TestBase):
+    def test_percentiles_of_the_latest_calls(self):
+        latencies = LatencyTracker(window=4)
+        for seconds in [10, 1, 2, 3, 4]:
+            latencies.record("LLM", seconds)
+        self.assertEqual(latencies.count("LLM"), 4)
+        self.assertEqual(latencies.percentile("LLM", 50), 2)
+        self.assertEqual(latencies.percentile("LLM", 100), 4)
+        self.assertIsNone(latencies.percentile("LLM", 50, min_samples=5))
+        self.assertIsNone(latencies.percentile("other", 50))
+        self.assertEqual(latencies.stats(), {"LLM": {"count": 4, "p50": 2, "p99": 4}})
+
+
+class TestErrorRateTracker(TestBase):
+    def test_share_of_the_latest_calls_failed(self):
+        errors = ErrorRateTracker(window=4)
+        self.assertEqual(errors.rate("LLM"), 0)
+        for failed in [True, True, False, False, True]:
+            errors.record("LLM", failed)
+        self.assertEqual(errors.rate("LLM"), 0.5)
+        self.assertEqual(errors.stats(), {"LLM": 0.5})
+
+
+class TestStatsLogger(TestBase):
+    def test_stats_are_logged_periodically(self):
+        stats = {"admission": {"depth": 3, "shed": {"full": 1, "late": 0}}}
+        logger = StatsLogger(lambda: stats, interval=0.01)
+        with self.assertLogs(level=logging.INFO) as logs:
+            logger.start()
+            self.addCleanup(logger.stop)
+            for _ in range(500):
+                if logs.output:
+                    break
+                logger.stopped.wait(0.01)
+        self.assertIn('"depth": 3', logs.output[0])
+        self.assertIn('"shed": {"full": 1, "late": 0}', logs.output[0])
+
+    def test_disabled(self):
+        self.assertIsNone(StatsLogger(dict, interval=0).start())
+
+
+if __name__ == "__main__":
+    unittest.main()
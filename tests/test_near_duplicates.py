@@ -0,0 +1,82 @@
+import unittest
+
+from geppetto.near_duplicates import NearDuplicateIndex, first_message_text
+from geppetto.near_duplicates import message_anchors
+from tests import TestBase
+
+OPENAI = ("OpenAI", "gpt-4", "helpful")
+GEMINI = ("Gemini", "gemini-pro", "helpful")
+QUESTION = "How do I reset my password in the admin panel?"
+
+
+class TestNearDuplicateIndex(TestBase):
+    def setUp(self):
+        super().setUp()
+        self.now = 0.0
+        self.index = NearDuplicateIndex(
+            ttl=60, threshold=0.7, max_entries=3, clock=lambda: self.now
+        )
+        self.index.add(OPENAI, QUESTION, "Go to Settings")
+
+    def test_similar_messages_get_the_answer(self):
+        for text in [
+            QUESTION,
+            "<@U123> how can I reset my password in the admin panel",
+            "how do i reset my PASSWORD in the admin panel please",
+        ]:
+            self.assertEqual(self.index.lookup(OPENAI, text), "Go to Settings")
+
+    def test_different_messages_or_llms_miss(self):
+        self.assertIsNone(self.index.lookup(OPENAI, "What's the weather like today?"))
+        self.assertIsNone(self.index.lookup(GEMINI, QUESTION))
+        self.assertIsNone(self.index.lookup(OPENAI, "reset password"))
+        self.assertEqual(self.index.stats()["misses"], 2)
+
+    def test_messages_about_other_names_or_numbers_miss(self):
+        index = NearDuplicateIndex(ttl=60)
+        index.add(OPENAI, "what is the capital of France", "Paris")
+        self.assertIsNone(index.lookup(OPENAI, "what is the capital of Spain"))
+        # at a lower threshold, the names still tell them apart
+        self.index.add(OPENAI, "what is the capital of France", "Paris")
+        self.assertIsNone(self.index.lookup(OPENAI, "what is the capital of Spain"))
+        self.assertIsNone(self.index.lookup(OPENAI, "what is the capital of france"))
+        self.assertEqual(
+            self.index.lookup(OPENAI, "What is the capital of France?"), "Paris"
+        )
+        self.index.add(OPENAI, "show me the sales report of 2023", "report")
+        self.assertIsNone(self.index.lookup(OPENAI, "show me the sales report of 2024"))
+
+    def test_message_anchors(self):
+        self.assertEqual(message_anchors(QUESTION), frozenset())
+        self.assertEqual(
+            message_anchors("Is Lisbon bigger? Porto has 2 MILLION people, I think"),
+            {"lisbon", "2"},
+        )
+
+    def test_answers_expire(self):
+        self.now = 61
+        self.assertIsNone(self.index.lookup(OPENAI, QUESTION))
+        self.assertEqual(self.index.buckets, {})
+
+    def test_evicted_answers_leave_the_buckets(self):
+        for i in range(3):
+            self.index.add(GEMINI, "question number %s about something" % i, str(i))
+        self.assertEqual(len(self.index), 3)
+        self.assertIsNone(self.index.lookup(OPENAI, QUESTION))
+        self.assertEqual(
+            self.index.lookup(GEMINI, "question number 2 about something"), "2"
+        )
+        for bucket in self.index.buckets.values():
+            keys = bucket if isinstance(bucket, set) else {bucket}
+            self.assertTrue(all(key[0] == GEMINI for key in keys))
+
+    def test_first_message_text(self):
+        self.assertEqual(first_message_text([{"role": "user", "content": "hi"}]), "hi")
+        self.assertEqual(first_message_text([{"role": "user", "parts": ["hi"]}]), "hi")
+        self.assertIsNone(
+            first_message_text([{"role": "user", "content": "hi"}] * 2),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,16 @@
+import asyncio
+import base64
 import json
 import os
 import sys
 import logging
+import threading
 import unittest
+from concurrent.futures import Future
+from geppetto.openai_handler import IMAGE_STATUS_MSG, IMAGE_TOOL_OUTPUT
 from geppetto.openai_handler import OpenAIHandler
-from unittest.mock import Mock, patch
+from geppetto.streaming import consume_stream
+from unittest.mock import AsyncMock, Mock, patch
 from tests import TestBase, OF
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -48,34 +54,246 @@ class TestOpenAI(TestBase):
 
     @patch("geppetto.openai_handler.OpenAIHandler.download_image")
     def test_send_image_message(self, mock_download_image):
+        # both images must be generated at once to get through the barrier
+        both_generating = threading.Barrier(2, timeout=5)
+
+        def download_image(url):
+            both_generating.wait()
+            return b"Mocked Image Bytes"
+
+        mock_download_image.side_effect = download_image
+        self.mock_openai().images.generate.return_value = OF(
+            data=[OF(url="https://image")]
+        )
+
+        def tool_call(call_id, name, **arguments):
+            return OF(
+                id=call_id,
+                function=OF(name=name, arguments=json.dumps(arguments)),
+            )
+
+        tool_calls = [
+            tool_call("call_1", "generate_image", prompt="A mountain"),
+            tool_call("call_2", "generate_image", prompt="A lake"),
+            tool_call("call_3", "get_functionalities"),
+        ]
+        self.mock_openai().chat.completions.create.side_effect = [
+            OF(choices=[OF(message=OF(content=None, tool_calls=tool_calls))]),
+            OF(choices=[OF(message=OF(content="Here they are", tool_calls=None))]),
+        ]
+        status_messages = []
+
+        response = self.openai_handler.llm_generate_content(
+            [{"role": "user", "content": "Draw a mountain and a lake"}],
+            lambda *args: status_messages.append(args[-1]),
+        )
+        self.mock_openai().chat.completions.create.side_effect = None
+
+        # the images are generated in the background, and posted after the answer
+        text, *images = response
+        self.assertTrue(text.startswith("Here they are"))
+        self.assertTrue(all(isinstance(image, Future) for image in images))
+        self.assertEqual(
+            [image.result(5) for image in images], [b"Mocked Image Bytes"] * 2
+        )
+        self.assertEqual(status_messages, [IMAGE_STATUS_MSG])
+        messages = self.mock_openai().chat.completions.create.call_args.kwargs[
+            "messages"
+        ]
+        self.assertEqual(
+            [call["id"] for call in messages[-4]["tool_calls"]],
+            ["call_1", "call_2", "call_3"],
+        )
+        self.assertEqual(
+            [(msg["tool_call_id"], msg["content"]) for msg in messages[-3:]],
+            [
+                ("call_1", IMAGE_TOOL_OUTPUT),
+                ("call_2", IMAGE_TOOL_OUTPUT),
+                ("call_3", OpenAIHandler.get_functionalities()),
+            ],
+        )
+
+    @patch("geppetto.openai_handler.OpenAIHandler.download_image")
+    def test_identical_images_are_generated_once(self, mock_download_image):
         mock_download_image.return_value = b"Mocked Image Bytes"
-        mock_tool_call = Mock()
-        mock_tool_call.function.name = "generate_image"
-        mock_tool_call.function.arguments = json.dumps(
-            {"prompt": "Generate an image of a mountain", "size": "1024x1024"}
+        generating = threading.Event()
+        release = threading.Event()
+
+        def generate(**kwargs):
+            generating.set()
+            release.wait(5)
+            return OF(data=[OF(url="https://image")])
+
+        self.mock_openai().images.generate.reset_mock()
+        self.mock_openai().images.generate.side_effect = generate
+        images = []
+        threads = [
+            threading.Thread(
+                target=lambda: images.append(
+                    self.openai_handler.generate_image("a mountain")
+                )
+            )
+            for _ in range(2)
+        ]
+        threads[0].start()
+        generating.wait(5)
+        threads[1].start()
+        while self.openai_handler.image_flights.stats()["coalesced"] < 1:
+            release.wait(0.001)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.mock_openai().images.generate.side_effect = None
+
+        self.assertEqual(images, [b"Mocked Image Bytes"] * 2)
+        self.mock_openai().images.generate.assert_called_once()
+
+    @patch("geppetto.openai_handler.OpenAIHandler.download_image")
+    def test_base64_images_are_passed_through(self, mock_download_image):
+        png = b"\x89PNG\r\n\x1a\nMocked Image Bytes"
+        self.mock_openai().images.generate.return_value = OF(
+            data=[OF(b64_json=base64.b64encode(png).decode(), url=None)]
         )
 
-        mock_chat_completion_response = Mock()
-        mock_chat_completion_response.choices = [
+        self.assertEqual(self.openai_handler.generate_new_image("a mountain"), png)
+        self.assertEqual(
+            self.mock_openai().images.generate.call_args.kwargs["response_format"],
+            "b64_json",
+        )
+        mock_download_image.assert_not_called()
+
+    def test_stream_text_message(self):
+        chunks = [
+            OF(choices=[OF(delta=OF(content=text, tool_calls=None))])
+            for text in ["Mocked ", "streamed ", "response"]
+        ]
+        self.mock_openai().chat.completions.create.return_value = iter(chunks)
+
+        stream = self.openai_handler.llm_generate_content_stream(
+            [{"role": "user", "content": "Hello"}]
+        )
+        deltas = []
+        response = consume_stream(stream, deltas.append)
+
+        self.assertEqual(deltas, ["Mocked ", "streamed ", "response"])
+        self.assertEqual(
+            response.split("\n\n_(Geppetto", 1)[0], "Mocked streamed response"
+        )
+
+    @patch("geppetto.openai_handler.OpenAIHandler.download_image")
+    def test_stream_image_message(self, mock_download_image):
+        mock_download_image.return_value = b"Mocked Image Bytes"
+        self.mock_openai().images.generate.return_value = OF(
+            data=[OF(url="https://image")]
+        )
+        arguments = json.dumps({"prompt": "A mountain", "size": "1024x1024"})
+        chunks = [
             OF(
-                message=OF(
-                    content="Generate an image of a mountain",
-                    tool_calls=[mock_tool_call],
-                )
+                choices=[
+                    OF(
+                        delta=OF(
+                            content=None,
+                            tool_calls=[
+                                OF(
+                                    index=0,
+                                    id="call_1" if i == 0 else None,
+                                    function=OF(
+                                        name="generate_image" if i == 0 else None,
+                                        arguments=arguments[i : i + 10],
+                                    ),
+                                )
+                            ],
+                        )
+                    )
+                ]
             )
+            for i in range(0, len(arguments), 10)
         ]
-        self.mock_openai().chat.completions.create.return_value = (
-            mock_chat_completion_response
+        # text streamed before calling the tool
+        chunks.insert(0, OF(choices=[OF(delta=OF(content="Sure. ", tool_calls=None))]))
+        answer = [OF(choices=[OF(delta=OF(content="Here it is", tool_calls=None))])]
+        self.mock_openai().chat.completions.create.side_effect = [
+            iter(chunks),
+            iter(answer),
+        ]
+
+        deltas = []
+        response = consume_stream(
+            self.openai_handler.llm_generate_content_stream(
+                [{"role": "user", "content": "Draw a mountain"}]
+            ),
+            deltas.append,
+        )
+        self.mock_openai().chat.completions.create.side_effect = None
+        self.assertEqual(deltas, ["Sure. ", "Here it is"])
+        text, image = response
+        self.assertTrue(text.startswith("Sure. Here it is"))
+        self.assertEqual(image.result(5), b"Mocked Image Bytes")
+        tool_call = self.mock_openai().chat.completions.create.call_args.kwargs[
+            "messages"
+        ][-2]["tool_calls"][0]
+        self.assertEqual(tool_call["id"], "call_1")
+        self.assertEqual(tool_call["function"]["arguments"], arguments)
+
+    @patch("geppetto.openai_handler.AsyncOpenAI")
+    def test_send_text_message_async(self, mock_async_openai):
+        mock_chat_completion_response = Mock()
+        mock_chat_completion_response.choices = [
+            OF(message=OF(content="Mocked async ChatGPT Response", tool_calls=[]))
+        ]
+        mock_async_openai().chat.completions.create = AsyncMock(
+            return_value=mock_chat_completion_response
         )
+        self.openai_handler._async_client = None
 
-        user_prompt = [{"role": "user", "content": "Generate an image of a mountain"}]
+        response = asyncio.run(
+            self.openai_handler.llm_generate_content_async(
+                [{"role": "user", "content": "Hello"}]
+            )
+        )
+        main_content = response.split("\n\n_(Geppetto", 1)[0].strip()
+        self.assertEqual(main_content, "Mocked async ChatGPT Response")
 
-        response = self.openai_handler.llm_generate_content(
-            user_prompt, self.my_callback, None
+    @patch("geppetto.openai_handler.AsyncOpenAI")
+    def test_tool_calls_async(self, mock_async_openai):
+        generating = []
+
+        async def generate_image_async(prompt, size="1024x1024"):
+            generating.append(prompt)
+            while len(generating) < 2:
+                await asyncio.sleep(0.001)
+            return prompt.encode()
+
+        tool_calls = [
+            OF(
+                id="call_%s" % prompt,
+                function=OF(
+                    name="generate_image", arguments=json.dumps({"prompt": prompt})
+                ),
+            )
+            for prompt in ("mountain", "lake")
+        ]
+        mock_async_openai().chat.completions.create = AsyncMock(
+            side_effect=[
+                OF(choices=[OF(message=OF(content=None, tool_calls=tool_calls))]),
+                OF(choices=[OF(message=OF(content="Done", tool_calls=None))]),
+            ]
         )
+        self.openai_handler._async_client = None
 
-        # Assuming download_image returns bytes
-        self.assertIsInstance(response, bytes)
+        with patch.object(
+            self.openai_handler, "generate_image_async", generate_image_async
+        ):
+            text, *images = asyncio.run(
+                asyncio.wait_for(
+                    self.openai_handler.llm_generate_content_async(
+                        [{"role": "user", "content": "Draw a mountain and a lake"}]
+                    ),
+                    5,
+                )
+            )
+        self.assertTrue(text.startswith("Done"))
+        self.assertEqual(images, [b"mountain", b"lake"])
 
 
 if __name__ == "__main__":
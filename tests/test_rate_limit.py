@@ -0,0 +1,88 @@
+import asyncio
+import threading
+import unittest
+
+from geppetto.rate_limit import AIMDLimiter, is_throttling_error
+from tests import TestBase, OF
+
+
+class TestAIMDLimiter(TestBase):
+    def setUp(self):
+        super().setUp()
+        self.now = 0.0
+        self.limiter = AIMDLimiter(4, latency_target=10, clock=lambda: self.now)
+
+    def fill(self):
+        return [self.limiter.try_acquire() for _ in range(int(self.limiter.limit))]
+
+    def test_limits_concurrency(self):
+        tokens = self.fill()
+        self.assertIsNone(self.limiter.try_acquire())
+        self.limiter.release(tokens[0])
+        self.assertIsNotNone(self.limiter.try_acquire())
+
+    def test_throttling_halves_the_limit_once_per_round(self):
+        tokens = self.fill()
+        self.limiter.release(tokens[0], throttled=True)
+        self.limiter.release(tokens[1], throttled=True)
+        self.assertEqual(self.limiter.stats()["limit"], 2)
+        self.assertEqual(self.limiter.stats()["throttled"], 2)
+        # calls started after the decrease can decrease it again
+        self.limiter.release(tokens[2])
+        self.limiter.release(tokens[3])
+        self.limiter.release(self.limiter.try_acquire(), throttled=True)
+        self.assertEqual(self.limiter.stats()["limit"], 1)
+
+    def test_limit_grows_back_while_full(self):
+        self.limiter.release(self.limiter.try_acquire(), throttled=True)
+        self.assertEqual(self.limiter.limit, 2)
+        for _ in range(5):
+            for token in self.fill():
+                self.limiter.release(token)
+        self.assertEqual(self.limiter.limit, 4)
+
+    def test_slow_calls_do_not_grow_the_limit(self):
+        self.limiter.release(self.limiter.try_acquire(), throttled=True)
+        tokens = self.fill()
+        self.now = 11
+        for token in tokens:
+            self.limiter.release(token)
+        self.assertEqual(self.limiter.limit, 2)
+
+    def test_acquire_waits_for_a_slot(self):
+        tokens = self.fill()
+        acquired = threading.Event()
+        waiter = threading.Thread(
+            target=lambda: self.limiter.acquire() and acquired.set()
+        )
+        waiter.start()
+        while not self.limiter.stats()["waiting"]:
+            acquired.wait(0.001)
+        self.assertFalse(acquired.is_set())
+        self.limiter.release(tokens[0])
+        waiter.join(5)
+        self.assertTrue(acquired.is_set())
+        self.assertEqual(self.limiter.stats()["in_use"], 4)
+
+    def test_acquire_async(self):
+        tokens = self.fill()
+
+        async def main():
+            waiter = asyncio.create_task(self.limiter.acquire_async(poll_interval=0))
+            await asyncio.sleep(0.01)
+            self.assertEqual(self.limiter.stats()["waiting"], 1)
+            self.limiter.release(tokens[0])
+            return await waiter
+
+        self.assertIsNotNone(asyncio.run(main()))
+        self.assertEqual(self.limiter.stats()["waiting"], 0)
+
+    def test_is_throttling_error(self):
+        self.assertTrue(is_throttling_error(OF(status_code=429)))
+        self.assertTrue(is_throttling_error(OF(code=429)))
+        self.assertFalse(is_throttling_error(OF(status_code=500)))
+        self.assertFalse(is_throttling_error(ValueError()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+
+from geppetto.resilience import CircuitBreaker, RetryPolicy, is_transient_error
+from tests import TestBase
+
+
+class APITimeoutError(Exception):
+    pass
+
+
+class TestCircuitBreaker(TestBase):
+    def setUp(self):
+        super().setUp()
+        self.now = 0.0
+        self.breaker = CircuitBreaker(failures=3, cooldown=10, clock=lambda: self.now)
+
+    def open(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.allow())
+        self.open()
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.stats()["opened"], 1)
+
+    def test_lets_a_single_trial_through_after_the_cooldown(self):
+        self.open()
+        self.now = 10
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        # a failed trial opens it again
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.stats()["state"], "open")
+        self.now = 20
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.stats()["state"], "closed")
+        self.assertTrue(self.breaker.allow())
+
+    def test_replaces_a_lost_trial(self):
+        self.open()
+        self.now = 10
+        self.assertTrue(self.breaker.allow())
+        self.now = 20
+        self.assertTrue(self.breaker.allow())
+
+
+class TestRetries(TestBase):
+    def test_backoff_doubles_up_to_the_max(self):
+        policy = RetryPolicy(base_delay=0.5, max_delay=3, rng=lambda: 1)
+        self.assertEqual([policy.delay(n) for n in range(4)], [0.5, 1, 2, 3])
+        policy.rng = lambda: 0.5
+        self.assertEqual(policy.delay(1), 0.5)
+
+    def test_transient_errors(self):
+        server_error = Exception("internal error")
+        server_error.status_code = 500
+        bad_request = Exception("bad request")
+        bad_request.status_code = 400
+        self.assertTrue(is_transient_error(server_error))
+        self.assertTrue(is_transient_error(APITimeoutError()))
+        self.assertTrue(is_transient_error(ConnectionResetError()))
+        self.assertFalse(is_transient_error(bad_request))
+        self.assertFalse(is_transient_error(ValueError()))
+
+
+if __name__ == "__main__":
+    unittest.main()
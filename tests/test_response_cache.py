@@ -0,0 +1,57 @@
+import unittest
+
+from geppetto.response_cache import ResponseCache, prompt_key
+from tests import TestBase, OF
+
+HANDLER = OF(name="OpenAI", model="gpt-4", personality="helpful")
+
+
+class TestResponseCache(TestBase):
+    def test_prompt_key_is_normalized(self):
+        key = prompt_key(HANDLER, [{"role": "user", "content": "What can you do?"}])
+        self.assertEqual(
+            key,
+            prompt_key(HANDLER, [{"role": "user", "content": " what  can you DO?"}]),
+        )
+        self.assertNotEqual(
+            key,
+            prompt_key(HANDLER, [{"role": "user", "content": "What can't you do?"}]),
+        )
+
+    def test_prompt_key_depends_on_model_and_personality(self):
+        prompt = [{"role": "user", "content": "hi"}]
+        keys = {
+            prompt_key(HANDLER, prompt),
+            prompt_key(OF(name="OpenAI", model="gpt-3", personality="helpful"), prompt),
+            prompt_key(OF(name="OpenAI", model="gpt-4", personality="rude"), prompt),
+        }
+        self.assertEqual(len(keys), 3)
+
+    def test_prompt_key_of_gemini_parts(self):
+        self.assertIsNotNone(prompt_key(HANDLER, [{"role": "user", "parts": ["hi"]}]))
+
+    def test_prompts_with_images_or_tools_are_not_cached(self):
+        image = [{"role": "user", "content": [{"type": "image_url", "image_url": {}}]}]
+        tool = [{"role": "tool", "tool_call_id": "1", "content": "done"}]
+        self.assertIsNone(prompt_key(HANDLER, image))
+        self.assertIsNone(prompt_key(HANDLER, tool))
+
+    def test_only_text_responses_are_stored(self):
+        now = [0.0]
+        cache = ResponseCache(
+            ttl=10, max_entries=10, max_bytes=10, clock=lambda: now[0]
+        )
+        self.assertTrue(cache.store("a", "hello"))
+        self.assertTrue(cache.store("b", ["part 1"]))
+        self.assertFalse(cache.store("c", b"\x89PNG"))
+        self.assertFalse(cache.store(None, "hello"))
+        # over max_bytes: the oldest response is evicted
+        self.assertEqual(cache.stats()["bytes"], 6)
+        self.assertEqual(cache.get("a"), None)
+        now[0] = 11
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual(cache.stats()["misses"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
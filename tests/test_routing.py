@@ -0,0 +1,45 @@
+import unittest
+
+from geppetto.metrics import ErrorRateTracker, LatencyTracker
+from geppetto.routing import IMAGES, REASONING, Router
+from tests import TestBase
+
+LLMS = [
+    ("Fast", frozenset()),
+    ("Strong", frozenset({REASONING})),
+    ("Artist", frozenset({IMAGES, REASONING})),
+]
+
+
+class TestRouter(TestBase):
+    def setUp(self):
+        super().setUp()
+        self.latencies = LatencyTracker()
+        self.errors = ErrorRateTracker()
+        self.router = Router(self.latencies, self.errors, long_prompt_tokens=20)
+        for name, seconds in [("Fast", 1), ("Strong", 3), ("Artist", 5)]:
+            self.latencies.record(name, seconds)
+
+    def test_chit_chat_goes_to_the_fastest(self):
+        self.assertEqual(self.router.route("hi there!", LLMS), "Fast")
+        # unless it keeps failing
+        for failed in [True, True, True, False]:
+            self.errors.record("Fast", failed)
+        self.assertEqual(self.router.route("hi there!", LLMS), "Strong")
+        self.assertEqual(self.router.stats(), {"Fast": 1, "Strong": 1})
+
+    def test_routes_by_the_capabilities_needed(self):
+        long_prompt = "Explain step by step " + "why this happens " * 10
+        self.assertEqual(self.router.needs(long_prompt), {REASONING})
+        self.assertEqual(self.router.route(long_prompt, LLMS), "Strong")
+        self.assertEqual(self.router.route("draw a red cat", LLMS), "Artist")
+        self.assertEqual(self.router.route("Dibujame un gato", LLMS[:2]), "Fast")
+
+    def test_unmeasured_llms_are_tried_first(self):
+        llms = LLMS + [("New", frozenset())]
+        self.assertEqual(self.router.route("hi there!", llms), "New")
+        self.assertIsNone(self.router.route("hi there!", []))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import asyncio
+import threading
+import unittest
+
+from geppetto.singleflight import SingleFlight
+from tests import TestBase
+
+
+class TestSingleFlight(TestBase):
+    def setUp(self):
+        super().setUp()
+        self.flights = SingleFlight()
+        self.release = threading.Event()
+        self.calls = []
+
+    def slow_call(self, result):
+        self.calls.append(result)
+        self.release.wait(5)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def run_concurrently(self, key, result, callers=3):
+        outcomes = []
+
+        def caller():
+            try:
+                outcomes.append(self.flights.do(key, self.slow_call, result))
+            except Exception as e:
+                outcomes.append(e)
+
+        threads = [threading.Thread(target=caller) for _ in range(callers)]
+        for thread in threads:
+            thread.start()
+        while self.flights.stats()["coalesced"] < callers - 1:
+            threading.Event().wait(0.001)
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+        return outcomes
+
+    def test_concurrent_calls_are_coalesced(self):
+        self.assertEqual(self.run_concurrently("k", "result"), ["result"] * 3)
+        self.assertEqual(self.calls, ["result"])
+        self.assertEqual(self.flights.stats(), {"in_flight": 0, "coalesced": 2})
+
+    def test_errors_are_fanned_out(self):
+        error = ValueError("failed")
+        self.assertEqual(self.run_concurrently("k", error), [error] * 3)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_later_calls_run_again(self):
+        self.release.set()
+        self.flights.do("k", self.slow_call, 1)
+        self.flights.do("k", self.slow_call, 2)
+        self.assertEqual(self.calls, [1, 2])
+
+    def test_async_calls_are_coalesced(self):
+        async def call(result):
+            self.calls.append(result)
+            await asyncio.sleep(0.01)
+            return result
+
+        async def main():
+            return await asyncio.gather(
+                self.flights.do_async("k", call, "a"),
+                self.flights.do_async("k", call, "a"),
+                self.flights.do_async("other", call, "b"),
+            )
+
+        self.assertEqual(asyncio.run(main()), ["a", "a", "b"])
+        self.assertEqual(self.calls, ["a", "b"])
+        self.assertEqual(self.flights.async_calls, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
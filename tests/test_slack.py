@@ -1,11 +1,17 @@
 import os
 import sys
 import unittest
+from concurrent.futures import Future
 
 from unittest.mock import patch, ANY
+from geppetto.admission import AdmissionControl
+from geppetto.fairness import SenderLimits
 from geppetto.llm_controller import LLMController
 from tests import TestBase
 from tests.test_open_ai import TEST_PERSONALITY
+from geppetto.resilience import RetryPolicy
+from geppetto.slack_handler import HEDGE_SWITCH_MSGS, LLM_UNAVAILABLE_MSG
+from geppetto.slack_handler import IMAGE_ERROR_MSG, LLM_ERROR_MSG
 from geppetto.slack_handler import SlackHandler
 from geppetto.utils import load_json
 
@@ -46,6 +52,7 @@ class TestSlack(TestBase):
             initialized_test_llm_controller(
                 self.MockLLMHandlerA, self.MockLLMHandlerB, self.MockLLMHandlerC
             ),
+            rate_limits={},
         )
 
     def tearDown(self):
@@ -85,11 +92,127 @@ class TestSlack(TestBase):
 
         self.slack_handler.allowed_users = {"random_users": "*"}
         self.slack_handler.handle_event(body)
+        self.slack_handler.dispatcher.join()
 
         self.MockApp().client.chat_postMessage.assert_called_with(
             channel="test_channel", text=":thought_balloon:", thread_ts="1", mrkdwn=True
         )
 
+    def test_duplicate_events_are_dropped(self):
+        body = {
+            "event_id": "Ev1",
+            "event": {
+                "text": "Test message",
+                "channel": "test_channel",
+                "ts": "1",
+                "user": "disallowed_user_id",
+            },
+        }
+
+        self.slack_handler.handle_event(body)
+        self.slack_handler.handle_event(body)
+
+        self.MockApp().client.chat_postMessage.assert_called_once()
+        self.assertEqual(self.slack_handler.seen_events.stats()["dropped"], 1)
+
+    def test_users_over_their_rate_are_asked_to_slow_down(self):
+        self.slack_handler.allowed_users = {
+            "Test User": {"id": "test_user_id", "weight": 2}
+        }
+        self.slack_handler.sender_limits = SenderLimits(
+            user_limit=(60, 1), channel_limit=(0, 0), clock=lambda: 0
+        )
+        self.assertEqual(self.slack_handler.user_weight("test_user_id"), 2)
+        self.assertEqual(self.slack_handler.user_weight("another_user_id"), 1)
+        self.MockLLMHandlerA().llm_generate_content.return_value = (
+            MOCK_GENERIC_LLM_RESPONSE
+        )
+
+        for ts in ("1", "2", "3"):
+            self.slack_handler.handle_event(
+                {
+                    "event": {
+                        "text": "Test message",
+                        "channel": CHANNEL_ID,
+                        "ts": ts,
+                        "user": "test_user_id",
+                    }
+                }
+            )
+        self.slack_handler.dispatcher.join(5)
+
+        self.assertEqual(self.MockLLMHandlerA().llm_generate_content.call_count, 2)
+        self.MockApp().client.chat_postMessage.assert_any_call(
+            channel=CHANNEL_ID,
+            text=self.slack_handler.bot_default_responses["user"]["slow_down"],
+            thread_ts="3",
+            mrkdwn=True,
+        )
+
+    def test_messages_are_shed_when_busy(self):
+        now = [0]
+        self.slack_handler.allowed_users = {"random_users": "*"}
+        self.slack_handler.admission = AdmissionControl(
+            max_depth=1, max_delay=10, clock=lambda: now[0]
+        )
+        busy = self.slack_handler.bot_default_responses["user"]["busy"]
+        with patch.object(self.slack_handler.dispatcher, "submit") as submit:
+            for ts in ("1", "2"):
+                self.slack_handler.handle_event(
+                    {
+                        "event": {
+                            "text": "Test message",
+                            "channel": CHANNEL_ID,
+                            "ts": ts,
+                            "user": "test_user_id",
+                        }
+                    }
+                )
+        submit.assert_called_once()
+        self.MockApp().client.chat_postMessage.assert_called_once_with(
+            channel=CHANNEL_ID, text=busy, thread_ts="2", mrkdwn=True
+        )
+
+        # the queued message waited too long
+        now[0] = 11
+        _, fn, *args = submit.call_args.args
+        fn(*args)
+        self.MockLLMHandlerA().llm_generate_content.assert_not_called()
+        self.MockApp().client.chat_postMessage.assert_called_with(
+            channel=CHANNEL_ID, text=busy, thread_ts="1", mrkdwn=True
+        )
+        self.assertEqual(
+            self.slack_handler.stats()["admission"],
+            {"depth": 0, "admitted": 1, "shed": {"full": 1, "late": 1}},
+        )
+        self.assertIn("limiters", self.slack_handler.stats()["llms"])
+
+    def test_summaries_are_applied_in_the_lane_of_the_message(self):
+        self.MockLLMHandlerA().llm_generate_content.return_value = (
+            MOCK_GENERIC_LLM_RESPONSE
+        )
+        with patch.object(self.slack_handler.summarizer, "submit") as submit:
+            self.slack_handler.handle_message("hello", CHANNEL_ID, THREAD_ID, lane="dm")
+        schedule = submit.call_args.args[2]
+        self.assertEqual(schedule.keywords, {"lane": "dm"})
+
+    def test_messages_are_classified_in_lanes(self):
+        def lane(text, channel=CHANNEL_ID, **event):
+            event.update(text=text, channel=channel, ts=THREAD_ID)
+            return self.slack_handler.message_lane({"event": event})
+
+        self.assertEqual(lane("<@U123> llms"), "command")
+        self.assertEqual(lane("draw a cat", channel="D123"), "image")
+        self.assertEqual(lane("hello", channel="D123"), "dm")
+        self.assertEqual(lane("hello", channel_type="im"), "dm")
+        self.assertEqual(lane("<@U123> hello"), "mention")
+        self.assertEqual(lane("a long question " * 1000), "long")
+        self.slack_handler.thread_messages[THREAD_ID] = {
+            "msgs": [{"role": "slack_user", "content": "x" * 20000}],
+            "llm": "",
+        }
+        self.assertEqual(lane("hello", channel="D123"), "long")
+
     def test_handle_message(self):
         self.MockLLMHandlerA().llm_generate_content.return_value = (
             MOCK_GENERIC_LLM_RESPONSE
@@ -122,6 +245,88 @@ class TestSlack(TestBase):
             ts=ANY,
         )
 
+    def test_handle_message_fails_over(self):
+        self.slack_handler.llm_ctrl.retry_policy = RetryPolicy(max_retries=0)
+        self.MockLLMHandlerA().llm_generate_content.side_effect = TimeoutError()
+        self.MockLLMHandlerB().llm_generate_content.return_value = (
+            MOCK_GENERIC_LLM_RESPONSE_B
+        )
+
+        self.slack_handler.handle_message("Test message", CHANNEL_ID, THREAD_ID)
+
+        self.MockApp().client.chat_update.assert_called_with(
+            channel=CHANNEL_ID,
+            text=MOCK_GENERIC_LLM_RESPONSE_B,
+            thread_ts=THREAD_ID,
+            ts=ANY,
+        )
+
+        # no LLM can answer
+        self.MockLLMHandlerB().llm_generate_content.side_effect = TimeoutError()
+        self.MockLLMHandlerC().llm_generate_content.side_effect = TimeoutError()
+
+        self.slack_handler.handle_message("Test message", CHANNEL_ID, THREAD_ID)
+
+        self.MockApp().client.chat_update.assert_called_with(
+            channel=CHANNEL_ID,
+            text=LLM_UNAVAILABLE_MSG,
+            thread_ts=THREAD_ID,
+            ts=ANY,
+        )
+
+        # a request rejected by the API isn't failed over
+        bad_request = Exception("bad request")
+        bad_request.status_code = 400
+        self.MockLLMHandlerB().llm_generate_content.side_effect = bad_request
+
+        self.slack_handler.handle_message("Test message", CHANNEL_ID, THREAD_ID)
+
+        self.MockApp().client.chat_update.assert_called_with(
+            channel=CHANNEL_ID,
+            text=LLM_ERROR_MSG,
+            thread_ts=THREAD_ID,
+            ts=ANY,
+        )
+
+    def test_hedge_switch_command(self):
+        self.slack_handler.handle_message("hedge_switch_on", CHANNEL_ID, THREAD_ID)
+        thread_history = self.slack_handler.thread_messages[THREAD_ID]
+        switch_llm = self.slack_handler.hedge_switcher(thread_history)
+        switch_llm("LLMb")
+        self.assertEqual(thread_history["llm"], "LLMb")
+
+        self.slack_handler.handle_message("hedge_switch_off", CHANNEL_ID, THREAD_ID)
+        self.assertIsNone(self.slack_handler.hedge_switcher(thread_history))
+        self.MockApp().client.chat_postMessage.assert_called_with(
+            channel=CHANNEL_ID,
+            text=HEDGE_SWITCH_MSGS[False],
+            thread_ts=THREAD_ID,
+            mrkdwn=True,
+        )
+
+    def test_handle_message_streaming(self):
+        def stream(prompt, *args):
+            yield "Mock "
+            yield "text response"
+            return MOCK_GENERIC_LLM_RESPONSE
+
+        self.MockLLMHandlerA().llm_generate_content_stream.side_effect = stream
+        self.slack_handler.stream_responses = True
+
+        self.slack_handler.handle_message("Test message", CHANNEL_ID, THREAD_ID)
+
+        self.MockLLMHandlerA().llm_generate_content.assert_not_called()
+        self.assertIn(
+            {"role": "geppetto", "content": MOCK_GENERIC_LLM_RESPONSE},
+            self.slack_handler.thread_messages[THREAD_ID]["msgs"],
+        )
+        self.MockApp().client.chat_update.assert_called_with(
+            channel=CHANNEL_ID,
+            text=MOCK_GENERIC_LLM_RESPONSE,
+            thread_ts=THREAD_ID,
+            ts=ANY,
+        )
+
     def test_handle_message_switch_simple(self):
 
         # Case A: DEFAULT LLM A
@@ -245,6 +450,12 @@ class TestSlack(TestBase):
             1,
         )
 
+        # the cached prompts of the thread are dropped
+        self.MockLLMHandlerA().forget_thread.assert_called_once_with(THREAD_ID)
+        args, kwargs = self.MockLLMHandlerC().get_prompt_from_thread.call_args
+        self.assertIs(args[0], self.slack_handler.thread_messages[THREAD_ID]["msgs"])
+        self.assertEqual(kwargs, {"thread_id": THREAD_ID})
+
     def test_handle_message_switch_different_thread(self):
         thread_id_i = "test_thread_id_i"
         thread_id_ii = "test_thread_id_ii"
@@ -363,6 +574,75 @@ class TestSlack(TestBase):
             title="Image",
         )
 
+    def test_background_images_are_posted_when_done(self):
+        image = Future()
+        self.MockLLMHandlerA().llm_generate_content.return_value = image
+        self.slack_handler.handle_message("Draw a cat", CHANNEL_ID, THREAD_ID)
+        self.MockApp().client.files_upload_v2.assert_not_called()
+
+        image.set_result(b"Mock byte response")
+        self.slack_handler.dispatcher.join(5)
+        self.MockApp().client.files_upload_v2.assert_called_once_with(
+            channel=CHANNEL_ID,
+            thread_ts=THREAD_ID,
+            content=b"Mock byte response",
+            title="Image",
+        )
+
+        # images generated along with an answer
+        image = Future()
+        self.MockLLMHandlerA().llm_generate_content.return_value = [
+            MOCK_GENERIC_LLM_RESPONSE,
+            image,
+        ]
+        self.slack_handler.handle_message("Draw a bird", CHANNEL_ID, THREAD_ID)
+        self.MockApp().client.chat_postMessage.assert_called_with(
+            channel=CHANNEL_ID,
+            text=MOCK_GENERIC_LLM_RESPONSE,
+            thread_ts=THREAD_ID,
+            mrkdwn=True,
+        )
+        image.set_result(b"Mock bird")
+        self.slack_handler.dispatcher.join(5)
+        self.assertEqual(
+            self.MockApp().client.files_upload_v2.call_args.kwargs["content"],
+            b"Mock bird",
+        )
+        # the text of the answer is kept for the next turns
+        self.assertIn(
+            {"role": "geppetto", "content": MOCK_GENERIC_LLM_RESPONSE},
+            self.slack_handler.thread_messages[THREAD_ID]["msgs"],
+        )
+
+        failed = Future()
+        self.MockLLMHandlerA().llm_generate_content.return_value = failed
+        self.slack_handler.handle_message("Draw a dog", CHANNEL_ID, THREAD_ID)
+        failed.set_exception(TimeoutError())
+        self.slack_handler.dispatcher.join(5)
+        self.MockApp().client.chat_update.assert_called_with(
+            channel=CHANNEL_ID,
+            text=LLM_UNAVAILABLE_MSG,
+            thread_ts=THREAD_ID,
+            ts=ANY,
+        )
+
+        # the handlers return None when the image couldn't be generated
+        failed = Future()
+        self.MockLLMHandlerA().llm_generate_content.return_value = failed
+        self.slack_handler.handle_message("Draw a fox", CHANNEL_ID, THREAD_ID)
+        failed.set_result(None)
+        self.slack_handler.dispatcher.join(5)
+        self.MockApp().client.chat_update.assert_called_with(
+            channel=CHANNEL_ID,
+            text=IMAGE_ERROR_MSG,
+            thread_ts=THREAD_ID,
+            ts=ANY,
+        )
+        self.assertEqual(
+            self.slack_handler.thread_messages[THREAD_ID]["msgs"][-1]["content"],
+            IMAGE_ERROR_MSG,
+        )
+
     def test_select_llm_from_msg(self):
         message_a = "llm_llma Test message"
         message_b = "Test llm_llmb message"
@@ -389,6 +669,19 @@ class TestSlack(TestBase):
             self.slack_handler.select_llm_from_msg(message_default_wrong), "LlmA"
         )
 
+    def test_select_llm_from_msg_routing(self):
+        llm_ctrl = self.slack_handler.llm_ctrl
+        llm_ctrl.router.enabled = True
+        for name, seconds in [("LlmA", 3), ("LLMb", 1), ("LLMC", 2)]:
+            llm_ctrl.latencies.record(name, seconds)
+
+        self.assertEqual(self.slack_handler.select_llm_from_msg("Hello"), "LLMb")
+        # tags and the LLM of the thread win
+        self.assertEqual(
+            self.slack_handler.select_llm_from_msg("llm_llmc Hello"), "LLMC"
+        )
+        self.assertEqual(self.slack_handler.select_llm_from_msg("Hi", "LlmA"), "LlmA")
+
     def test_handle_command(self):
         mock_list_llms_response = ["Here are the available AI models!"]
         assistants = self.slack_handler.llm_ctrl.list_llms()
@@ -0,0 +1,115 @@
+import threading
+import time
+import unittest
+
+from unittest.mock import Mock
+from slack_sdk.errors import SlackApiError
+from geppetto.rate_limit import TokenBucket
+from geppetto.slack_outbox import SlackOutbox
+from tests import TestBase, OF
+
+
+def rate_limited_error(retry_after):
+    return SlackApiError(
+        "ratelimited", OF(status_code=429, headers={"Retry-After": str(retry_after)})
+    )
+
+
+class TestTokenBucket(TestBase):
+    def test_burst_and_refill(self):
+        now = [0.0]
+        bucket = TokenBucket(rate=2, capacity=3, clock=lambda: now[0])
+        self.assertTrue(all(bucket.try_acquire() for _ in range(3)))
+        self.assertFalse(bucket.try_acquire())
+        now[0] = 0.5
+        self.assertTrue(bucket.try_acquire())
+        self.assertEqual(bucket.reserve(), 0.5)
+
+
+class TestSlackOutbox(TestBase):
+    def setUp(self):
+        super().setUp()
+        self.client = Mock()
+        self.sleeps = []
+        self.outbox = SlackOutbox(
+            self.client,
+            rate_limits={"chat_postMessage": (60, 2)},
+            max_retries=2,
+            jitter=0,
+            sleep=self.sleeps.append,
+        )
+
+    def test_calls_are_delegated(self):
+        self.client.chat_postMessage.return_value = {"ok": True}
+        response = self.outbox.chat_postMessage(channel="C1", text="hi")
+        self.assertEqual(response, {"ok": True})
+        self.client.chat_postMessage.assert_called_once_with(channel="C1", text="hi")
+        self.assertEqual(self.sleeps, [])
+
+    def test_rate_limit_per_channel(self):
+        for _ in range(3):
+            self.outbox.chat_postMessage(channel="C1", text="hi")
+        self.outbox.chat_postMessage(channel="C2", text="hi")
+        self.assertEqual(len(self.sleeps), 1)
+        self.assertAlmostEqual(self.sleeps[0], 1, places=2)
+
+    def test_retry_after(self):
+        self.client.files_upload_v2.side_effect = [rate_limited_error(7), {"ok": True}]
+        response = self.outbox.files_upload_v2(channel="C1", content=b"")
+        self.assertEqual(response, {"ok": True})
+        self.assertEqual(self.sleeps, [7])
+        self.assertEqual(self.outbox.stats()["retries"], 1)
+
+    def test_gives_up_after_max_retries(self):
+        self.client.chat_update.side_effect = rate_limited_error(1)
+        self.assertRaises(
+            SlackApiError, self.outbox.chat_update, channel="C1", ts="1", text="hi"
+        )
+        self.assertEqual(self.client.chat_update.call_count, 3)
+        self.assertEqual(self.outbox.pending_updates, {})
+
+    def test_updates_of_the_same_message_are_merged(self):
+        sending = threading.Event()
+        release = threading.Event()
+        sent = []
+
+        def chat_update(**kwargs):
+            sent.append(kwargs["text"])
+            if len(sent) == 1:
+                sending.set()
+                release.wait(5)
+            return {"ok": True, "text": kwargs["text"]}
+
+        self.client.chat_update.side_effect = chat_update
+        results = []
+        leader = threading.Thread(
+            target=lambda: results.append(
+                self.outbox.chat_update(channel="C1", ts="1", text="a")
+            )
+        )
+        leader.start()
+        sending.wait(5)
+        riders = [
+            threading.Thread(
+                target=lambda text=text: results.append(
+                    self.outbox.chat_update(channel="C1", ts="1", text=text)
+                )
+            )
+            for text in ["b", "c"]
+        ]
+        for rider in riders:
+            rider.start()
+        while self.outbox.stats()["merged_updates"] < 2:
+            time.sleep(0.001)
+        release.set()
+        for thread in [leader, *riders]:
+            thread.join(5)
+
+        # only the newest of the merged texts is sent after the first one
+        self.assertEqual(len(sent), 2)
+        self.assertIn(sent[1], ["b", "c"])
+        self.assertEqual(results, [{"ok": True, "text": sent[1]}] * 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
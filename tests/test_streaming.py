@@ -0,0 +1,63 @@
+import unittest
+
+from geppetto.streaming import STREAMING_SUFFIX, StreamedMessage, consume_stream
+from tests import TestBase
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestStreamedMessage(TestBase):
+    def setUp(self):
+        super().setUp()
+        self.clock = FakeClock()
+        self.updates = []
+        self.message = StreamedMessage(
+            self.updates.append, interval_ms=1000, min_chars=5, clock=self.clock
+        )
+
+    def test_updates_are_rate_limited(self):
+        for i in range(10):
+            self.clock.now = i * 0.1
+            self.message.push("hello ")
+        self.assertEqual(self.updates, [])
+
+        self.clock.now = 1.0
+        self.message.push("world")
+        self.assertEqual(self.updates, ["hello " * 10 + "world" + STREAMING_SUFFIX])
+
+    def test_updates_wait_for_new_characters(self):
+        self.clock.now = 1.0
+        self.message.push("hi")
+        self.assertEqual(self.updates, [])
+        self.message.push(" there")
+        self.assertEqual(len(self.updates), 1)
+
+    def test_update_errors_are_ignored(self):
+        def failing_update(text):
+            raise RuntimeError("ratelimited")
+
+        message = StreamedMessage(failing_update, 0, 1, clock=self.clock)
+        message.push("hello")
+        self.assertEqual(message.updates, 1)
+
+
+class TestConsumeStream(TestBase):
+    def test_returns_the_final_response(self):
+        def stream():
+            yield "a"
+            yield "b"
+            return "formatted ab"
+
+        deltas = []
+        self.assertEqual(consume_stream(stream(), deltas.append), "formatted ab")
+        self.assertEqual(deltas, ["a", "b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+
+from unittest.mock import Mock
+from geppetto.summarizer import SUMMARY_INTRO, Summarizer
+from geppetto.thread_store import ThreadStore
+from tests import TestBase
+
+FOOTER = "\n\n_(Geppetto v0.2.4 Source: Mock Model)_"
+
+
+def run_now(key, fn, *args):
+    return fn(*args)
+
+
+def long_thread(turns):
+    msgs = []
+    for i in range(turns):
+        msgs.append({"role": "slack_user", "content": "question %s" % i})
+        msgs.append({"role": "geppetto", "content": "answer %s%s" % (i, FOOTER)})
+    return {"llm": "LlmA", "msgs": msgs}
+
+
+class TestSummarizer(TestBase):
+    def setUp(self):
+        super().setUp()
+        self.llm_ctrl = Mock()
+        self.generate = self.llm_ctrl.generate_text
+        self.generate.return_value = "the summary" + FOOTER
+        self.store = ThreadStore(backend=None)
+        self.summarizer = Summarizer(
+            self.llm_ctrl,
+            self.store,
+            "geppetto",
+            "slack_user",
+            after_messages=6,
+            keep_messages=3,
+            workers=0,
+        )
+
+    def test_short_threads_are_kept(self):
+        self.store["t1"] = history = long_thread(3)
+        self.assertIsNone(self.summarizer.submit("t1", history, run_now))
+        self.generate.assert_not_called()
+
+    def test_old_messages_are_summarized(self):
+        self.store["t1"] = history = long_thread(4)
+        recent = history["msgs"][-4:]
+        self.summarizer.submit("t1", history, run_now)
+
+        # the summary is prepended to the first kept message, a user message
+        self.assertEqual(
+            self.store["t1"]["msgs"],
+            [
+                {
+                    "role": "slack_user",
+                    "content": SUMMARY_INTRO + "the summary\n\nquestion 2",
+                },
+                *recent[1:],
+            ],
+        )
+        llm, prompt, assistant_tag, user_tag = self.generate.call_args.args
+        self.assertEqual(
+            (llm, assistant_tag, user_tag), ("LlmA", "geppetto", "slack_user")
+        )
+        self.assertIn("User: question 0", prompt[0]["content"])
+        self.assertIn("Assistant: answer 0\n", prompt[0]["content"])
+        self.assertNotIn("Geppetto v", prompt[0]["content"])
+        self.llm_ctrl.forget_thread.assert_called_once_with("t1")
+        self.assertEqual(self.summarizer.pending, set())
+
+    def test_summary_is_dropped_if_thread_was_reset(self):
+        self.store["t1"] = history = long_thread(4)
+        started = self.summarizer.start("t1", history)
+        history["msgs"] = [history["msgs"][0], {"role": "slack_user", "content": "hi"}]
+        self.assertFalse(self.summarizer.apply("t1", started[1], "the summary"))
+        self.assertEqual(len(self.store["t1"]["msgs"]), 2)
+        self.assertEqual(self.summarizer.pending, set())
+
+    def test_failed_summaries_are_ignored(self):
+        self.generate.side_effect = Exception("unavailable")
+        self.store["t1"] = history = long_thread(4)
+        self.summarizer.submit("t1", history, run_now)
+        self.assertEqual(len(self.store["t1"]["msgs"]), 8)
+        self.assertEqual(self.summarizer.pending, set())
+
+    def test_summaries_that_are_not_text_are_ignored(self):
+        self.generate.return_value = [b"image", {"image": "data"}]
+        self.store["t1"] = history = long_thread(4)
+        self.summarizer.submit("t1", history, run_now)
+        self.assertEqual(len(self.store["t1"]["msgs"]), 8)
+        self.assertEqual(self.summarizer.pending, set())
+
+    def test_threads_are_released_if_the_summary_cant_be_applied(self):
+        def failing_schedule(key, fn, *args):
+            raise RuntimeError("shut down")
+
+        self.store["t1"] = history = long_thread(4)
+        future = self.summarizer.submit("t1", history, failing_schedule)
+        self.assertIsInstance(future.exception(), RuntimeError)
+        self.assertEqual(self.summarizer.pending, set())
+
+
+if __name__ == "__main__":
+    unittest.main()
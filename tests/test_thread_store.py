@@ -0,0 +1,91 @@
+import unittest
+
+from geppetto.cache import EVICTED_CAPACITY, EVICTED_EXPIRED
+from geppetto.thread_store import ThreadStore
+from tests import TestBase
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def thread(*contents, llm="LlmA"):
+    return {
+        "llm": llm,
+        "msgs": [{"role": "slack_user", "content": c} for c in contents],
+    }
+
+
+class TestThreadStore(TestBase):
+    def setUp(self):
+        super().setUp()
+        self.clock = FakeClock()
+
+    def test_dict_like_access(self):
+        store = ThreadStore(clock=self.clock)
+        store["t1"] = thread("hello")
+        self.assertIn("t1", store)
+        self.assertEqual(store["t1"]["msgs"][0]["content"], "hello")
+        self.assertEqual(store.get("t2", {"llm": "", "msgs": []})["msgs"], [])
+        self.assertRaises(KeyError, store.__getitem__, "t2")
+
+    def test_lru_eviction_by_thread_count(self):
+        store = ThreadStore(max_threads=2, clock=self.clock)
+        store["t1"] = thread("a")
+        store["t2"] = thread("b")
+        store.get("t1")  # t2 becomes the least recently used
+        store["t3"] = thread("c")
+        self.assertIn("t1", store)
+        self.assertNotIn("t2", store)
+        self.assertEqual(store.stats()["evictions"][EVICTED_CAPACITY], 1)
+
+    def test_evictions_are_notified(self):
+        evicted = []
+        store = ThreadStore(max_threads=1, on_evict=evicted.append, clock=self.clock)
+        store["t1"] = thread("a")
+        store.rewrite("t1", thread("b"))
+        self.assertEqual(evicted, [])
+        store["t2"] = thread("c")
+        self.assertEqual(evicted, ["t1"])
+
+    def test_eviction_by_total_messages(self):
+        store = ThreadStore(max_messages=4, clock=self.clock)
+        store["t1"] = thread("a", "b")
+        store["t2"] = thread("c", "d")
+        history = store["t2"]
+        history["msgs"].append({"role": "geppetto", "content": "e"})
+        store["t2"] = history
+        self.assertNotIn("t1", store)
+        self.assertEqual(store.stats()["messages"], 3)
+
+    def test_eviction_by_bytes(self):
+        store = ThreadStore(max_bytes=10, clock=self.clock)
+        store["t1"] = thread("12345")
+        store["t2"] = thread("1234567")
+        self.assertNotIn("t1", store)
+        self.assertEqual(store.stats()["bytes"], 7)
+
+    def test_newest_thread_is_kept_over_the_limits(self):
+        store = ThreadStore(max_bytes=2, clock=self.clock)
+        store["t1"] = thread("a long message")
+        self.assertIn("t1", store)
+
+    def test_idle_ttl(self):
+        store = ThreadStore(idle_ttl=60, clock=self.clock)
+        store["t1"] = thread("a")
+        store["t2"] = thread("b")
+        self.clock.now = 50
+        store.get("t1")  # refreshes t1
+        self.clock.now = 100
+        self.assertIn("t1", store)
+        self.assertNotIn("t2", store)
+        self.assertEqual(store.stats()["evictions"][EVICTED_EXPIRED], 1)
+        self.assertEqual(store.stats()["messages"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+from geppetto.tokens import estimate_tokens, fit_to_budget, message_tokens
+from tests import TestBase
+
+
+def msgs(*roles):
+    return [{"role": role, "content": str(i)} for i, role in enumerate(roles)]
+
+
+class TestTokens(TestBase):
+    def test_estimate_tokens(self):
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("Hello, world!"), 4)
+        self.assertEqual(estimate_tokens("internationalization"), 4)
+        self.assertEqual(estimate_tokens(["Hello", "world"]), 2)
+        self.assertEqual(estimate_tokens(None), 0)
+        self.assertEqual(message_tokens({"role": "user", "content": "Hi"}), 5)
+
+    def test_fit_to_budget_keeps_everything_that_fits(self):
+        prompt = msgs("user", "assistant", "user", "assistant", "user")
+        self.assertEqual(fit_to_budget(prompt, [1] * 5, 5, "user"), prompt)
+        self.assertEqual(fit_to_budget(prompt, [10] * 5, 0, "user"), prompt)
+
+    def test_fit_to_budget_keeps_first_and_newest_turns(self):
+        prompt = msgs("user", "assistant", "user", "assistant", "user")
+        self.assertEqual(
+            fit_to_budget(prompt, [1] * 5, 3, "user"),
+            [prompt[0], prompt[4]],
+        )
+        self.assertEqual(
+            fit_to_budget(prompt, [1] * 5, 4, "user"),
+            [prompt[0], prompt[2], prompt[3], prompt[4]],
+        )
+
+    def test_fit_to_budget_always_keeps_last_message(self):
+        prompt = msgs("user", "assistant", "user")
+        self.assertEqual(
+            fit_to_budget(prompt, [1, 1, 100], 10, "user"), [prompt[0], prompt[2]]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
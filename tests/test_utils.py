@@ -0,0 +1,24 @@
+import json
+import sys
+import unittest
+
+from geppetto.utils import LazyImport
+from tests import TestBase
+
+
+class TestLazyImport(TestBase):
+    def test_imports_on_first_use(self):
+        module = "geppetto.tests_lazy_import_absent"
+        lazy = LazyImport(module)
+        self.assertNotIn(module, sys.modules)
+        with self.assertRaises(ModuleNotFoundError):
+            lazy.anything
+
+    def test_uses_the_imported_object(self):
+        dumps = LazyImport("json", "dumps")
+        self.assertEqual(dumps([1]), json.dumps([1]))
+        self.assertIs(LazyImport("json").loads, json.loads)
+
+
+if __name__ == "__main__":
+    unittest.main()